@@ -15,12 +15,22 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database.manager import db_manager
 from services.order_service import order_service
+from services.ledger_service import LedgerService
 from config.settings import OrderStatus
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("Test")
 
+async def check_ledger(step: str) -> bool:
+    """الأرصدة المادية تطابق مجموع القيود، ومجموع السجل صفر"""
+    report = await LedgerService.verify()
+    if report['ok']:
+        print(f"✅ Ledger verified after {step} ({report['accounts_checked']} accounts).")
+        return True
+    print(f"❌ Ledger drift after {step}:\n{LedgerService.format_report(report)}")
+    return False
+
 async def run_test():
     print("\n🚀 Starting Comprehensive Lifecycle Test...")
     
@@ -68,6 +78,8 @@ async def run_test():
         else:
             print(f"❌ Deposit failed. Result: {new_balance}")
             return
+        if not await check_ledger("deposit"):
+            return
 
         # 5. Test Purchase (Create Order)
         print("⏳ Testing Purchase...")
@@ -87,6 +99,8 @@ async def run_test():
         else:
             print(f"❌ Purchase failed: {msg}")
             return
+        if not await check_ledger("purchase"):
+            return
 
         # 6. Test Order Finalization (Success)
         print("⏳ Testing Order Finalization (Success)...")
@@ -135,6 +149,46 @@ async def run_test():
         else:
             print(f"❌ Order failure/refund process failed: {msg}")
             return
+        if not await check_ledger("refund"):
+            return
+
+        # 7b. Test Order State Machine (no double refund)
+        print("\n🔁 Testing Order State Machine...")
+        balance_before = (await db_manager.get_user(test_user_id))['balance']
+
+        success, msg = await order_service.change_status(order_id2, OrderStatus.FAILED, admin_id=12345)
+        if success:
+            print("❌ Duplicate FAILED transition was accepted!")
+            return
+        success, msg = await order_service.change_status(order_id, OrderStatus.CANCELED, admin_id=12345)
+        if success:
+            print("❌ Illegal COMPLETED -> CANCELED transition was accepted!")
+            return
+        balance_after = (await db_manager.get_user(test_user_id))['balance']
+        if balance_after != balance_before:
+            print(f"❌ Rejected transitions changed the balance! {balance_before} -> {balance_after}")
+            return
+        print("✅ Duplicate and illegal transitions rejected without refund.")
+
+        success, msg, order_id4 = await order_service.create_order(
+            user_id=test_user_id,
+            product_id=1,
+            player_id="PLAYER_RACE",
+            payment_method_id=None
+        )
+        if not success:
+            print(f"❌ Race order creation failed: {msg}")
+            return
+        # موظفان يلغيان نفس الطلب في نفس اللحظة: انتقال واحد واسترداد واحد فقط
+        results = await asyncio.gather(
+            order_service.change_status(order_id4, OrderStatus.CANCELED, admin_id=12345),
+            order_service.change_status(order_id4, OrderStatus.CANCELED, admin_id=12345)
+        )
+        balance_after = (await db_manager.get_user(test_user_id))['balance']
+        if sum(1 for ok, _ in results if ok) != 1 or balance_after != balance_before:
+            print(f"❌ Concurrent cancel mismatch! Results: {results}, balance {balance_before} -> {balance_after}")
+            return
+        print("✅ Concurrent cancel applied once with a single refund.")
 
         # 8. Test Coupon System
         print("\n🎟️ Testing Coupon System...")
@@ -173,6 +227,47 @@ async def run_test():
             print(f"❌ Order with coupon failed: {msg}")
             return
 
+        # 9. Test Coupon Limits (atomic redemption)
+        print("\n🎟️ Testing Coupon Limits...")
+        await order_service.finalize_order(order_id=order_id3, status=OrderStatus.COMPLETED, admin_id=12345)
+
+        coupon_id = await db_manager.create_coupon("ONEPERUSER", "FIXED", 1, max_uses=10, per_user_limit=1)
+        first = await db_manager.use_coupon("ONEPERUSER", test_user_id, None, 1.0)
+        second = await db_manager.use_coupon("ONEPERUSER", test_user_id, None, 1.0)
+        coupon = await db_manager.get_coupon_by_id(coupon_id)
+        if first and not second and coupon['used_count'] == 1:
+            print("✅ Redemption past per_user_limit rejected.")
+        else:
+            print(f"❌ per_user_limit not enforced! first={first}, second={second}, used={coupon['used_count']}")
+            return
+
+        coupon_id = await db_manager.create_coupon("LASTONE", "PERCENTAGE", 50, max_uses=1, min_amount=5, per_user_limit=None)
+        is_valid, msg, discount = await db_manager.validate_coupon("LASTONE", test_user_id, 10.0)
+        # استهلاك آخر استخدام مباشرة دون المرور بالذاكرة المؤقتة (كطلب من عملية أخرى)،
+        # فيبقى الفحص المسبق ناجحاً ويجب أن يرفض الحجز الذري ويلغي الطلب كاملاً
+        async with db.execute("UPDATE coupons SET used_count = max_uses WHERE id = ?", (coupon_id,)): pass
+        await db.commit()
+        async with db.execute("SELECT COUNT(*) FROM orders WHERE user_id = ?", (test_user_id,)) as cursor:
+            orders_before = (await cursor.fetchone())[0]
+        balance_before = (await db_manager.get_user(test_user_id))['balance']
+
+        success, msg, _ = await order_service.create_order(
+            user_id=test_user_id,
+            product_id=1,
+            player_id="PLAYER_LASTONE",
+            payment_method_id=None,
+            coupon_code="LASTONE"
+        )
+        async with db.execute("SELECT COUNT(*) FROM orders WHERE user_id = ?", (test_user_id,)) as cursor:
+            orders_after = (await cursor.fetchone())[0]
+        balance_after = (await db_manager.get_user(test_user_id))['balance']
+        if is_valid and not success and orders_after == orders_before and balance_after == balance_before:
+            print(f"✅ Redemption past max_uses rejected; order and balance rolled back ({msg}).")
+        else:
+            print(f"❌ max_uses rollback failed! valid={is_valid}, success={success}, "
+                  f"orders {orders_before} -> {orders_after}, balance {balance_before} -> {balance_after}")
+            return
+
         print("\n✨ ALL TESTS PASSED 100%! ✨")
     
     except Exception as e:
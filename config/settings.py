@@ -15,6 +15,25 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = str(BASE_DIR / "store_v2.db")
 DATABASE_PATH = DB_PATH # Alias for compatibility
 
+# إعدادات التسجيل (Logging)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text, json
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # تدوير حسب الحجم
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # تدوير زمني (مثلاً: midnight) بدلاً من الحجم
+LOG_DEBUG_SAMPLE_RATE = int(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))  # 1 من كل N رسالة DEBUG
+
+# إعدادات الإشعارات
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "10"))  # أقصى عدد إرسال متزامن
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", "15"))  # بالثواني
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+NOTIFY_DIGEST_WINDOW = int(os.getenv("NOTIFY_DIGEST_WINDOW", "30"))  # بالثواني، 0 لتعطيل التجميع
+NOTIFY_DIGEST_MAX_LINES = int(os.getenv("NOTIFY_DIGEST_MAX_LINES", "15"))
+LEDGER_VERIFY_INTERVAL = int(os.getenv("LEDGER_VERIFY_INTERVAL", "3600"))  # بالثواني، 0 لتعطيل الفحص الدوري
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "10"))  # عدد الأزرار في كل صفحة من الأقسام/المنتجات
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))  # بالثواني، مدة احتفاظ تيليجرام بنتائج الوضع المضمن
+
 # إعدادات API (Item4Gamer)
 ITEM4GAMER_API_KEY = os.getenv("ITEM4GAMER_API_KEY")
 ITEM4GAMER_BASE_URL = "https://item4gamer.com/wp-json/reseller/v1"
@@ -43,6 +62,18 @@ class OrderStatus:
     FAILED = "FAILED"
     CANCELED = "CANCELED"
 
+# الانتقالات المسموحة بين حالات الطلب (الحالات النهائية ليس لها انتقالات)
+ORDER_TRANSITIONS = {
+    OrderStatus.NEW: {OrderStatus.PENDING_PAYMENT, OrderStatus.PAID, OrderStatus.PENDING_REVIEW, OrderStatus.CANCELED},
+    OrderStatus.PENDING_PAYMENT: {OrderStatus.PAID, OrderStatus.FAILED, OrderStatus.CANCELED},
+    OrderStatus.PENDING_REVIEW: {OrderStatus.PAID, OrderStatus.FAILED, OrderStatus.CANCELED},
+    OrderStatus.PAID: {OrderStatus.IN_PROGRESS, OrderStatus.COMPLETED, OrderStatus.FAILED, OrderStatus.CANCELED},
+    OrderStatus.IN_PROGRESS: {OrderStatus.COMPLETED, OrderStatus.FAILED, OrderStatus.CANCELED},
+    OrderStatus.COMPLETED: set(),
+    OrderStatus.FAILED: set(),
+    OrderStatus.CANCELED: set(),
+}
+
 # أنواع المنتجات
 class ProductType:
     AUTOMATIC = "AUTOMATIC"
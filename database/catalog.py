@@ -0,0 +1,82 @@
+"""
+Catalog Snapshot - نسخة ثابتة من الأقسام والمنتجات في الذاكرة
+- تُبنى عند بدء التشغيل وتُستبدل كاملة بعد كل تعديل على الكتالوج
+- تصفح المتجر (الأقسام، منتجات القسم، تفاصيل المنتج) بدون أي استعلام
+- النسخة لا تُعدل أبداً؛ القارئ الذي يحمل نسخة قديمة يراها متسقة حتى النهاية
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.arabic import normalize_arabic
+
+
+class CatalogSnapshot:
+    """الأقسام والمنتجات مع سعر الصرف؛ يملكها DatabaseManager (لا تعدل القواميس المعادة)"""
+
+    __slots__ = ("version", "dollar_rate", "categories", "all_categories",
+                 "_products_by_category", "_all_products_by_category", "_products_by_id", "_search_index")
+
+    def __init__(self, version: int, dollar_rate: int, categories: Iterable[Dict[str, Any]],
+                 products: Iterable[Dict[str, Any]]):
+        self.version = version
+        self.dollar_rate = dollar_rate
+        # كل الأقسام (للوحة الإدارة) والنشطة منها (للمتجر)
+        self.all_categories: Tuple[Dict[str, Any], ...] = tuple(categories)
+        self.categories: Tuple[Dict[str, Any], ...] = tuple(c for c in self.all_categories if c['is_active'])
+        active: Dict[int, list] = {}
+        everything: Dict[int, list] = {}
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for product in products:
+            everything.setdefault(product['category_id'], []).append(product)
+            if product['is_active']:
+                active.setdefault(product['category_id'], []).append(product)
+                by_id[product['id']] = product
+        # صفوف ثابتة لكل قسم: عدد الصفحات وشريحة أي صفحة بدون استعلام
+        self._products_by_category = {cat_id: tuple(items) for cat_id, items in active.items()}
+        self._all_products_by_category = {cat_id: tuple(items) for cat_id, items in everything.items()}
+        self._products_by_id = by_id
+        # (" اسم ", " اسم وصف ", المنتج) بنص موحد؛ يأتي جاهزاً من products_fts عند توفره
+        self._search_index = []
+        for product in by_id.values():
+            name = product.get('search_name')
+            if name is None:
+                name = normalize_arabic(product['name'])
+            description = product.get('search_description')
+            if description is None:
+                description = normalize_arabic(product['description'])
+            self._search_index.append((f" {name} ", f" {name} {description} ", product))
+
+    def products(self, category_id: int, include_inactive: bool = False) -> Tuple[Dict[str, Any], ...]:
+        source = self._all_products_by_category if include_inactive else self._products_by_category
+        return source.get(category_id, ())
+
+    def product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        """منتج نشط بالمعرف"""
+        return self._products_by_id.get(product_id)
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """
+        بحث في الذاكرة بين المنتجات النشطة (كل كلمة يجب أن تكون بداية كلمة في الاسم أو الوصف)
+        النتائج المطابقة بالاسم أولاً؛ الاستعلام الفارغ يعيد كل المنتجات النشطة
+        """
+        words = [f" {word}" for word in normalize_arabic(query).split()]
+        if not words:
+            return [entry[2] for entry in self._search_index]
+        in_name, in_description = [], []
+        for name, text, product in self._search_index:
+            if all(word in text for word in words):
+                (in_name if all(word in name for word in words) else in_description).append(product)
+        return in_name + in_description
+
+    def with_rate(self, version: int, dollar_rate: int) -> "CatalogSnapshot":
+        """نسخة جديدة بسعر صرف مختلف تشارك نفس بيانات الكتالوج"""
+        snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+        snapshot.version = version
+        snapshot.dollar_rate = dollar_rate
+        snapshot.categories = self.categories
+        snapshot.all_categories = self.all_categories
+        snapshot._products_by_category = self._products_by_category
+        snapshot._all_products_by_category = self._all_products_by_category
+        snapshot._products_by_id = self._products_by_id
+        snapshot._search_index = self._search_index
+        return snapshot
@@ -0,0 +1,118 @@
+"""
+Coupon Cache - تخزين مؤقت لأكواد الكوبونات
+- فلتر Bloom لجميع الأكواد الموجودة: الكود غير الموجود يُرفض دون أي استعلام
+- تخزين النتائج السلبية مؤقتاً (حماية من تخمين الأكواد)
+- تخزين الكوبونات الموجودة لفترة قصيرة
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def normalize_code(code: str) -> str:
+    return code.strip().upper()
+
+
+class BloomFilter:
+    """فلتر Bloom بسيط: لا يعطي نتيجة سلبية خاطئة أبداً، والإيجابية الخاطئة نادرة (~1%)"""
+
+    def __init__(self, capacity: int, bits_per_item: int = 10, hashes: int = 7):
+        self.capacity = max(capacity, 1024)
+        self.size = self.capacity * bits_per_item
+        self.hashes = hashes
+        self.count = 0
+        self._bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class CouponCache:
+    """ذاكرة الكوبونات؛ يملكها DatabaseManager ويُحدّثها عند كل تعديل على جدول الكوبونات"""
+
+    POSITIVE_TTL = 60
+    NEGATIVE_TTL = 300
+    MAX_ENTRIES = 10000
+
+    def __init__(self):
+        self.bloom: Optional[BloomFilter] = None
+        # يزداد مع كل إضافة؛ يمنع تثبيت فلتر بُني من قائمة أكواد أقدم من الإضافة
+        self.generation = 0
+        self._positive: "OrderedDict[str, tuple]" = OrderedDict()
+        self._negative: "OrderedDict[str, float]" = OrderedDict()
+
+    def build_bloom(self, codes: Iterable[str], count: int, generation: int):
+        if generation != self.generation:
+            return
+        bloom = BloomFilter(capacity=count * 2)
+        for code in codes:
+            bloom.add(code)
+        self.bloom = bloom
+
+    def might_exist(self, code: str) -> bool:
+        return self.bloom is None or code in self.bloom
+
+    def get(self, code: str):
+        """
+        Returns:
+            (hit: bool, coupon: dict|None)
+        """
+        now = time.monotonic()
+        expires = self._negative.get(code)
+        if expires is not None:
+            if expires > now:
+                return True, None
+            del self._negative[code]
+        entry = self._positive.get(code)
+        if entry is not None:
+            if entry[0] > now:
+                return True, entry[1]
+            del self._positive[code]
+        return False, None
+
+    def put(self, code: str, coupon: Optional[Dict[str, Any]]):
+        now = time.monotonic()
+        if coupon is None:
+            self._negative[code] = now + self.NEGATIVE_TTL
+            self._negative.move_to_end(code)
+            if len(self._negative) > self.MAX_ENTRIES:
+                self._negative.popitem(last=False)
+        else:
+            self._positive[code] = (now + self.POSITIVE_TTL, coupon)
+            self._positive.move_to_end(code)
+            if len(self._positive) > self.MAX_ENTRIES:
+                self._positive.popitem(last=False)
+
+    def added(self, codes: Iterable[str]):
+        """كوبونات جديدة: إضافتها للفلتر وإزالة أي نتيجة سلبية مخزنة لها"""
+        self.generation += 1
+        for code in codes:
+            self._negative.pop(code, None)
+            self._positive.pop(code, None)
+            if self.bloom is not None:
+                self.bloom.add(code)
+        if self.bloom is not None and self.bloom.count > self.bloom.capacity:
+            # تجاوز السعة يرفع نسبة الإيجابية الخاطئة؛ يُعاد البناء عند أول بحث
+            self.bloom = None
+
+    def invalidate(self, code: str = None):
+        """إلغاء كوبون معدل (أو الكل)؛ الفلتر لا يحتاج تعديلاً لأن الحذف يبقيه إيجابياً فقط"""
+        if code is None:
+            self._positive.clear()
+            self._negative.clear()
+        else:
+            self._positive.pop(code, None)
@@ -7,6 +7,10 @@ Database Manager - Ultimate Stable Edition
 
 import aiosqlite
 import asyncio
+import math
+import time
+import uuid
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import logging
@@ -15,16 +19,33 @@ logger = logging.getLogger(__name__)
 
 try:
     from .models import *
+    from .coupon_cache import CouponCache, normalize_code
+    from .catalog import CatalogSnapshot
 except ImportError:
     from database.models import *
+    from database.coupon_cache import CouponCache, normalize_code
+    from database.catalog import CatalogSnapshot
+from utils.money import Money, CURRENCY_SYP
+from utils.arabic import normalize_arabic, fts_prefix_query
 
-from config.settings import DB_PATH, OrderStatus
+from config.settings import DB_PATH, OrderStatus, ORDER_TRANSITIONS
 
 class DatabaseManager:
+    # أقصى عدد تطابقات يُرتب منها البحث عن المستخدمين
+    USER_SEARCH_CANDIDATES = 1000
+    # مدة صلاحية عدد المستخدمين المخزن لقوائم الترقيم (ثوانٍ)
+    USER_COUNT_TTL = 300
+
     def __init__(self, db_path: str):
         self.db_path = db_path
         self._db = None
         self._lock = asyncio.Lock()
+        self._settings_cache: Optional[Dict[str, str]] = None
+        self._coupon_cache = CouponCache()
+        self._catalog: Optional[CatalogSnapshot] = None
+        self._catalog_version = 0
+        # filter_blocked -> (وقت الانتهاء، العدد)
+        self._user_counts: Dict[bool, tuple] = {}
         
     async def connect(self):
         if self._db is None:
@@ -35,6 +56,8 @@ class DatabaseManager:
                     await self._db.execute("PRAGMA journal_mode=WAL")
                     await self._db.execute("PRAGMA foreign_keys=ON")
                     await self._db.execute("PRAGMA synchronous=NORMAL")
+                    # مطلوبة لمشغلات فهرس البحث (products_fts)
+                    await self._db.create_function("ar_normalize", 1, normalize_arabic, deterministic=True)
         return self._db
 
     async def init_db(self):
@@ -57,11 +80,33 @@ class DatabaseManager:
             await db.execute(CREATE_BROADCAST_HISTORY_TABLE)
             await db.execute(CREATE_RATE_LIMITS_TABLE)
             await db.execute(CREATE_ADMIN_SESSIONS_TABLE)
+            await db.execute(CREATE_NOTIFICATION_OUTBOX_TABLE)
+            await db.execute(CREATE_STAFF_CLAIMS_TABLE)
+            await db.execute(CREATE_STAFF_MESSAGES_TABLE)
+            await db.execute(CREATE_IDEMPOTENCY_KEYS_TABLE)
+            await db.execute(CREATE_DEPOSIT_REQUESTS_TABLE)
+            await db.execute(CREATE_LEDGER_ENTRIES_TABLE)
+            for trigger in CREATE_LEDGER_TRIGGERS:
+                await db.execute(trigger)
+            await db.execute(CREATE_ACCOUNT_BALANCES_TABLE)
             
             # Add indexes
             await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_financial_logs_user_id ON financial_logs(user_id)")
+            # فهارس سجل العمليات (rowid مضمّن ضمنياً في كل فهرس، لذا تخدم ترقيم id < ?)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_admin ON audit_logs(admin_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_action ON audit_logs(action)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_target ON audit_logs(target_type)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_created ON audit_logs(created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, next_attempt_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_staff_messages_item ON staff_messages(item_type, item_key)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_status ON deposit_requests(status, created_at)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_user ON deposit_requests(user_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_ledger_account ON ledger_entries(account, amount_minor)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_ledger_txn ON ledger_entries(txn_id)")
+            await db.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', '-7 days')")
             
             # Add missing columns
             try: await db.execute("ALTER TABLE users ADD COLUMN first_name TEXT")
@@ -72,12 +117,100 @@ class DatabaseManager:
             except: pass
             try: await db.execute("ALTER TABLE payment_methods ADD COLUMN deleted_at DATETIME DEFAULT NULL")
             except: pass
+            try: await db.execute("ALTER TABLE coupons ADD COLUMN per_user_limit INTEGER DEFAULT 1")
+            except: pass
+            try: await db.execute("ALTER TABLE coupons ADD COLUMN batch_id TEXT")
+            except: pass
+            for column in ("photo", "item_type", "item_key"):
+                try: await db.execute(f"ALTER TABLE notification_outbox ADD COLUMN {column} TEXT")
+                except: pass
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_coupons_batch ON coupons(batch_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_coupon_usage_coupon_user ON coupon_usage(coupon_id, user_id)")
+            for table, column, source in MONEY_COLUMNS:
+                await self._add_money_column(db, table, column, source)
+            for trigger in CREATE_PRODUCT_PRICE_TRIGGERS:
+                await db.execute(trigger)
+            await db.execute(CREATE_PRODUCTS_FTS_TABLE)
+            for trigger in CREATE_PRODUCTS_FTS_TRIGGERS:
+                await db.execute(trigger)
+            await self._rebuild_products_fts(db)
+            await db.execute(CREATE_USERS_FTS_TABLE)
+            for trigger in CREATE_USERS_FTS_TRIGGERS:
+                await db.execute(trigger)
+            await self._rebuild_users_fts(db)
+            # بحث المعرفات القصيرة (أقل من 3 أحرف) بالبادئة عبر LIKE
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE)")
+            # ترقيم قوائم المستخدمين بالمؤشر (الأحدث أولاً)؛ فهرس المحظورين جزئي صغير
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at, id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_users_blocked_created ON users(created_at, id) WHERE is_blocked = 1")
             
             # Default settings
             for key, val in DEFAULT_SETTINGS:
                 await db.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, val))
             
+            await self._migrate_ledger(db)
+            
             await db.commit()
+            self._settings_cache = None
+            await self._reload_catalog(db)
+
+    async def _add_money_column(self, db, table: str, column: str, source: str):
+        """إضافة عمود سنتات صحيح وتحويل القيم العشرية الموجودة مرة واحدة"""
+        try: await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        except: return
+        await db.execute(f"UPDATE {table} SET {column} = CAST(ROUND({source} * 100) AS INTEGER) WHERE {source} IS NOT NULL")
+
+    async def _rebuild_products_fts(self, db, force: bool = False):
+        """بناء فهرس البحث من جدول المنتجات (عند أول تشغيل أو إذا اختلف عدد الصفوف)"""
+        if not force:
+            async with db.execute("""
+                SELECT (SELECT COUNT(*) FROM products) AS products, (SELECT COUNT(*) FROM products_fts_docsize) AS indexed
+            """) as cursor:
+                row = await cursor.fetchone()
+            if row['products'] == row['indexed']:
+                return
+        await db.execute("DELETE FROM products_fts")
+        await db.execute("""
+            INSERT INTO products_fts (rowid, name, description)
+            SELECT id, ar_normalize(name), ar_normalize(description) FROM products
+        """)
+
+    async def _rebuild_users_fts(self, db):
+        """بناء فهرس بحث المستخدمين (عند أول تشغيل أو إذا اختلف عدد الصفوف)"""
+        # جدول الظل _docsize صف لكل مستند: عدّه من B-tree بدل مسح فهرس FTS5 كاملاً عند كل تشغيل
+        async with db.execute("""
+            SELECT (SELECT COUNT(*) FROM users) AS users, (SELECT COUNT(*) FROM users_fts_docsize) AS indexed
+        """) as cursor:
+            row = await cursor.fetchone()
+        if row['users'] == row['indexed']:
+            return
+        await db.execute("DELETE FROM users_fts")
+        await db.execute("""
+            INSERT INTO users_fts (rowid, username, first_name, last_name)
+            SELECT id, username, first_name, last_name FROM users
+        """)
+
+    async def _migrate_ledger(self, db):
+        """ترحيل الأرصدة الحالية كقيود افتتاحية عند أول تشغيل للسجل المحاسبي"""
+        async with db.execute("SELECT 1 FROM ledger_entries LIMIT 1") as cursor:
+            if await cursor.fetchone():
+                return
+        await db.execute("""
+            INSERT INTO ledger_entries (txn_id, account, amount_minor, type, user_id, reason)
+            SELECT 'opening-' || telegram_id, 'user:' || telegram_id, CAST(ROUND(balance * 100) AS INTEGER),
+                   'OPENING', telegram_id, 'رصيد افتتاحي'
+            FROM users WHERE CAST(ROUND(balance * 100) AS INTEGER) != 0
+        """)
+        await db.execute("""
+            INSERT INTO ledger_entries (txn_id, account, amount_minor, type, user_id, reason)
+            SELECT txn_id, 'system:opening', -amount_minor, type, user_id, reason
+            FROM ledger_entries WHERE type = 'OPENING'
+        """)
+        await db.execute("DELETE FROM account_balances")
+        await db.execute("""
+            INSERT INTO account_balances (account, balance_minor)
+            SELECT account, SUM(amount_minor) FROM ledger_entries GROUP BY account
+        """)
 
     async def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         db = await self.connect()
@@ -85,38 +218,263 @@ class DatabaseManager:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
-    async def create_user(self, telegram_id: int, username: str, first_name: str = None, last_name: str = None, role: str = 'USER', language: str = None):
+    async def create_user(self, telegram_id: int, username: str, first_name: str = None, last_name: str = None, role: str = 'USER', language: str = None) -> bool:
+        """إنشاء المستخدم إن لم يكن موجوداً؛ True إذا أُضيف صف جديد"""
         db = await self.connect()
         async with self._lock:
-            await db.execute(
+            cursor = await db.execute(
                 "INSERT OR IGNORE INTO users (telegram_id, username, first_name, last_name, role, language) VALUES (?, ?, ?, ?, ?, ?)",
                 (telegram_id, username, first_name, last_name, role, language)
             )
             await db.commit()
+            created = cursor.rowcount > 0
+            if created and False in self._user_counts:
+                expires, count = self._user_counts[False]
+                self._user_counts[False] = (expires, count + 1)
+            return created
+
+    async def set_user_blocked(self, telegram_id: int, is_blocked: bool):
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("UPDATE users SET is_blocked = ? WHERE telegram_id = ?", (int(is_blocked), telegram_id))
+            await db.commit()
+        self._user_counts.pop(True, None)
+
+    async def _count_users(self, db, filter_blocked: bool) -> int:
+        """عدد المستخدمين من الذاكرة (تقدير يُحدّث كل USER_COUNT_TTL) بدل COUNT(*) مع كل صفحة"""
+        cached = self._user_counts.get(filter_blocked)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        sql = "SELECT COUNT(*) AS count FROM users"
+        if filter_blocked:
+            sql += " WHERE is_blocked = 1"
+        async with db.execute(sql) as cursor:
+            count = (await cursor.fetchone())['count']
+        self._user_counts[filter_blocked] = (time.monotonic() + self.USER_COUNT_TTL, count)
+        return count
 
-    async def update_user_balance(self, user_id: int, amount: float, log_type: str, reason: str = None, admin_id: int = None, order_id: int = None) -> tuple[bool, Any]:
+    async def get_users_paginated(self, page: int = 1, per_page: int = 10, filter_blocked: bool = False,
+                                  after_id: int = None, before_id: int = None) -> Dict[str, Any]:
+        """
+        صفحة من المستخدمين (الأحدث أولاً) بترقيم المؤشر على (created_at, id)
+        
+        Args:
+            after_id: id آخر مستخدم في الصفحة السابقة (الصفحة التالية)
+            before_id: id أول مستخدم في الصفحة اللاحقة (الرجوع للخلف)
+            بدونهما تُقرأ الصفحة page بـ OFFSET (الصفحة الأولى فقط في الاستخدام العادي)
+        
+        Returns:
+            {'users', 'page', 'total', 'total_pages', 'has_next'}؛ total تقدير مخزن مؤقتاً
+        """
+        db = await self.connect()
+        page = max(1, page)
+        # شرط ثابت (وليس معاملاً) ليختار المخطط الفهرس الجزئي
+        where = ["is_blocked = 1"] if filter_blocked else []
+        params: list = []
+        cursor_id = after_id if after_id is not None else before_id
+        if cursor_id is not None:
+            op = "<" if after_id is not None else ">"
+            where.append(f"(created_at, id) {op} (SELECT created_at, id FROM users WHERE id = ?)")
+            params.append(cursor_id)
+        sql = "SELECT * FROM users"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # للخلف: الأقدم أولاً ثم عكس الترتيب
+        sql += " ORDER BY created_at DESC, id DESC" if before_id is None else " ORDER BY created_at, id"
+        sql += " LIMIT ?"
+        params.append(per_page + 1)
+        if cursor_id is None and page > 1:
+            sql += " OFFSET ?"
+            params.append((page - 1) * per_page)
+        async with db.execute(sql, params) as cursor:
+            users = [dict(row) for row in await cursor.fetchall()]
+        if before_id is None:
+            has_next = len(users) > per_page
+            users = users[:per_page]
+        else:
+            has_next = True
+            users = users[:per_page][::-1]
+
+        total = await self._count_users(db, filter_blocked)
+        total_pages = max(1, math.ceil(total / per_page), page + 1 if has_next else page)
+        return {'users': users, 'page': page, 'total': total, 'total_pages': total_pages, 'has_next': has_next}
+
+    async def search_users(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        بحث المشرفين عن المستخدمين مرتب حسب الصلة
+        
+        - رقم مطابق لـ telegram_id يعيد المستخدم مباشرة
+        - المعرف المطابق تماماً (بدون @ وبدون حالة الأحرف) أولاً
+        - 3 أحرف فأكثر: أي جزء من المعرف أو الاسم عبر فهرس trigram (المعرف أثقل من الاسم)
+        - أقل من ذلك: المعرفات التي تبدأ بالنص
+        """
+        query = query.strip().lstrip("@").strip()
+        if not query:
+            return []
+        db = await self.connect()
+        if query.isdigit():
+            user = await self.get_user(int(query))
+            if user:
+                return [user]
+        async with db.execute("SELECT * FROM users WHERE username = ? COLLATE NOCASE", (query,)) as cursor:
+            users = [dict(row) for row in await cursor.fetchall()]
+        if len(query) >= 3:
+            # عبارة واحدة بين علامتي تنصيص: رموز FTS5 في نص المشرف تُعامل كنص عادي.
+            # الترتيب يتم داخل أول USER_SEARCH_CANDIDATES تطابقاً فقط: كلمة شائعة تطابق
+            # عشرات الآلاف وحساب bm25 لها كلها يتجاوز زمن البحث المقبول
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = """
+                SELECT u.* FROM (
+                    SELECT rowid, bm25(users_fts, 10.0, 3.0, 1.0) AS score
+                    FROM users_fts WHERE users_fts MATCH ? LIMIT ?
+                ) f
+                JOIN users u ON u.id = f.rowid
+                ORDER BY f.score LIMIT ?
+            """
+            params = (phrase, self.USER_SEARCH_CANDIDATES, limit + len(users))
+        else:
+            pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            sql = "SELECT * FROM users WHERE username LIKE ? ESCAPE '\\' ORDER BY username COLLATE NOCASE LIMIT ?"
+            params = (pattern, limit + len(users))
+        exact_ids = {user['id'] for user in users}
+        async with db.execute(sql, params) as cursor:
+            users += [dict(row) for row in await cursor.fetchall() if row['id'] not in exact_ids]
+        return users[:limit]
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        وحدة عمل: جميع الكتابات داخل الكتلة تُثبت مرة واحدة أو تُلغى معاً
+        
+        الاستخدام:
+            async with db_manager.transaction() as tx:
+                await tx.execute(...)
+        
+        داخل الكتلة يجب استخدام الدوال الداخلية التي تستقبل الاتصال (_apply_balance_change ...)
+        وليس الدوال العامة التي تحجز القفل بنفسها.
+        """
         db = await self.connect()
         async with self._lock:
+            await db.execute("BEGIN IMMEDIATE")
             try:
-                async with db.execute("SELECT balance FROM users WHERE telegram_id = ?", (user_id,)) as cursor:
-                    user = await cursor.fetchone()
-                    if not user: return False, "User not found"
-                    
-                    balance_before = user['balance']
-                    balance_after = balance_before + amount
-                    if balance_after < 0: return False, "Insufficient balance"
-                    
-                    await db.execute("UPDATE users SET balance = ? WHERE telegram_id = ?", (balance_after, user_id))
-                    await db.execute("""
-                        INSERT INTO financial_logs (user_id, order_id, type, amount, balance_before, balance_after, admin_id, reason)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (user_id, order_id, log_type, amount, balance_before, balance_after, admin_id, reason))
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
+            else:
+                await db.commit()
+
+    async def _post_ledger(self, db, user_id: int, amount_minor: int, log_type: str, reason: str = None,
+                           admin_id: int = None, order_id: int = None):
+        """قيد مزدوج: حساب المستخدم مقابل حساب النظام، مع تحديث الأرصدة المادية في نفس المعاملة"""
+        txn_id = uuid.uuid4().hex
+        user_account = f"user:{user_id}"
+        counter_account = LEDGER_COUNTER_ACCOUNTS.get(log_type, f"system:{log_type.lower()}")
+        await db.executemany("""
+            INSERT INTO ledger_entries (txn_id, account, amount_minor, type, user_id, order_id, admin_id, reason)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (txn_id, user_account, amount_minor, log_type, user_id, order_id, admin_id, reason),
+            (txn_id, counter_account, -amount_minor, log_type, user_id, order_id, admin_id, reason),
+        ])
+        await db.executemany("""
+            INSERT INTO account_balances (account, balance_minor) VALUES (?, ?)
+            ON CONFLICT(account) DO UPDATE SET
+                balance_minor = balance_minor + excluded.balance_minor,
+                updated_at = CURRENT_TIMESTAMP
+        """, [(user_account, amount_minor), (counter_account, -amount_minor)])
+
+    async def _apply_balance_change(self, db, user_id: int, amount, log_type: str, reason: str = None, admin_id: int = None, order_id: int = None) -> tuple[bool, Any]:
+        """تعديل الرصيد عبر السجل المحاسبي وتسجيله في السجل المالي دون commit (يُستدعى تحت القفل)"""
+        async with db.execute("""
+            SELECT COALESCE(a.balance_minor, 0) AS balance_minor
+            FROM users u LEFT JOIN account_balances a ON a.account = 'user:' || u.telegram_id
+            WHERE u.telegram_id = ?
+        """, (user_id,)) as cursor:
+            user = await cursor.fetchone()
+        if not user: return False, "User not found"
+        
+        amount_minor = amount.minor if isinstance(amount, Money) else Money.of(amount).minor
+        balance_before = user['balance_minor']
+        balance_after = balance_before + amount_minor
+        if balance_after < 0: return False, "Insufficient balance"
+        
+        await self._post_ledger(db, user_id, amount_minor, log_type, reason, admin_id, order_id)
+        # users.balance نسخة للعرض متزامنة مع الرصيد المادي
+        await db.execute("UPDATE users SET balance = ? WHERE telegram_id = ?", (balance_after / 100, user_id))
+        await db.execute("""
+            INSERT INTO financial_logs (user_id, order_id, type, amount, balance_before, balance_after, admin_id, reason)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, order_id, log_type, amount_minor / 100, balance_before / 100, balance_after / 100, admin_id, reason))
+        return True, balance_after / 100
+
+    async def update_user_balance(self, user_id: int, amount, log_type: str, reason: str = None, admin_id: int = None, order_id: int = None) -> tuple[bool, Any]:
+        db = await self.connect()
+        async with self._lock:
+            try:
+                success, result = await self._apply_balance_change(db, user_id, amount, log_type, reason, admin_id, order_id)
+                if success:
                     await db.commit()
-                    return True, balance_after
+                return success, result
             except Exception as e:
                 await db.rollback()
                 return False, str(e)
 
+    async def _reload_catalog(self, db):
+        """بناء نسخة كتالوج جديدة واستبدالها دفعة واحدة (يُستدعى تحت القفل بعد commit)"""
+        async with db.execute("SELECT * FROM categories ORDER BY id") as cursor:
+            categories = [dict(row) for row in await cursor.fetchall()]
+        # النص الموحد للبحث محسوب مسبقاً في فهرس products_fts
+        async with db.execute("""
+            SELECT p.*, f.name AS search_name, f.description AS search_description
+            FROM products p LEFT JOIN products_fts f ON f.rowid = p.id
+            ORDER BY p.id
+        """) as cursor:
+            products = [dict(row) for row in await cursor.fetchall()]
+        async with db.execute("SELECT value FROM settings WHERE key = 'dollar_rate'") as cursor:
+            row = await cursor.fetchone()
+        self._catalog_version += 1
+        self._catalog = CatalogSnapshot(self._catalog_version, int(float(row['value'])) if row else 12500, categories, products)
+
+    async def get_catalog(self) -> CatalogSnapshot:
+        """النسخة الحالية من الكتالوج (التصفح يتم منها دون استعلامات)"""
+        if self._catalog is None:
+            db = await self.connect()
+            async with self._lock:
+                if self._catalog is None:
+                    await self._reload_catalog(db)
+        return self._catalog
+
+    async def search_products(self, query: str, limit: int = 20, only_active: bool = True) -> List[Dict[str, Any]]:
+        """
+        بحث نصي في أسماء المنتجات ووصفها (FTS5) مرتب حسب الصلة
+        
+        الكلمات تُوحد (التشكيل، الألف، الياء، التاء المربوطة) وكل كلمة تطابق كبادئة،
+        والتطابق في الاسم أثقل من الوصف.
+        """
+        match = fts_prefix_query(query)
+        if not match:
+            return []
+        db = await self.connect()
+        sql = """
+            SELECT p.* FROM products_fts f
+            JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ?
+        """
+        if only_active:
+            sql += " AND p.is_active = 1"
+        sql += " ORDER BY bm25(products_fts, 10.0, 1.0) LIMIT ?"
+        async with db.execute(sql, (match, limit)) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def add_category(self, name: str) -> int:
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+            await db.commit()
+            await self._reload_catalog(db)
+            return cursor.lastrowid
+
     async def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
         db = await self.connect()
         async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
@@ -142,34 +500,117 @@ class DatabaseManager:
         async with db.execute(query) as cursor:
             return [dict(row) for row in await cursor.fetchall()]
 
-    async def create_order(self, user_id: int, product_id: int, player_id: str, price_usd: float, price_local: float, exchange_rate: float, status: str = OrderStatus.NEW) -> int:
+    async def add_product(self, category_id: int, name: str, description: str, price_usd, provider_id: int = None,
+                          variation_id: str = None, type: str = 'MANUAL') -> int:
+        price = price_usd if isinstance(price_usd, Money) else Money.of(price_usd)
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("""
+                INSERT INTO products (category_id, provider_id, name, description, price_usd, price_minor, type, variation_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (category_id, provider_id, name, description, price.amount, price.minor, type, variation_id))
+            await db.commit()
+            await self._reload_catalog(db)
+            return cursor.lastrowid
+
+    async def update_product_price(self, product_id: int, price_usd) -> bool:
+        price = price_usd if isinstance(price_usd, Money) else Money.of(price_usd)
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute(
+                "UPDATE products SET price_usd = ?, price_minor = ? WHERE id = ?",
+                (price.amount, price.minor, product_id)
+            )
+            await db.commit()
+            await self._reload_catalog(db)
+            return cursor.rowcount > 0
+
+    # الأعمدة المسموح تعديلها عبر update_product (السعر عبر update_product_price)
+    PRODUCT_EDITABLE_FIELDS = ('name', 'description', 'type', 'provider_id', 'variation_id', 'is_active')
+
+    async def update_product(self, product_id: int, **fields) -> bool:
+        unknown = set(fields) - set(self.PRODUCT_EDITABLE_FIELDS)
+        if unknown or not fields:
+            raise ValueError(f"Invalid product fields: {sorted(unknown) or 'none'}")
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute(
+                f"UPDATE products SET {assignments} WHERE id = ?", (*fields.values(), product_id)
+            )
+            await db.commit()
+            await self._reload_catalog(db)
+            return cursor.rowcount > 0
+
+    async def delete_product(self, product_id: int) -> bool:
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            await db.commit()
+            await self._reload_catalog(db)
+            return cursor.rowcount > 0
+
+    async def create_order(self, user_id: int, product_id: int, player_id: str, price_usd, price_local, exchange_rate: float, status: str = OrderStatus.NEW) -> int:
+        price = price_usd if isinstance(price_usd, Money) else Money.of(price_usd)
+        local = price_local if isinstance(price_local, Money) else Money.of(price_local, CURRENCY_SYP)
         db = await self.connect()
         async with self._lock:
             cursor = await db.execute("""
-                INSERT INTO orders (user_id, product_id, player_id, price_usd, price_local, exchange_rate, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, product_id, player_id, price_usd, price_local, exchange_rate, status))
+                INSERT INTO orders (user_id, product_id, player_id, price_usd, price_local, exchange_rate,
+                                    price_usd_minor, price_local_minor, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, product_id, player_id, price.amount, local.amount, exchange_rate, price.minor, local.minor, status))
             order_id = cursor.lastrowid
             await db.commit()
             return order_id
 
-    async def update_order_status(self, order_id: int, status: str, admin_notes: str = None, execution_type: str = 'MANUAL', operator_id: int = None):
+    async def _transition_order(self, db, order_id: int, from_status: str, to_status: str, admin_notes: str = None,
+                                execution_type: str = None, operator_id: int = None) -> bool:
+        """
+        نقل الطلب من حالة لأخرى بشرط ذري (compare-and-set) دون commit
+        
+        Returns:
+            True إذا تم الانتقال، False إذا كان الانتقال غير مسموح أو تغيرت الحالة من قبل عملية أخرى
+        """
+        if to_status not in ORDER_TRANSITIONS.get(from_status, ()):
+            return False
+        cursor = await db.execute("""
+            UPDATE orders SET status = ?,
+                admin_notes = COALESCE(?, admin_notes),
+                execution_type = COALESCE(?, execution_type),
+                operator_id = COALESCE(?, operator_id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        """, (to_status, admin_notes, execution_type, operator_id, order_id, from_status))
+        if cursor.rowcount != 1:
+            return False
+        
+        if to_status in [OrderStatus.COMPLETED, OrderStatus.FAILED]:
+            async with db.execute("SELECT user_id, execution_type FROM orders WHERE id = ?", (order_id,)) as cursor:
+                order = await cursor.fetchone()
+            await db.execute("""
+                INSERT INTO trust_logs (order_id, user_id, action_text, execution_type)
+                VALUES (?, ?, ?, ?)
+            """, (order_id, order['user_id'], f"Order #{order_id} {to_status}", order['execution_type']))
+        return True
+
+    async def transition_order_status(self, order_id: int, from_status: str, to_status: str, admin_notes: str = None,
+                                      execution_type: str = None, operator_id: int = None) -> bool:
+        """نقل حالة الطلب إذا كانت حالته الحالية from_status (يفوز طرف واحد فقط عند التزامن)"""
         db = await self.connect()
         async with self._lock:
-            await db.execute("""
-                UPDATE orders SET status = ?, admin_notes = ?, execution_type = ?, operator_id = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (status, admin_notes, execution_type, operator_id, order_id))
-            
-            if status in [OrderStatus.COMPLETED, OrderStatus.FAILED]:
-                async with db.execute("SELECT user_id FROM orders WHERE id = ?", (order_id,)) as cursor:
-                    order = await cursor.fetchone()
-                    if order:
-                        await db.execute("""
-                            INSERT INTO trust_logs (order_id, user_id, action_text, execution_type)
-                            VALUES (?, ?, ?, ?)
-                        """, (order_id, order['user_id'], f"Order #{order_id} {status}", execution_type))
+            won = await self._transition_order(db, order_id, from_status, to_status, admin_notes, execution_type, operator_id)
             await db.commit()
+            return won
+
+    async def update_order_status(self, order_id: int, status: str, admin_notes: str = None, execution_type: str = None, operator_id: int = None) -> bool:
+        """نقل الطلب من حالته الحالية إلى status وفق جدول الانتقالات"""
+        db = await self.connect()
+        async with db.execute("SELECT status FROM orders WHERE id = ?", (order_id,)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return False
+        return await self.transition_order_status(order_id, row['status'], status, admin_notes, execution_type, operator_id)
 
     async def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
         db = await self.connect()
@@ -194,6 +635,11 @@ class DatabaseManager:
         """, (user_id, limit)) as cursor:
             return [dict(row) for row in await cursor.fetchall()]
 
+    async def get_user_orders_count(self, user_id: int) -> int:
+        db = await self.connect()
+        async with db.execute("SELECT COUNT(*) AS count FROM orders WHERE user_id = ?", (user_id,)) as cursor:
+            return (await cursor.fetchone())['count']
+
     async def has_open_order(self, user_id: int) -> bool:
         db = await self.connect()
         async with db.execute("""
@@ -203,17 +649,71 @@ class DatabaseManager:
             row = await cursor.fetchone()
             return row['count'] > 0
 
+    async def _load_settings(self) -> Dict[str, str]:
+        """تحميل جدول الإعدادات كاملاً مرة واحدة؛ الكتابة تتم عبر set_setting فقط فيبقى الكاش متسقاً"""
+        if self._settings_cache is None:
+            db = await self.connect()
+            async with db.execute("SELECT key, value FROM settings") as cursor:
+                self._settings_cache = {row['key']: row['value'] for row in await cursor.fetchall()}
+        return self._settings_cache
+
     async def get_setting(self, key: str, default: Any = None) -> Any:
-        db = await self.connect()
-        async with db.execute("SELECT value FROM settings WHERE key = ?", (key,)) as cursor:
-            row = await cursor.fetchone()
-            return row['value'] if row else default
+        settings = await self._load_settings()
+        return settings.get(key, default)
 
     async def set_setting(self, key: str, value: str):
         db = await self.connect()
         async with self._lock:
             await db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
             await db.commit()
+            if self._settings_cache is not None:
+                self._settings_cache[key] = value
+            if key == 'dollar_rate' and self._catalog is not None:
+                self._catalog_version += 1
+                self._catalog = self._catalog.with_rate(self._catalog_version, int(float(value)))
+
+    async def get_order_context(self, user_id: int, product_id: int, payment_method_id: int = None) -> Dict[str, Any]:
+        """
+        قراءة كل ما يحتاجه التحقق من الطلب في استعلام واحد:
+        المستخدم، المنتج، طريقة الدفع، ووجود طلب مفتوح
+        
+        Returns:
+            {'user': dict|None, 'product': dict|None, 'payment_method': dict|None, 'has_open_order': bool}
+        """
+        db = await self.connect()
+        # أعمدة فاصلة لتقسيم الصف بين الجداول دون سرد أعمدتها يدوياً
+        async with db.execute("""
+            SELECT u.*, NULL AS __product, p.*, NULL AS __payment_method, pm.*, NULL AS __end,
+                   EXISTS(
+                       SELECT 1 FROM orders
+                       WHERE user_id = ? AND status NOT IN (?, ?, ?)
+                   ) AS __has_open_order
+            FROM (SELECT 1)
+            LEFT JOIN users u ON u.telegram_id = ?
+            LEFT JOIN products p ON p.id = ?
+            LEFT JOIN payment_methods pm ON pm.id = ? AND pm.deleted_at IS NULL
+        """, (user_id, OrderStatus.COMPLETED, OrderStatus.FAILED, OrderStatus.CANCELED,
+              user_id, product_id, payment_method_id)) as cursor:
+            row = await cursor.fetchone()
+            columns = [d[0] for d in cursor.description]
+        
+        sections = {}
+        current, values = 'user', {}
+        for name, value in zip(columns, row):
+            if name in ('__product', '__payment_method', '__end'):
+                sections[current] = values
+                current, values = name[2:], {}
+            elif name == '__has_open_order':
+                sections['has_open_order'] = bool(value)
+            else:
+                values[name] = value
+        
+        return {
+            'user': sections['user'] if sections['user'].get('telegram_id') is not None else None,
+            'product': sections['product'] if sections['product'].get('id') is not None else None,
+            'payment_method': sections['payment_method'] if sections['payment_method'].get('id') is not None else None,
+            'has_open_order': sections['has_open_order']
+        }
 
     async def get_payment_methods(self, only_active: bool = True) -> List[Dict[str, Any]]:
         db = await self.connect()
@@ -228,30 +728,246 @@ class DatabaseManager:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
-    async def validate_coupon(self, code: str, user_id: int, amount: float) -> tuple[bool, str, float]:
+    async def add_payment_method(self, name: str, description: str = None) -> int:
         db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute(
+                "INSERT INTO payment_methods (name, description, is_active) VALUES (?, ?, 1)", (name, description)
+            )
+            await db.commit()
+            return cursor.lastrowid
+
+    async def update_payment_method(self, method_id: int, name: str = None, description: str = None, is_active: bool = None):
+        """تحديث الحقول المحددة فقط (None = بدون تغيير)"""
+        fields = {'name': name, 'description': description, 'is_active': None if is_active is None else int(is_active)}
+        updates = {column: value for column, value in fields.items() if value is not None}
+        if not updates:
+            return
+        db = await self.connect()
+        async with self._lock:
+            await db.execute(
+                f"UPDATE payment_methods SET {', '.join(f'{column} = ?' for column in updates)} WHERE id = ?",
+                (*updates.values(), method_id)
+            )
+            await db.commit()
+
+    async def delete_payment_method(self, method_id: int) -> bool:
+        """
+        حذف طريقة دفع: نهائياً إذا لم ترتبط بطلبات، وإلا حذف آمن (deleted_at) يحفظ الطلبات السابقة
+        
+        Returns:
+            True إذا حُذفت نهائياً، False إذا كان الحذف آمناً
+        """
+        db = await self.connect()
+        async with self._lock:
+            async with db.execute("SELECT 1 FROM orders WHERE payment_method_id = ? LIMIT 1", (method_id,)) as cursor:
+                has_orders = await cursor.fetchone() is not None
+            if has_orders:
+                await db.execute(
+                    "UPDATE payment_methods SET deleted_at = CURRENT_TIMESTAMP, is_active = 0 WHERE id = ?", (method_id,)
+                )
+            else:
+                await db.execute("DELETE FROM payment_methods WHERE id = ?", (method_id,))
+            await db.commit()
+            return not has_orders
+
+    async def get_coupon(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        البحث عن كوبون بالكود عبر الذاكرة المؤقتة
+        
+        الكود غير الموجود يُرفض من فلتر Bloom أو من النتائج السلبية المخزنة دون استعلام.
+        """
+        code = normalize_code(code)
+        cache = self._coupon_cache
+        db = await self.connect()
+        
+        if cache.bloom is None:
+            generation = cache.generation
+            async with db.execute("SELECT code FROM coupons") as cursor:
+                codes = [row['code'] for row in await cursor.fetchall()]
+            cache.build_bloom(codes, len(codes), generation)
+        
+        if not cache.might_exist(code):
+            return None
+        hit, coupon = cache.get(code)
+        if hit:
+            return coupon
+        
         async with db.execute("SELECT * FROM coupons WHERE code = ?", (code,)) as cursor:
-            coupon = await cursor.fetchone()
-            if not coupon: return False, "Coupon not found", 0
-            if not coupon['is_active']: return False, "Coupon inactive", 0
-            if coupon['used_count'] >= coupon['max_uses']: return False, "Coupon fully used", 0
-            if amount < coupon['min_amount']: return False, f"Min amount {coupon['min_amount']}$", 0
-            
-            discount = amount * (coupon['value'] / 100) if coupon['type'] == 'PERCENTAGE' else coupon['value']
-            return True, "Valid", discount
+            row = await cursor.fetchone()
+        coupon = dict(row) if row else None
+        cache.put(code, coupon)
+        return coupon
+
+    async def get_coupon_by_id(self, coupon_id: int) -> Optional[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute("SELECT * FROM coupons WHERE id = ?", (coupon_id,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
 
-    async def use_coupon(self, code: str, user_id: int, order_id: int, discount_amount: float):
+    async def get_all_coupons(self, limit: int = 50) -> List[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute("SELECT * FROM coupons ORDER BY id DESC LIMIT ?", (limit,)) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def create_coupon(self, code: str, type: str, value: float, max_uses: int = 1, min_amount: float = 0,
+                            expires_at: str = None, created_by: int = None, per_user_limit: Optional[int] = 1,
+                            description: str = None) -> int:
+        code = normalize_code(code)
         db = await self.connect()
         async with self._lock:
-            async with db.execute("SELECT id FROM coupons WHERE code = ?", (code,)) as cursor:
-                coupon = await cursor.fetchone()
-                if coupon:
-                    await db.execute("""
-                        INSERT INTO coupon_usage (coupon_id, user_id, order_id, discount_amount)
-                        VALUES (?, ?, ?, ?)
-                    """, (coupon['id'], user_id, order_id, discount_amount))
-                    await db.execute("UPDATE coupons SET used_count = used_count + 1 WHERE id = ?", (coupon['id'],))
-                    await db.commit()
+            cursor = await db.execute("""
+                INSERT INTO coupons (code, type, value, max_uses, per_user_limit, min_amount, expires_at, created_by, description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (code, type, value, max_uses, per_user_limit, min_amount, expires_at, created_by, description))
+            await db.commit()
+            self._coupon_cache.added([code])
+            return cursor.lastrowid
+
+    async def create_coupons_bulk(self, codes: List[str], type: str, value: float, expires_at: str = None,
+                                  created_by: int = None, batch_id: str = None) -> int:
+        """
+        إدخال دفعة كوبونات أحادية الاستخدام في معاملة واحدة (executemany)
+        
+        Returns:
+            عدد الكوبونات المدخلة فعلاً (الأكواد الموجودة مسبقاً تُتجاهل)
+        """
+        codes = [normalize_code(code) for code in codes]
+        async with self.transaction() as tx:
+            cursor = await tx.executemany("""
+                INSERT OR IGNORE INTO coupons (code, type, value, max_uses, per_user_limit, expires_at, created_by, batch_id)
+                VALUES (?, ?, ?, 1, 1, ?, ?, ?)
+            """, [(code, type, value, expires_at, created_by, batch_id) for code in codes])
+            inserted = cursor.rowcount
+        self._coupon_cache.added(codes)
+        return inserted
+
+    async def get_coupon_batches(self, limit: int = 10) -> List[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute("""
+            SELECT batch_id, COUNT(*) AS count, SUM(used_count) AS used, MIN(created_at) AS created_at
+            FROM coupons WHERE batch_id IS NOT NULL
+            GROUP BY batch_id ORDER BY MIN(id) DESC LIMIT ?
+        """, (limit,)) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def iter_coupon_batch(self, batch_id: str):
+        """قراءة كوبونات الدفعة تدريجياً دون تحميلها كاملة في الذاكرة"""
+        db = await self.connect()
+        async with db.execute("SELECT * FROM coupons WHERE batch_id = ? ORDER BY id", (batch_id,)) as cursor:
+            async for row in cursor:
+                yield dict(row)
+
+    async def set_coupon_active(self, coupon_id: int, is_active: bool):
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("UPDATE coupons SET is_active = ? WHERE id = ?", (1 if is_active else 0, coupon_id))
+            await db.commit()
+        # الكود غير معروف هنا دون استعلام، والإلغاء الكامل رخيص (الفلتر يبقى صالحاً)
+        self._coupon_cache.invalidate()
+
+    async def delete_coupon(self, coupon_id: int) -> bool:
+        """
+        حذف كوبون؛ الكوبون المستخدم سابقاً يُعطل بدلاً من حذفه للحفاظ على سجل الاستخدام
+        
+        Returns:
+            True إذا حُذف، False إذا عُطل
+        """
+        db = await self.connect()
+        async with self._lock:
+            async with db.execute("SELECT 1 FROM coupon_usage WHERE coupon_id = ? LIMIT 1", (coupon_id,)) as cursor:
+                used = await cursor.fetchone() is not None
+            if used:
+                await db.execute("UPDATE coupons SET is_active = 0 WHERE id = ?", (coupon_id,))
+            else:
+                await db.execute("DELETE FROM coupons WHERE id = ?", (coupon_id,))
+            await db.commit()
+        self._coupon_cache.invalidate()
+        return not used
+
+    async def get_coupon_user_uses(self, coupon_id: int, user_id: int) -> int:
+        db = await self.connect()
+        async with db.execute(
+            "SELECT COUNT(*) AS count FROM coupon_usage WHERE coupon_id = ? AND user_id = ?", (coupon_id, user_id)
+        ) as cursor:
+            return (await cursor.fetchone())['count']
+
+    async def validate_coupon(self, code: str, user_id: int, amount) -> tuple[bool, str, Money]:
+        """فحص مسبق لعرض الخصم (بالسنت)؛ الحجز الفعلي يتم ذرياً في _redeem_coupon"""
+        amount = amount if isinstance(amount, Money) else Money.of(amount)
+        no_discount = Money(0)
+        coupon = await self.get_coupon(code)
+        if not coupon: return False, "Coupon not found", no_discount
+        if not coupon['is_active']: return False, "Coupon inactive", no_discount
+        if coupon['expires_at'] and datetime.fromisoformat(coupon['expires_at']) <= datetime.now(): return False, "Coupon expired", no_discount
+        if coupon['used_count'] >= coupon['max_uses']: return False, "Coupon fully used", no_discount
+        if coupon['per_user_limit'] is not None and await self.get_coupon_user_uses(coupon['id'], user_id) >= coupon['per_user_limit']:
+            return False, "Coupon already used", no_discount
+        if amount < Money.of(coupon['min_amount']): return False, f"Min amount {coupon['min_amount']}$", no_discount
+        
+        discount = amount.percent(coupon['value']) if coupon['type'] == 'PERCENTAGE' else Money.of(coupon['value'])
+        return True, "Valid", discount
+
+    async def _redeem_coupon(self, db, code: str, user_id: int, order_id: int = None, discount_amount=0) -> bool:
+        """
+        حجز استخدام واحد من الكوبون بتحديث مشروط واحد دون commit (يُستدعى تحت القفل)
+        
+        الشرط يشمل التفعيل والحد الأقصى والصلاحية وحد المستخدم، فلا يمكن تجاوزها عند التزامن.
+        
+        Returns:
+            True إذا تم الحجز وتسجيل الاستخدام
+        """
+        cursor = await db.execute("""
+            UPDATE coupons SET used_count = used_count + 1
+            WHERE code = ? AND is_active = 1 AND used_count < max_uses
+              AND (expires_at IS NULL OR datetime(expires_at) > datetime('now', 'localtime'))
+              AND (per_user_limit IS NULL OR per_user_limit > (
+                  SELECT COUNT(*) FROM coupon_usage WHERE coupon_id = coupons.id AND user_id = ?
+              ))
+        """, (code, user_id))
+        # عدد الاستخدامات تغيّر (أو الكوبون لم يعد صالحاً): إسقاط النسخة المخزنة
+        self._coupon_cache.invalidate(normalize_code(code))
+        if cursor.rowcount != 1:
+            return False
+        discount = discount_amount if isinstance(discount_amount, Money) else Money.of(discount_amount)
+        await db.execute("""
+            INSERT INTO coupon_usage (coupon_id, user_id, order_id, discount_amount, discount_minor)
+            VALUES ((SELECT id FROM coupons WHERE code = ?), ?, ?, ?, ?)
+        """, (code, user_id, order_id, discount.amount, discount.minor))
+        return True
+
+    async def use_coupon(self, code: str, user_id: int, order_id: int, discount_amount) -> bool:
+        db = await self.connect()
+        async with self._lock:
+            redeemed = await self._redeem_coupon(db, code, user_id, order_id, discount_amount)
+            await db.commit()
+            return redeemed
+
+    async def redeem_balance_coupon(self, code: str, user_id: int) -> tuple[bool, Any]:
+        """
+        شحن الرصيد بكوبون قيمة ثابتة: حجز الاستخدام وإضافة القيمة في معاملة واحدة
+        
+        Returns:
+            (True, الرصيد الجديد) أو (False, السبب) - "Coupon unavailable" إذا انتهت الصلاحية أو الاستخدامات
+        """
+        code = normalize_code(code)
+        try:
+            async with self.transaction() as tx:
+                async with tx.execute("SELECT type, value FROM coupons WHERE code = ?", (code,)) as cursor:
+                    coupon = await cursor.fetchone()
+                if not coupon or coupon['type'] != 'FIXED':
+                    raise ValueError("Not a balance coupon")
+                amount = Money.of(coupon['value'])
+                if not await self._redeem_coupon(tx, code, user_id, discount_amount=amount):
+                    raise ValueError("Coupon unavailable")
+                success, result = await self._apply_balance_change(
+                    tx, user_id=user_id, amount=amount, log_type="COUPON", reason=f"استخدام كوبون: {code}"
+                )
+                if not success:
+                    raise ValueError(result)
+        except ValueError as e:
+            return False, str(e)
+        return True, result
 
     async def log_admin_action(self, admin_id: int, action: str, target_type: str = None, target_id: int = None, details: str = None):
         db = await self.connect()
@@ -262,6 +978,329 @@ class DatabaseManager:
             """, (admin_id, action, target_type, target_id, details))
             await db.commit()
 
+    async def get_audit_logs(self, limit: int = 20, before_id: int = None, admin_id: int = None, action: str = None,
+                             target_type: str = None, date_from: str = None, date_to: str = None) -> List[Dict[str, Any]]:
+        """
+        ترقيم سجل العمليات بطريقة keyset (id < before_id) بدلاً من OFFSET
+        حدود التاريخ تُحوَّل إلى حدود id عبر فهرس created_at، فتكلفة أي صفحة ثابتة
+        """
+        db = await self.connect()
+        query = "SELECT * FROM audit_logs WHERE 1=1"
+        params = []
+        if before_id:
+            query += " AND id < ?"
+            params.append(before_id)
+        if admin_id is not None:
+            query += " AND admin_id = ?"
+            params.append(admin_id)
+        if action:
+            query += " AND action = ?"
+            params.append(action)
+        if target_type:
+            query += " AND target_type = ?"
+            params.append(target_type)
+        if date_from:
+            query += " AND id >= (SELECT id FROM audit_logs WHERE created_at >= ? ORDER BY created_at LIMIT 1)"
+            params.append(date_from)
+        if date_to:
+            query += " AND id <= (SELECT id FROM audit_logs WHERE created_at < ? ORDER BY created_at DESC LIMIT 1)"
+            params.append(date_to)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        async with db.execute(query, params) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_audit_filter_values(self, column: str, limit: int = 10) -> List[Any]:
+        """القيم الأكثر تكراراً لعمود فلترة في سجل العمليات (admin_id, action, target_type)"""
+        if column not in ('admin_id', 'action', 'target_type'):
+            raise ValueError(f"Unsupported audit filter column: {column}")
+        db = await self.connect()
+        async with db.execute(f"""
+            SELECT {column} AS value, COUNT(*) AS count FROM audit_logs
+            WHERE {column} IS NOT NULL
+            GROUP BY {column} ORDER BY count DESC LIMIT ?
+        """, (limit,)) as cursor:
+            return [row['value'] for row in await cursor.fetchall()]
+
+    async def enqueue_notification(self, chat_id: int, message: str, parse_mode: str = None, reply_markup: str = None,
+                                   delay_seconds: int = 0, error: str = None, photo: str = None,
+                                   item_type: str = None, item_key: str = None) -> int:
+        """
+        حفظ إشعار فشل إرساله بسبب خطأ مؤقت في صندوق الإرسال لإعادة المحاولة لاحقاً
+        
+        photo: file_id لإعادة الإرسال كصورة
+        item_type/item_key: لرسائل الطاقم، تُسجل الرسالة للعنصر عند وصولها
+        """
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("""
+                INSERT INTO notification_outbox (chat_id, message, parse_mode, reply_markup, photo, item_type, item_key,
+                                                 attempts, last_error, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, datetime('now', ?))
+            """, (chat_id, message, parse_mode, reply_markup, photo, item_type, item_key, error, f"+{int(delay_seconds)} seconds"))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def get_due_notifications(self, limit: int = 50) -> List[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute("""
+            SELECT * FROM notification_outbox
+            WHERE status = 'PENDING' AND next_attempt_at <= datetime('now')
+            ORDER BY next_attempt_at LIMIT ?
+        """, (limit,)) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def mark_notification_sent(self, notification_id: int):
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("UPDATE notification_outbox SET status = 'SENT' WHERE id = ?", (notification_id,))
+            await db.commit()
+
+    async def reschedule_notification(self, notification_id: int, delay_seconds: int, error: str, give_up: bool = False):
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("""
+                UPDATE notification_outbox
+                SET attempts = attempts + 1, last_error = ?, status = ?, next_attempt_at = datetime('now', ?)
+                WHERE id = ?
+            """, (error, 'FAILED' if give_up else 'PENDING', f"+{int(delay_seconds)} seconds", notification_id))
+            await db.commit()
+
+    async def get_staff_ids(self, roles: List[str]) -> List[int]:
+        """معرفات الطاقم غير المحظورين ضمن الرتب المحددة"""
+        db = await self.connect()
+        placeholders = ",".join("?" * len(roles))
+        async with db.execute(
+            f"SELECT telegram_id FROM users WHERE role IN ({placeholders}) AND is_blocked = 0", roles
+        ) as cursor:
+            return [row['telegram_id'] for row in await cursor.fetchall()]
+
+    async def save_staff_messages(self, item_type: str, item_key: str, messages: List[tuple]):
+        """حفظ (chat_id, message_id) لرسائل الطاقم الخاصة بعنصر معين"""
+        if not messages:
+            return
+        db = await self.connect()
+        async with self._lock:
+            await db.executemany(
+                "INSERT INTO staff_messages (item_type, item_key, chat_id, message_id) VALUES (?, ?, ?, ?)",
+                [(item_type, item_key, chat_id, message_id) for chat_id, message_id in messages]
+            )
+            await db.commit()
+
+    async def get_staff_messages(self, item_type: str, item_key: str) -> List[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute(
+            "SELECT chat_id, message_id FROM staff_messages WHERE item_type = ? AND item_key = ?", (item_type, item_key)
+        ) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_staff_claim(self, item_type: str, item_key: str) -> Optional[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute(
+            "SELECT * FROM staff_claims WHERE item_type = ? AND item_key = ?", (item_type, item_key)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def claim_staff_item(self, item_type: str, item_key: str, staff_id: int, staff_name: str = None) -> tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        استلام عنصر بشكل ذري (INSERT OR IGNORE على المفتاح الأساسي)
+        
+        Returns:
+            (won: bool, claim: dict) - claim يحتوي على من استلم العنصر فعلياً
+        """
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("""
+                INSERT OR IGNORE INTO staff_claims (item_type, item_key, claimed_by, claimed_by_name)
+                VALUES (?, ?, ?, ?)
+            """, (item_type, item_key, staff_id, staff_name))
+            won = cursor.rowcount == 1
+            await db.commit()
+            async with db.execute(
+                "SELECT * FROM staff_claims WHERE item_type = ? AND item_key = ?", (item_type, item_key)
+            ) as cursor:
+                row = await cursor.fetchone()
+            return won, dict(row) if row else None
+
+    async def release_staff_claim(self, item_type: str, item_key: str, staff_id: int) -> bool:
+        """إلغاء استلام الموظف لعنصر (بعد فشل معالجته)؛ True إذا كان هو المستلم"""
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute(
+                "DELETE FROM staff_claims WHERE item_type = ? AND item_key = ? AND claimed_by = ?",
+                (item_type, item_key, staff_id)
+            )
+            await db.commit()
+            return cursor.rowcount == 1
+
+    async def create_deposit_request(self, user_id: int, amount_usd: float, amount_local: float, exchange_rate: float,
+                                     payment_method_id: int = None, receipt_file_id: str = None) -> int:
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("""
+                INSERT INTO deposit_requests (user_id, amount_usd, amount_local, exchange_rate, payment_method_id, receipt_file_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, amount_usd, amount_local, exchange_rate, payment_method_id, receipt_file_id))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def get_deposit_request(self, deposit_id: int) -> Optional[Dict[str, Any]]:
+        db = await self.connect()
+        async with db.execute("""
+            SELECT d.*, u.username, pm.name AS method_name
+            FROM deposit_requests d
+            LEFT JOIN users u ON d.user_id = u.telegram_id
+            LEFT JOIN payment_methods pm ON d.payment_method_id = pm.id
+            WHERE d.id = ?
+        """, (deposit_id,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def get_deposit_requests(self, status: str = 'PENDING', limit: int = 10) -> List[Dict[str, Any]]:
+        """طابور طلبات الشحن بالأقدم أولاً (يستخدم فهرس status, created_at)"""
+        db = await self.connect()
+        async with db.execute("""
+            SELECT d.*, u.username
+            FROM deposit_requests d
+            LEFT JOIN users u ON d.user_id = u.telegram_id
+            WHERE d.status = ?
+            ORDER BY d.created_at, d.id LIMIT ?
+        """, (status, limit)) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_deposit_queue_stats(self, status: str = 'PENDING') -> Dict[str, Any]:
+        db = await self.connect()
+        async with db.execute("""
+            SELECT COUNT(*) AS count, COALESCE(SUM(amount_usd), 0) AS total
+            FROM deposit_requests WHERE status = ?
+        """, (status,)) as cursor:
+            return dict(await cursor.fetchone())
+
+    async def approve_deposit_requests(self, deposit_ids: List[int], admin_id: int) -> List[Dict[str, Any]]:
+        """
+        قبول طلبات شحن وإضافة الرصيد في معاملة واحدة
+        
+        كل طلب ينتقل من PENDING بشرط ذري (WHERE status = 'PENDING')،
+        فالطلب المعالج مسبقاً يُتخطى ولا يُضاف رصيده مرتين.
+        
+        Returns:
+            الطلبات التي تم قبولها فعلاً مع الرصيد الجديد (balance_after)
+        """
+        approved = []
+        async with self.transaction() as tx:
+            for deposit_id in deposit_ids:
+                cursor = await tx.execute("""
+                    UPDATE deposit_requests SET status = 'APPROVED', processed_by = ?, processed_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'PENDING'
+                """, (admin_id, deposit_id))
+                if cursor.rowcount != 1:
+                    continue
+                async with tx.execute("SELECT * FROM deposit_requests WHERE id = ?", (deposit_id,)) as cur:
+                    deposit = dict(await cur.fetchone())
+                success, result = await self._apply_balance_change(
+                    tx, deposit['user_id'], deposit['amount_usd'], "DEPOSIT",
+                    reason=f"شحن رصيد #{deposit_id}", admin_id=admin_id
+                )
+                if not success:
+                    raise ValueError(f"Deposit #{deposit_id}: {result}")
+                deposit['balance_after'] = result
+                approved.append(deposit)
+        return approved
+
+    async def reject_deposit_requests(self, deposit_ids: List[int], admin_id: int) -> List[Dict[str, Any]]:
+        """رفض طلبات شحن معلقة؛ يعيد الطلبات التي تم رفضها فعلاً"""
+        rejected = []
+        async with self.transaction() as tx:
+            for deposit_id in deposit_ids:
+                cursor = await tx.execute("""
+                    UPDATE deposit_requests SET status = 'REJECTED', processed_by = ?, processed_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'PENDING'
+                """, (admin_id, deposit_id))
+                if cursor.rowcount == 1:
+                    async with tx.execute("SELECT * FROM deposit_requests WHERE id = ?", (deposit_id,)) as cur:
+                        rejected.append(dict(await cur.fetchone()))
+        return rejected
+
+    async def get_account_balance(self, account: str) -> int:
+        """الرصيد المادي لحساب بالسنت (قراءة O(1))"""
+        db = await self.connect()
+        async with db.execute("SELECT balance_minor FROM account_balances WHERE account = ?", (account,)) as cursor:
+            row = await cursor.fetchone()
+            return row['balance_minor'] if row else 0
+
+    async def get_ledger_verification_chunk(self, after_account: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        دفعة من الحسابات مع رصيدها المادي ومجموع قيودها
+        (المجموع يُحسب من الفهرس account, amount_minor دون قراءة الجدول)
+        
+        القراءة تحت القفل: الاتصال مشترك، وبدونه قد تظهر معاملة نصف منفذة
+        (قيد بلا تحديث رصيده) كانحراف زائف
+        """
+        db = await self.connect()
+        async with self._lock:
+            async with db.execute("""
+                SELECT a.account, a.balance_minor,
+                       (SELECT COALESCE(SUM(l.amount_minor), 0) FROM ledger_entries l WHERE l.account = a.account) AS ledger_minor
+                FROM account_balances a
+                WHERE a.account > ?
+                ORDER BY a.account LIMIT ?
+            """, (after_account, limit)) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_ledger_integrity(self) -> Dict[str, Any]:
+        """
+        فحوص إجمالية: مجموع القيود صفر، حسابات بلا رصيد مادي، ونسخة users.balance
+        (الفحوص الثلاثة تحت القفل لترى نفس الحالة المثبتة)
+        """
+        db = await self.connect()
+        async with self._lock:
+            async with db.execute("SELECT COALESCE(SUM(amount_minor), 0) AS total FROM ledger_entries") as cursor:
+                total = (await cursor.fetchone())['total']
+            async with db.execute("""
+                SELECT DISTINCT l.account FROM ledger_entries l
+                WHERE NOT EXISTS (SELECT 1 FROM account_balances a WHERE a.account = l.account)
+            """) as cursor:
+                orphans = [row['account'] for row in await cursor.fetchall()]
+            async with db.execute("""
+                SELECT COUNT(*) AS count FROM users u
+                LEFT JOIN account_balances a ON a.account = 'user:' || u.telegram_id
+                WHERE CAST(ROUND(u.balance * 100) AS INTEGER) != COALESCE(a.balance_minor, 0)
+            """) as cursor:
+                mirror_mismatches = (await cursor.fetchone())['count']
+        return {'ledger_total': total, 'orphan_accounts': orphans, 'mirror_mismatches': mirror_mismatches}
+
+    async def begin_idempotent(self, key: str) -> tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        حجز مفتاح عملية بشكل ذري
+        
+        Returns:
+            (acquired: bool, existing: dict) - existing هو سجل المفتاح إذا كان محجوزاً مسبقاً
+        """
+        db = await self.connect()
+        async with self._lock:
+            cursor = await db.execute("INSERT OR IGNORE INTO idempotency_keys (key) VALUES (?)", (key,))
+            acquired = cursor.rowcount == 1
+            await db.commit()
+        if acquired:
+            return True, None
+        async with db.execute("SELECT * FROM idempotency_keys WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+            return False, dict(row) if row else None
+
+    async def complete_idempotent(self, key: str, result: str):
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("UPDATE idempotency_keys SET status = 'DONE', result = ? WHERE key = ?", (result, key))
+            await db.commit()
+
+    async def release_idempotent(self, key: str):
+        """تحرير مفتاح عملية فشلت بخطأ غير متوقع للسماح بإعادة المحاولة"""
+        db = await self.connect()
+        async with self._lock:
+            await db.execute("DELETE FROM idempotency_keys WHERE key = ? AND status = 'PENDING'", (key,))
+            await db.commit()
+
     async def update_user_currency(self, telegram_id: int, currency: str):
         db = await self.connect()
         async with self._lock:
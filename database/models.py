@@ -52,6 +52,7 @@ CREATE TABLE IF NOT EXISTS products (
     name TEXT NOT NULL,
     description TEXT,
     price_usd REAL NOT NULL, -- السعر بالدولار دائماً
+    price_minor INTEGER, -- نفس السعر بالسنت (المرجع في الحسابات)
     type TEXT DEFAULT 'MANUAL', -- AUTOMATIC, MANUAL, DISABLED
     variation_id TEXT, 
     is_active INTEGER DEFAULT 1,
@@ -69,6 +70,8 @@ CREATE TABLE IF NOT EXISTS orders (
     price_usd REAL, -- السعر بالدولار وقت الطلب
     price_local REAL, -- السعر بالعملة المحلية وقت الطلب
     exchange_rate REAL, -- سعر الصرف وقت الطلب
+    price_usd_minor INTEGER, -- السعر بالسنت
+    price_local_minor INTEGER, -- السعر المحلي بأصغر وحدة
     status TEXT DEFAULT 'NEW', -- NEW, PENDING_PAYMENT, PAID, PENDING_REVIEW, IN_PROGRESS, COMPLETED, FAILED, CANCELED
     payment_method_id INTEGER,
     payment_receipt_file_id TEXT, -- صورة الإيصال
@@ -139,7 +142,9 @@ CREATE TABLE IF NOT EXISTS coupons (
     value REAL NOT NULL,
     max_uses INTEGER DEFAULT 1,
     used_count INTEGER DEFAULT 0,
+    per_user_limit INTEGER DEFAULT 1, -- NULL = غير محدود
     min_amount REAL DEFAULT 0,
+    batch_id TEXT, -- دفعة التوليد بالجملة
     is_active INTEGER DEFAULT 1,
     expires_at DATETIME,
     created_by INTEGER,
@@ -156,6 +161,7 @@ CREATE TABLE IF NOT EXISTS coupon_usage (
     user_id INTEGER NOT NULL,
     order_id INTEGER,
     discount_amount REAL,
+    discount_minor INTEGER, -- الخصم بالسنت
     used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY(coupon_id) REFERENCES coupons(id),
     FOREIGN KEY(user_id) REFERENCES users(telegram_id),
@@ -213,6 +219,202 @@ CREATE TABLE IF NOT EXISTS admin_sessions (
 );
 """
 
+CREATE_NOTIFICATION_OUTBOX_TABLE = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    parse_mode TEXT,
+    reply_markup TEXT, -- JSON
+    photo TEXT, -- file_id: تُرسل كصورة والرسالة تعليقها
+    item_type TEXT, -- رسائل الطاقم: العنصر الذي تُسجل له الرسالة عند وصولها
+    item_key TEXT,
+    status TEXT DEFAULT 'PENDING', -- PENDING, SENT, FAILED
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# توزيع إشعارات الطاقم: من استلم العنصر (طلب، شحن) ورسائل كل موظف لتحديث أزرارها
+CREATE_STAFF_CLAIMS_TABLE = """
+CREATE TABLE IF NOT EXISTS staff_claims (
+    item_type TEXT NOT NULL, -- ORDER, DEPOSIT
+    item_key TEXT NOT NULL,
+    claimed_by INTEGER NOT NULL,
+    claimed_by_name TEXT,
+    claimed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (item_type, item_key)
+);
+"""
+
+CREATE_STAFF_MESSAGES_TABLE = """
+CREATE TABLE IF NOT EXISTS staff_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_type TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_DEPOSIT_REQUESTS_TABLE = """
+CREATE TABLE IF NOT EXISTS deposit_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    amount_usd REAL NOT NULL,
+    amount_local REAL,
+    exchange_rate REAL,
+    payment_method_id INTEGER,
+    receipt_file_id TEXT,
+    status TEXT DEFAULT 'PENDING', -- PENDING, APPROVED, REJECTED
+    processed_by INTEGER,
+    processed_at DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (telegram_id),
+    FOREIGN KEY (payment_method_id) REFERENCES payment_methods (id)
+);
+"""
+
+# الكتابات المباشرة على price_usd (بدون price_minor) تبقى متزامنة مع العمود الصحيح
+CREATE_PRODUCT_PRICE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS products_price_minor_insert AFTER INSERT ON products
+    WHEN NEW.price_minor IS NULL
+    BEGIN UPDATE products SET price_minor = CAST(ROUND(NEW.price_usd * 100) AS INTEGER) WHERE id = NEW.id; END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_price_minor_update AFTER UPDATE OF price_usd ON products
+    WHEN NEW.price_minor IS OLD.price_minor
+    BEGIN UPDATE products SET price_minor = CAST(ROUND(NEW.price_usd * 100) AS INTEGER) WHERE id = NEW.id; END;
+    """
+]
+
+# فهرس البحث النصي للمنتجات: النص يُخزن بعد التوحيد العربي (دالة ar_normalize
+# تُسجل على الاتصال)، والمعرف rowid هو معرف المنتج
+CREATE_PRODUCTS_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, description, tokenize = 'unicode61', prefix = '2 3'
+);
+"""
+
+CREATE_PRODUCTS_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products
+    BEGIN
+        INSERT INTO products_fts (rowid, name, description)
+        VALUES (NEW.id, ar_normalize(NEW.name), ar_normalize(NEW.description));
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products
+    BEGIN
+        UPDATE products_fts SET name = ar_normalize(NEW.name), description = ar_normalize(NEW.description)
+        WHERE rowid = NEW.id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products
+    BEGIN
+        DELETE FROM products_fts WHERE rowid = OLD.id;
+    END;
+    """
+]
+
+# فهرس بحث المستخدمين: trigram يطابق أي جزء من 3 أحرف فأكثر في الاسم أو المعرف
+# (rowid = users.id)
+CREATE_USERS_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+    username, first_name, last_name, tokenize = 'trigram'
+);
+"""
+
+CREATE_USERS_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO users_fts (rowid, username, first_name, last_name)
+        VALUES (NEW.id, NEW.username, NEW.first_name, NEW.last_name);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, first_name, last_name ON users
+    BEGIN
+        UPDATE users_fts SET username = NEW.username, first_name = NEW.first_name, last_name = NEW.last_name
+        WHERE rowid = NEW.id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+    BEGIN
+        DELETE FROM users_fts WHERE rowid = OLD.id;
+    END;
+    """
+]
+
+# أعمدة المبالغ بالسنت: (الجدول، العمود الجديد، العمود العشري القديم)
+MONEY_COLUMNS = [
+    ("products", "price_minor", "price_usd"),
+    ("orders", "price_usd_minor", "price_usd"),
+    ("orders", "price_local_minor", "price_local"),
+    ("coupon_usage", "discount_minor", "discount_amount"),
+]
+
+CREATE_LEDGER_ENTRIES_TABLE = """
+CREATE TABLE IF NOT EXISTS ledger_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    txn_id TEXT NOT NULL, -- قيود الحركة الواحدة (مجموعها صفر)
+    account TEXT NOT NULL, -- user:<telegram_id> أو system:<name>
+    amount_minor INTEGER NOT NULL, -- بالسنت
+    type TEXT NOT NULL, -- DEPOSIT, PURCHASE, REFUND, COUPON, ADMIN_ADJUST, OPENING
+    user_id INTEGER,
+    order_id INTEGER,
+    admin_id INTEGER,
+    reason TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# القيود غير قابلة للتعديل أو الحذف
+CREATE_LEDGER_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update BEFORE UPDATE ON ledger_entries
+    BEGIN SELECT RAISE(ABORT, 'ledger entries are immutable'); END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_delete BEFORE DELETE ON ledger_entries
+    BEGIN SELECT RAISE(ABORT, 'ledger entries are immutable'); END;
+    """
+]
+
+CREATE_ACCOUNT_BALANCES_TABLE = """
+CREATE TABLE IF NOT EXISTS account_balances (
+    account TEXT PRIMARY KEY,
+    balance_minor INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# الحساب المقابل لكل نوع حركة في القيد المزدوج
+LEDGER_COUNTER_ACCOUNTS = {
+    "DEPOSIT": "system:deposits",
+    "PURCHASE": "system:sales",
+    "REFUND": "system:sales",
+    "COUPON": "system:coupons",
+    "ADMIN_ADJUST": "system:adjustments",
+}
+
+CREATE_IDEMPOTENCY_KEYS_TABLE = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    status TEXT DEFAULT 'PENDING', -- PENDING, DONE
+    result TEXT, -- JSON
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
 # الإعدادات الافتراضية للنظام المطور
 DEFAULT_SETTINGS = [
     ('store_mode', 'MANUAL'), # AUTO, MANUAL, MAINTENANCE
@@ -6,7 +6,9 @@ from aiogram.fsm.state import State, StatesGroup
 from database.manager import db_manager
 from utils.keyboards import get_admin_main_menu
 from utils.translations import get_text, get_user_language
+from utils.filters import MenuButton
 from utils.notifications import notification_manager
+from services.notification_router import notification_router
 from config.settings import UserRole
 import logging
 
@@ -19,15 +21,8 @@ class AdminStates(StatesGroup):
     waiting_for_balance_amount = State()
     waiting_for_admin_password = State()
     waiting_for_dollar_rate = State()
-    
-    # إدارة الكوبونات
-    waiting_for_coupon_code = State()
-    waiting_for_coupon_value = State()
-    waiting_for_coupon_min_amount = State()
-    waiting_for_coupon_max_uses = State()
-    waiting_for_coupon_expiry = State()
 
-@router.message(F.text.in_(["⚙️ لوحة التحكم", "⚙️ Admin Panel"]))
+@router.message(MenuButton("btn_admin_panel"))
 async def admin_panel(message: types.Message, is_support: bool, user_role: str, user: dict):
     """عرض لوحة التحكم الرئيسية"""
     if not is_support: 
@@ -206,9 +201,14 @@ async def admin_user_list_paginated(callback: types.CallbackQuery, is_admin: boo
         return
     
     lang = get_user_language(user)
-    page = int(callback.data.split("_")[-1])
+    # admin_user_list_<page>[_a<id>|_b<id>]: مؤشر الصفحة المجاورة لترقيم بدون OFFSET
+    parts = callback.data.split("_")
+    page = int(parts[3])
+    cursor = parts[4] if len(parts) > 4 else ""
+    after_id = int(cursor[1:]) if cursor.startswith("a") else None
+    before_id = int(cursor[1:]) if cursor.startswith("b") else None
     
-    result = await db_manager.get_users_paginated(page=page, per_page=10)
+    result = await db_manager.get_users_paginated(page=page, per_page=10, after_id=after_id, before_id=before_id)
     users = result['users']
     
     if not users:
@@ -228,12 +228,12 @@ async def admin_user_list_paginated(callback: types.CallbackQuery, is_admin: boo
     if page > 1:
         nav_buttons.append(InlineKeyboardButton(
             text=get_text("btn_previous", lang),
-            callback_data=f"admin_user_list_{page-1}"
+            callback_data=f"admin_user_list_{page-1}_b{users[0]['id']}"
         ))
-    if page < result['total_pages']:
+    if result['has_next']:
         nav_buttons.append(InlineKeyboardButton(
             text=get_text("btn_next", lang),
-            callback_data=f"admin_user_list_{page+1}"
+            callback_data=f"admin_user_list_{page+1}_a{users[-1]['id']}"
         ))
     
     if nav_buttons:
@@ -392,9 +392,8 @@ async def admin_user_toggle_block(callback: types.CallbackQuery, is_admin: bool,
         return await callback.answer("❌ المستخدم غير موجود", show_alert=True)
     
     new_status = 0 if target_user['is_blocked'] else 1
-    db = await db_manager.connect()
-    await db.execute("UPDATE users SET is_blocked = ? WHERE telegram_id = ?", (new_status, user_id))
-    await db.commit()
+    await db_manager.set_user_blocked(user_id, bool(new_status))
+    notification_router.invalidate()
     
     action_text = "حظر" if new_status else "إلغاء حظر"
     await callback.answer(f"✅ تم {action_text} المستخدم.")
@@ -522,6 +521,7 @@ async def admin_user_role_finish(callback: types.CallbackQuery, is_admin: bool,
     user_id, new_role = int(parts[3]), parts[4]
     
     await db_manager.update_user_role(user_id, new_role)
+    notification_router.invalidate()
     await callback.answer(f"✅ تم تغيير الرتبة إلى {new_role}")
     
     # إشعار المستخدم
@@ -722,154 +722,6 @@ async def admin_dollar_update_finish(message: types.Message, state: FSMContext,
     except ValueError:
         await message.answer("⚠️ يرجى إدخال رقم صحيح أكبر من صفر.")
 
-# --- إدارة الكوبونات ---
-@router.callback_query(F.data == "admin_coupons")
-async def admin_coupons_main(callback: types.CallbackQuery, is_admin: bool, user: dict):
-    """القائمة الرئيسية لإدارة الكوبونات"""
-    if not is_admin: return
-    
-    lang = get_user_language(user)
-    coupons = await db_manager.get_all_coupons()
-    
-    builder = InlineKeyboardBuilder()
-    for c in coupons:
-        status = "✅" if c['is_active'] else "❌"
-        builder.row(InlineKeyboardButton(text=f"{status} {c['code']} ({c['value']}$)", callback_data=f"admin_coupon_view_{c['id']}"))
-    
-    builder.row(InlineKeyboardButton(text="➕ إضافة كوبون جديد", callback_data="admin_coupon_add_start"))
-    builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_main"))
-    
-    await callback.message.edit_text(
-        "🎟️ *إدارة الكوبونات*\n\nاختر كوبوناً لعرض تفاصيله أو أضف كوبوناً جديداً:",
-        parse_mode="Markdown",
-        reply_markup=builder.as_markup()
-    )
-
-@router.callback_query(F.data == "admin_coupon_add_start")
-async def admin_coupon_add_start(callback: types.CallbackQuery, state: FSMContext, is_admin: bool):
-    """بدء إضافة كوبون جديد"""
-    if not is_admin: return
-    
-    await state.set_state(AdminStates.waiting_for_coupon_code)
-    await callback.message.edit_text(
-        "🎟️ أدخل كود الكوبون الجديد (مثلاً: SAVE10):",
-        reply_markup=InlineKeyboardBuilder().row(InlineKeyboardButton(text="❌ إلغاء", callback_data="admin_coupons")).as_markup()
-    )
-
-@router.message(AdminStates.waiting_for_coupon_code)
-async def admin_coupon_code(message: types.Message, state: FSMContext):
-    """استقبال كود الكوبون"""
-    code = message.text.strip().upper()
-    existing = await db_manager.get_coupon(code)
-    if existing:
-        return await message.answer("⚠️ هذا الكود موجود بالفعل، اختر كوداً آخر:")
-    
-    await state.update_data(code=code)
-    await state.set_state(AdminStates.waiting_for_coupon_value)
-    await message.answer("💰 أدخل قيمة الخصم بالدولار (مثلاً: 5):")
-
-@router.message(AdminStates.waiting_for_coupon_value)
-async def admin_coupon_value(message: types.Message, state: FSMContext):
-    """استقبال قيمة الخصم"""
-    try:
-        value = float(message.text.strip())
-        await state.update_data(value=value)
-        await state.set_state(AdminStates.waiting_for_coupon_min_amount)
-        await message.answer("📉 أدخل الحد الأدنى للطلب لاستخدام الكوبون (مثلاً: 20):")
-    except ValueError:
-        await message.answer("⚠️ يرجى إدخال رقم صحيح.")
-
-@router.message(AdminStates.waiting_for_coupon_min_amount)
-async def admin_coupon_min(message: types.Message, state: FSMContext):
-    """استقبال الحد الأدنى"""
-    try:
-        min_amount = float(message.text.strip())
-        await state.update_data(min_amount=min_amount)
-        await state.set_state(AdminStates.waiting_for_coupon_max_uses)
-        await message.answer("🔢 أدخل أقصى عدد مرات استخدام للكوبون (مثلاً: 100):")
-    except ValueError:
-        await message.answer("⚠️ يرجى إدخال رقم صحيح.")
-
-@router.message(AdminStates.waiting_for_coupon_max_uses)
-async def admin_coupon_max(message: types.Message, state: FSMContext, is_admin: bool, user: dict):
-    """استقبال عدد المرات وإنهاء الإضافة"""
-    try:
-        max_uses = int(message.text.strip())
-        data = await state.get_data()
-        
-        await db_manager.create_coupon(
-            code=data['code'],
-            type='FIXED',
-            value=data['value'],
-            max_uses=max_uses,
-            min_amount=data['min_amount'],
-            expires_at=None,
-            created_by=message.from_user.id
-        )
-        
-        # تسجيل العملية
-        await db_manager.log_admin_action(
-            admin_id=message.from_user.id,
-            action="CREATE_COUPON",
-            details=f"إنشاء كوبون: {data['code']} بقيمة {data['value']}$"
-        )
-        
-        await state.clear()
-        await message.answer(f"✅ تم إنشاء الكوبون `{data['code']}` بنجاح!")
-        await admin_coupons_main(types.CallbackQuery(
-            id="dummy", from_user=message.from_user, data="admin_coupons",
-            chat_instance="dummy", message=message
-        ), is_admin, user)
-        
-    except ValueError:
-        await message.answer("⚠️ يرجى إدخال رقم صحيح.")
-
-@router.callback_query(F.data.startswith("admin_coupon_view_"))
-async def admin_coupon_view(callback: types.CallbackQuery, is_admin: bool):
-    """عرض تفاصيل كوبون"""
-    if not is_admin: return
-    
-    coupon_id = int(callback.data.split("_")[3])
-    db = await db_manager.connect()
-    cursor = await db.execute("SELECT * FROM coupons WHERE id = ?", (coupon_id,))
-    coupon = await cursor.fetchone()
-    
-    if not coupon:
-        return await callback.answer("❌ الكوبون غير موجود", show_alert=True)
-    
-    text = (
-        f"🎟️ *تفاصيل الكوبون*\n\n"
-        f"الكود: `{coupon['code']}`\n"
-        f"القيمة: `{coupon['value']}$`\n"
-        f"الحد الأدنى: `{coupon['min_amount']}$`\n"
-        f"الاستخدام: `{coupon['used_count']}/{coupon['max_uses']}`\n"
-        f"الحالة: `{'نشط' if coupon['is_active'] else 'معطل'}`"
-    )
-    
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text="🗑 حذف الكوبون", callback_data=f"admin_coupon_del_{coupon_id}"))
-    builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_coupons"))
-    
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="Markdown")
-
-@router.callback_query(F.data.startswith("admin_coupon_del_"))
-async def admin_coupon_delete(callback: types.CallbackQuery, is_admin: bool, user: dict):
-    """حذف كوبون"""
-    if not is_admin: return
-    
-    coupon_id = int(callback.data.split("_")[3])
-    await db_manager.delete_coupon(coupon_id)
-    
-    # تسجيل العملية
-    await db_manager.log_admin_action(
-        admin_id=callback.from_user.id,
-        action="DELETE_COUPON",
-        details=f"حذف كوبون ID: {coupon_id}"
-    )
-    
-    await callback.answer("✅ تم حذف الكوبون")
-    await admin_coupons_main(callback, is_admin, user)
-
 # --- الإحصائيات والتقارير ---
 @router.callback_query(F.data == "admin_stats")
 async def admin_stats(callback: types.CallbackQuery, is_admin: bool, user: dict):
@@ -933,31 +785,3 @@ async def admin_stats_top_products(callback: types.CallbackQuery, is_admin: bool
     builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_stats"))
     
     await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="Markdown")
-
-# --- سجل العمليات الإدارية ---
-@router.callback_query(F.data == "admin_audit_logs")
-async def admin_audit_logs(callback: types.CallbackQuery, is_admin: bool, user: dict):
-    """عرض آخر سجلات العمليات الإدارية"""
-    if not is_admin: return
-    
-    lang = get_user_language(user)
-    db = await db_manager.connect()
-    cursor = await db.execute("""
-        SELECT * FROM admin_audit_logs 
-        ORDER BY created_at DESC 
-        LIMIT 15
-    """)
-    logs = await cursor.fetchall()
-    
-    if not logs:
-        return await callback.answer("📭 السجل فارغ حالياً.", show_alert=True)
-    
-    text = "📋 *آخر العمليات الإدارية:*\n\n"
-    for log in logs:
-        dt = datetime.fromisoformat(log['created_at']).strftime('%m/%d %H:%M')
-        text += f"🕒 `{dt}` | `{log['action']}`\n└ {log['details']}\n\n"
-    
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_main"))
-    
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="Markdown")
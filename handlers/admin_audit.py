@@ -4,26 +4,64 @@
 """
 
 from aiogram import Router, F, types
+from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database.manager import db_manager
 from utils.translations import get_text, get_user_language
+from datetime import datetime, timedelta
 import logging
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-@router.callback_query(F.data == "admin_audit_logs")
-async def admin_audit_logs_main(callback: types.CallbackQuery, is_admin: bool, user: dict):
-    """عرض سجل العمليات الإدارية"""
-    if not is_admin:
-        return
+AUDIT_PAGE_SIZE = 20
+
+# فترات التصفية الزمنية المتاحة (بالأيام)
+AUDIT_PERIODS = [1, 7, 30, 365]
+
+
+def _describe_filters(filters: dict) -> str:
+    """وصف مختصر للفلاتر المفعلة"""
+    parts = []
+    if filters.get('admin_id') is not None:
+        parts.append(f"👤 `{filters['admin_id']}`")
+    if filters.get('action'):
+        parts.append(f"🔹 `{filters['action']}`")
+    if filters.get('target_type'):
+        parts.append(f"🎯 `{filters['target_type']}`")
+    if filters.get('days'):
+        parts.append(f"📅 آخر {filters['days']} يوم")
+    return " | ".join(parts)
+
+
+async def show_audit_page(callback: types.CallbackQuery, state: FSMContext, lang: str, before_id: int = None):
+    """عرض صفحة من السجل باستخدام keyset pagination مع الفلاتر المحفوظة"""
+    filters = (await state.get_data()).get('audit_filters', {})
     
-    lang = get_user_language(user)
-    logs = await db_manager.get_audit_logs(limit=20)
+    date_from = None
+    if filters.get('days'):
+        date_from = (datetime.utcnow() - timedelta(days=filters['days'])).strftime('%Y-%m-%d %H:%M:%S')
+    
+    # جلب عنصر إضافي لمعرفة وجود صفحة تالية دون COUNT(*)
+    logs = await db_manager.get_audit_logs(
+        limit=AUDIT_PAGE_SIZE + 1,
+        before_id=before_id,
+        admin_id=filters.get('admin_id'),
+        action=filters.get('action'),
+        target_type=filters.get('target_type'),
+        date_from=date_from
+    )
+    has_more = len(logs) > AUDIT_PAGE_SIZE
+    logs = logs[:AUDIT_PAGE_SIZE]
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="🔎 تصفية", callback_data="admin_audit_filter"),
+        InlineKeyboardButton(text="📊 إحصائيات السجل", callback_data="admin_audit_stats")
+    )
     
     if not logs:
-        builder = InlineKeyboardBuilder()
         builder.row(InlineKeyboardButton(
             text=get_text("btn_back", lang),
             callback_data="admin_main"
@@ -34,25 +72,31 @@ async def admin_audit_logs_main(callback: types.CallbackQuery, is_admin: bool, u
         )
     
     text = "📝 *سجل العمليات الإدارية*\n\n"
-    text += "آخر 20 عملية:\n\n"
+    description = _describe_filters(filters)
+    if description:
+        text += f"{description}\n\n"
     
     for log in logs:
-        admin_id = log['admin_id']
-        action = log['action']
         details = log['details'] or ''
-        created_at = log['created_at']
-        
-        text += f"🔹 `{action}`\n"
-        text += f"   👤 Admin: `{admin_id}`\n"
+        text += f"🔹 `{log['action']}` #{log['id']}\n"
+        text += f"   👤 Admin: `{log['admin_id']}`\n"
+        if log['target_type']:
+            text += f"   🎯 {log['target_type']} `{log['target_id'] or ''}`\n"
         if details:
             text += f"   📄 {details[:50]}\n"
-        text += f"   ⏰ {created_at}\n\n"
+        text += f"   ⏰ {log['created_at']}\n\n"
+    
+    nav_buttons = []
+    if before_id:
+        nav_buttons.append(InlineKeyboardButton(text="⏮ الأحدث", callback_data="admin_audit_page_0"))
+    if has_more:
+        nav_buttons.append(InlineKeyboardButton(
+            text=get_text("btn_next", lang),
+            callback_data=f"admin_audit_page_{logs[-1]['id']}"
+        ))
+    if nav_buttons:
+        builder.row(*nav_buttons)
     
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(
-        text="📊 إحصائيات السجل",
-        callback_data="admin_audit_stats"
-    ))
     builder.row(InlineKeyboardButton(
         text=get_text("btn_back", lang),
         callback_data="admin_main"
@@ -64,6 +108,112 @@ async def admin_audit_logs_main(callback: types.CallbackQuery, is_admin: bool, u
         parse_mode="Markdown"
     )
 
+@router.callback_query(F.data == "admin_audit_logs")
+async def admin_audit_logs_main(callback: types.CallbackQuery, state: FSMContext, is_admin: bool, user: dict):
+    """عرض سجل العمليات الإدارية (الصفحة الأولى بدون فلاتر)"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    await state.update_data(audit_filters={})
+    await show_audit_page(callback, state, lang)
+
+@router.callback_query(F.data.startswith("admin_audit_page_"))
+async def admin_audit_logs_page(callback: types.CallbackQuery, state: FSMContext, is_admin: bool, user: dict):
+    """الانتقال لصفحة أقدم من السجل"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    before_id = int(callback.data.split("_")[3])
+    await show_audit_page(callback, state, lang, before_id=before_id or None)
+
+@router.callback_query(F.data == "admin_audit_filter")
+async def admin_audit_filter_menu(callback: types.CallbackQuery, state: FSMContext, is_admin: bool, user: dict):
+    """قائمة فلاتر السجل"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    filters = (await state.get_data()).get('audit_filters', {})
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="👤 حسب الأدمن", callback_data="admin_audit_fmenu_admin"))
+    builder.row(InlineKeyboardButton(text="🔹 حسب العملية", callback_data="admin_audit_fmenu_action"))
+    builder.row(InlineKeyboardButton(text="🎯 حسب نوع الهدف", callback_data="admin_audit_fmenu_target"))
+    builder.row(InlineKeyboardButton(text="📅 حسب الفترة", callback_data="admin_audit_fmenu_period"))
+    builder.row(InlineKeyboardButton(text="🧹 مسح الفلاتر", callback_data="admin_audit_fclear"))
+    builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_audit_page_0"))
+    
+    await callback.message.edit_text(
+        f"🔎 *تصفية سجل العمليات*\n\n{_describe_filters(filters) or 'لا توجد فلاتر مفعلة'}",
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+
+@router.callback_query(F.data.startswith("admin_audit_fmenu_"))
+async def admin_audit_filter_options(callback: types.CallbackQuery, is_admin: bool, user: dict):
+    """عرض القيم المتاحة لفلتر معين"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    kind = callback.data.split("_")[3]
+    builder = InlineKeyboardBuilder()
+    
+    if kind == "admin":
+        for admin_id in await db_manager.get_audit_filter_values('admin_id'):
+            builder.row(InlineKeyboardButton(text=f"👤 {admin_id}", callback_data=f"admin_audit_fset_admin_{admin_id}"))
+    elif kind == "action":
+        for action in await db_manager.get_audit_filter_values('action', limit=15):
+            callback_data = f"admin_audit_fset_action_{action}"
+            if len(callback_data.encode()) > 64:  # حد تيليجرام لطول callback_data
+                continue
+            builder.row(InlineKeyboardButton(text=f"🔹 {action}", callback_data=callback_data))
+    elif kind == "target":
+        # من السجل نفسه، فأي نوع هدف جديد يظهر دون تعديل القائمة
+        for target_type in await db_manager.get_audit_filter_values('target_type', limit=15):
+            builder.row(InlineKeyboardButton(text=f"🎯 {target_type}", callback_data=f"admin_audit_fset_target_{target_type}"))
+    elif kind == "period":
+        for days in AUDIT_PERIODS:
+            builder.row(InlineKeyboardButton(text=f"📅 آخر {days} يوم", callback_data=f"admin_audit_fset_period_{days}"))
+    
+    builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_audit_filter"))
+    await callback.message.edit_text("🔎 اختر القيمة:", reply_markup=builder.as_markup())
+
+@router.callback_query(F.data.startswith("admin_audit_fset_"))
+async def admin_audit_filter_set(callback: types.CallbackQuery, state: FSMContext, is_admin: bool, user: dict):
+    """تفعيل فلتر وإعادة عرض الصفحة الأولى"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    # admin_audit_fset_{kind}_{value} - القيمة قد تحتوي على "_" (مثل أسماء العمليات)
+    _, _, _, kind, value = callback.data.split("_", 4)
+    
+    filters = dict((await state.get_data()).get('audit_filters', {}))
+    if kind == "admin":
+        filters['admin_id'] = int(value)
+    elif kind == "action":
+        filters['action'] = value
+    elif kind == "target":
+        filters['target_type'] = value
+    elif kind == "period":
+        filters['days'] = int(value)
+    
+    await state.update_data(audit_filters=filters)
+    await show_audit_page(callback, state, lang)
+
+@router.callback_query(F.data == "admin_audit_fclear")
+async def admin_audit_filter_clear(callback: types.CallbackQuery, state: FSMContext, is_admin: bool, user: dict):
+    """مسح جميع الفلاتر"""
+    if not is_admin:
+        return
+    
+    lang = get_user_language(user)
+    await state.update_data(audit_filters={})
+    await show_audit_page(callback, state, lang)
+
 @router.callback_query(F.data == "admin_audit_stats")
 async def admin_audit_stats(callback: types.CallbackQuery, is_admin: bool, user: dict):
     """عرض إحصائيات سجل العمليات"""
@@ -3,12 +3,13 @@
 يسمح للأدمن بإنشاء وإدارة كوبونات الخصم
 """
 
-from aiogram import Router, F, types
+from aiogram import Router, F, types, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import InlineKeyboardButton
+from aiogram.types import InlineKeyboardButton, BufferedInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database.manager import db_manager
+from services.coupon_service import coupon_service, CouponService
 from utils.translations import get_text, get_user_language
 from datetime import datetime, timedelta
 import logging
@@ -23,6 +24,7 @@ class CouponStates(StatesGroup):
     waiting_for_max_uses = State()
     waiting_for_min_amount = State()
     waiting_for_expires_days = State()
+    waiting_for_bulk_spec = State()
 
 @router.callback_query(F.data == "admin_coupons")
 async def admin_coupons_main(callback: types.CallbackQuery, is_admin: bool, user: dict):
@@ -34,6 +36,8 @@ async def admin_coupons_main(callback: types.CallbackQuery, is_admin: bool, user
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="➕ إنشاء كوبون جديد", callback_data="admin_coupon_create_start"))
     builder.row(InlineKeyboardButton(text="📋 عرض الكوبونات", callback_data="admin_coupon_list"))
+    builder.row(InlineKeyboardButton(text="📦 توليد كوبونات بالجملة", callback_data="admin_coupon_bulk_start"))
+    builder.row(InlineKeyboardButton(text="🗂 الدفعات السابقة", callback_data="admin_coupon_batches"))
     builder.row(InlineKeyboardButton(text="📊 إحصائيات الكوبونات", callback_data="admin_coupon_stats"))
     builder.row(InlineKeyboardButton(text=get_text("btn_back", lang), callback_data="admin_main"))
     
@@ -378,14 +382,11 @@ async def admin_coupon_view(callback: types.CallbackQuery, is_admin: bool, user:
     coupon_id = int(callback.data.split("_")[3])
     
     # جلب الكوبون من قاعدة البيانات
-    db = await db_manager.connect()
-    cursor = await db.execute("SELECT * FROM coupons WHERE id = ?", (coupon_id,))
-    coupon = await cursor.fetchone()
+    coupon = await db_manager.get_coupon_by_id(coupon_id)
     
     if not coupon:
         return await callback.answer("❌ الكوبون غير موجود", show_alert=True)
     
-    coupon = dict(coupon)
     status = "✅ نشط" if coupon['is_active'] else "❌ معطل"
     
     text = (
@@ -424,16 +425,13 @@ async def admin_coupon_toggle(callback: types.CallbackQuery, is_admin: bool):
     
     coupon_id = int(callback.data.split("_")[3])
     
-    db = await db_manager.connect()
-    cursor = await db.execute("SELECT is_active FROM coupons WHERE id = ?", (coupon_id,))
-    coupon = await cursor.fetchone()
+    coupon = await db_manager.get_coupon_by_id(coupon_id)
     
     if not coupon:
         return await callback.answer("❌ الكوبون غير موجود", show_alert=True)
     
     new_status = 0 if coupon['is_active'] else 1
-    await db.execute("UPDATE coupons SET is_active = ? WHERE id = ?", (new_status, coupon_id))
-    await db.commit()
+    await db_manager.set_coupon_active(coupon_id, new_status)
     
     await callback.answer(f"✅ تم {'تفعيل' if new_status else 'تعطيل'} الكوبون")
     
@@ -457,17 +455,166 @@ async def admin_coupon_delete(callback: types.CallbackQuery, is_admin: bool):
     
     coupon_id = int(callback.data.split("_")[3])
     
-    await db_manager.delete_coupon(coupon_id)
-    await callback.answer("✅ تم حذف الكوبون")
+    deleted = await db_manager.delete_coupon(coupon_id)
+    if deleted:
+        await callback.answer("✅ تم حذف الكوبون")
+    else:
+        await callback.answer("ℹ️ الكوبون مستخدم سابقاً، تم تعطيله بدلاً من حذفه", show_alert=True)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
         admin_id=callback.from_user.id,
-        action="COUPON_DELETE",
+        action="COUPON_DELETE" if deleted else "COUPON_TOGGLE",
         target_type="COUPON",
         target_id=coupon_id,
-        details="حذف كوبون"
+        details="حذف كوبون" if deleted else "تعطيل كوبون مستخدم بدلاً من حذفه"
     )
     
     # العودة لقائمة الكوبونات
     await admin_coupon_list(callback, is_admin, {})
+
+
+# ===== التوليد بالجملة =====
+@router.callback_query(F.data == "admin_coupon_bulk_start")
+async def admin_coupon_bulk_start(callback: types.CallbackQuery, state: FSMContext, is_admin: bool):
+    """بدء توليد دفعة كوبونات"""
+    if not is_admin:
+        return
+    
+    await state.set_state(CouponStates.waiting_for_bulk_spec)
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="❌ إلغاء", callback_data="admin_coupons"))
+    
+    await callback.message.edit_text(
+        "📦 *توليد كوبونات بالجملة* (استخدام واحد لكل كود)\n\n"
+        "أرسل المواصفات في سطر واحد:\n"
+        "`البادئة العدد النوع القيمة [أيام الصلاحية]`\n\n"
+        "مثال: `PROMO 1000 FIXED 5 30`\n"
+        "النوع: `FIXED` أو `PERCENTAGE`، والأيام `0` = بدون انتهاء.\n\n"
+        "📥 للاستيراد: أرسل ملف CSV (الأكواد في العمود الأول) مع تعليق:\n"
+        "`النوع القيمة [أيام الصلاحية]`",
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+
+def _parse_bulk_spec(parts: list) -> tuple:
+    """تحليل النوع والقيمة والأيام؛ يرفع ValueError عند الخطأ"""
+    coupon_type = parts[0].upper()
+    value = float(parts[1])
+    days = int(parts[2]) if len(parts) > 2 else 0
+    if coupon_type not in ("FIXED", "PERCENTAGE") or value <= 0 or days < 0:
+        raise ValueError
+    if coupon_type == "PERCENTAGE" and value > 100:
+        raise ValueError
+    return coupon_type, value, days
+
+async def _send_batch_result(message: types.Message, batch_id: str, created: int):
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="📤 تصدير CSV", callback_data=f"admin_coupon_export_{batch_id}"))
+    builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_coupons"))
+    await message.answer(
+        f"✅ تم إنشاء `{created}` كوبون\n🗂 الدفعة: `{batch_id}`",
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+    data = await coupon_service.export_batch_csv(batch_id)
+    await message.answer_document(BufferedInputFile(data, filename=f"{batch_id}.csv"))
+
+@router.message(CouponStates.waiting_for_bulk_spec, F.text)
+async def admin_coupon_bulk_generate(message: types.Message, state: FSMContext, is_admin: bool):
+    """توليد الدفعة من المواصفات"""
+    if not is_admin:
+        return
+    
+    parts = message.text.split()
+    try:
+        if len(parts) < 4:
+            raise ValueError
+        prefix, count = parts[0].upper(), int(parts[1])
+        coupon_type, value, days = _parse_bulk_spec(parts[2:])
+        if not prefix.isalnum() or len(prefix) > 12 or not 0 < count <= CouponService.MAX_BATCH_SIZE:
+            raise ValueError
+    except ValueError:
+        return await message.answer(
+            f"⚠️ صيغة غير صحيحة. مثال: `PROMO 1000 FIXED 5 30`\n"
+            f"(البادئة حروف/أرقام حتى 12 خانة، والعدد حتى {CouponService.MAX_BATCH_SIZE})",
+            parse_mode="Markdown"
+        )
+    
+    progress = await message.answer(f"⏳ جاري توليد {count} كوبون...")
+    batch_id, created = await coupon_service.create_batch(
+        prefix, count, coupon_type, value, expires_days=days, created_by=message.from_user.id
+    )
+    await state.clear()
+    
+    await db_manager.log_admin_action(
+        admin_id=message.from_user.id,
+        action="COUPON_BULK_CREATE",
+        target_type="COUPON",
+        details=f"دفعة {batch_id}: {created} كوبون {coupon_type} {value}"
+    )
+    await progress.delete()
+    await _send_batch_result(message, batch_id, created)
+
+@router.message(CouponStates.waiting_for_bulk_spec, F.document)
+async def admin_coupon_bulk_import(message: types.Message, state: FSMContext, is_admin: bool, bot: Bot):
+    """استيراد أكواد من ملف CSV"""
+    if not is_admin:
+        return
+    
+    try:
+        coupon_type, value, days = _parse_bulk_spec((message.caption or "").split())
+    except (ValueError, IndexError):
+        return await message.answer("⚠️ أضف تعليقاً للملف بالصيغة: `FIXED 5 30`", parse_mode="Markdown")
+    
+    file = await bot.download(message.document)
+    codes = CouponService.parse_codes_csv(file.read())
+    if not codes or len(codes) > CouponService.MAX_BATCH_SIZE:
+        return await message.answer(f"⚠️ الملف فارغ أو يتجاوز {CouponService.MAX_BATCH_SIZE} كود")
+    
+    batch_id, created = await coupon_service.create_batch(
+        "IMP", len(codes), coupon_type, value, expires_days=days, created_by=message.from_user.id, codes=codes
+    )
+    await state.clear()
+    
+    await db_manager.log_admin_action(
+        admin_id=message.from_user.id,
+        action="COUPON_BULK_IMPORT",
+        target_type="COUPON",
+        details=f"دفعة {batch_id}: {created}/{len(codes)} كوبون مستورد"
+    )
+    if created < len(codes):
+        await message.answer(f"ℹ️ تم تجاهل {len(codes) - created} كود موجود مسبقاً")
+    await _send_batch_result(message, batch_id, created)
+
+@router.callback_query(F.data == "admin_coupon_batches")
+async def admin_coupon_batches(callback: types.CallbackQuery, is_admin: bool):
+    """الدفعات السابقة مع إمكانية التصدير"""
+    if not is_admin:
+        return
+    
+    batches = await db_manager.get_coupon_batches()
+    builder = InlineKeyboardBuilder()
+    for batch in batches:
+        builder.row(InlineKeyboardButton(
+            text=f"📤 {batch['batch_id']} ({batch['used']}/{batch['count']})",
+            callback_data=f"admin_coupon_export_{batch['batch_id']}"
+        ))
+    builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_coupons"))
+    
+    await callback.message.edit_text(
+        "🗂 *دفعات الكوبونات* (المستخدم/الإجمالي)" if batches else "📭 لا توجد دفعات",
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+
+@router.callback_query(F.data.startswith("admin_coupon_export_"))
+async def admin_coupon_export(callback: types.CallbackQuery, is_admin: bool):
+    """تصدير دفعة كملف CSV"""
+    if not is_admin:
+        return
+    
+    batch_id = callback.data[len("admin_coupon_export_"):]
+    data = await coupon_service.export_batch_csv(batch_id)
+    await callback.message.answer_document(BufferedInputFile(data, filename=f"{batch_id}.csv"))
+    await callback.answer()
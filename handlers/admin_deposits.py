@@ -0,0 +1,268 @@
+"""
+طابور طلبات شحن الرصيد
+يسمح للطاقم بمراجعة الطلبات المعلقة ومعالجتها فردياً أو دفعة واحدة
+"""
+
+import asyncio
+import logging
+
+from aiogram import Router, F, types, Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from database.manager import db_manager
+from services.notification_router import notification_router
+from utils.notifications import notification_manager
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# عدد الطلبات المعروضة (وحجم الدفعة في المعالجة الجماعية)
+DEPOSIT_PAGE_SIZE = 10
+
+
+def get_deposit_actions(deposit_id: int) -> types.InlineKeyboardMarkup:
+    """أزرار قبول/رفض طلب شحن (البيانات محفوظة في الجدول وليس في الزر)"""
+    return types.InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ قبول", callback_data=f"admin_dep_approve_{deposit_id}"),
+        InlineKeyboardButton(text="❌ رفض", callback_data=f"admin_dep_reject_{deposit_id}")
+    ]])
+
+
+async def _finish_deposits(bot: Bot, deposits: list, admin_id: int, approved: bool):
+    """بعد المعالجة: سجل العمليات، إشعار المستخدمين، وتحديث رسائل الطاقم"""
+    for dep in deposits:
+        await db_manager.log_admin_action(
+            admin_id=admin_id,
+            action="APPROVE_DEPOSIT" if approved else "REJECT_DEPOSIT",
+            target_type="DEPOSIT",
+            target_id=dep['id'],
+            details=f"{'قبول' if approved else 'رفض'} شحن {dep['amount_usd']}$ للمستخدم {dep['user_id']}"
+        )
+
+    if approved:
+        messages = [
+            (dep['user_id'], f"✅ *تم قبول طلب الشحن!*\n\n💰 المبلغ المضاف: `{dep['amount_usd']}$`\n💳 رصيدك الحالي: `{dep['balance_after']:.2f}$`")
+            for dep in deposits
+        ]
+    else:
+        messages = [
+            (dep['user_id'], "❌ عذراً، تم رفض طلب شحن الرصيد الخاص بك. يرجى التواصل مع الدعم لمزيد من التفاصيل.")
+            for dep in deposits
+        ]
+    await asyncio.gather(*(notification_manager.notify_user(bot, uid, text) for uid, text in messages))
+
+    label = "✅ تم القبول" if approved else "❌ تم الرفض"
+    await asyncio.gather(*(notification_router.resolve(bot, "DEPOSIT", dep['id'], label) for dep in deposits))
+
+
+async def _release_claim(callback: types.CallbackQuery, deposit_id: int, won: bool):
+    """فشلت المعالجة: إلغاء الاستلام لتعود أزرار الطلب لبقية الطاقم"""
+    if won:
+        await notification_router.release(
+            callback.bot, "DEPOSIT", deposit_id, callback.from_user.id, get_deposit_actions(deposit_id)
+        )
+
+
+async def _answer_processed(callback: types.CallbackQuery, deposit_id: int):
+    deposit = await db_manager.get_deposit_request(deposit_id)
+    if not deposit:
+        return await callback.answer("❌ الطلب غير موجود", show_alert=True)
+    status = "مقبول ✅" if deposit['status'] == 'APPROVED' else "مرفوض ❌"
+    await callback.answer(f"ℹ️ تمت معالجة هذا الطلب مسبقاً ({status})", show_alert=True)
+
+
+async def _append_status(callback: types.CallbackQuery, line: str):
+    """إضافة نتيجة المعالجة لنص/تعليق رسالة الطلب وإزالة الأزرار"""
+    if callback.message.photo:
+        await callback.message.edit_caption(caption=(callback.message.caption or "") + line, reply_markup=None, parse_mode="Markdown")
+    else:
+        await callback.message.edit_text(text=(callback.message.text or "") + line, reply_markup=None, parse_mode="Markdown")
+
+
+# ===== الطابور =====
+@router.callback_query(F.data == "admin_deposits")
+async def deposits_queue(callback: types.CallbackQuery, state: FSMContext, is_operator: bool):
+    """عرض أقدم طلبات الشحن المعلقة"""
+    if not is_operator:
+        return await callback.answer("⛔️ غير مصرح لك", show_alert=True)
+
+    stats = await db_manager.get_deposit_queue_stats()
+    deposits = await db_manager.get_deposit_requests(limit=DEPOSIT_PAGE_SIZE)
+    # حفظ الدفعة المعروضة: المعالجة الجماعية تطبق على ما رآه الموظف فقط
+    await state.update_data(deposit_batch=[dep['id'] for dep in deposits])
+
+    builder = InlineKeyboardBuilder()
+    if not deposits:
+        text = "📭 لا توجد طلبات شحن معلقة."
+    else:
+        text = (
+            f"💰 *طلبات الشحن المعلقة*\n\n"
+            f"📊 العدد: `{stats['count']}` | المجموع: `{stats['total']:.2f}$`\n"
+            f"📄 المعروض: أقدم {len(deposits)}\n\n"
+        )
+        for dep in deposits:
+            text += f"• `#{dep['id']}` | @{dep['username'] or dep['user_id']} | `{dep['amount_usd']}$` | {dep['created_at'][5:16]}\n"
+            builder.row(InlineKeyboardButton(
+                text=f"🧾 #{dep['id']} | {dep['amount_usd']}$ | @{dep['username'] or dep['user_id']}",
+                callback_data=f"admin_dep_view_{dep['id']}"
+            ))
+        builder.row(
+            InlineKeyboardButton(text=f"✅ قبول الكل ({len(deposits)})", callback_data="admin_dep_bulk_approve"),
+            InlineKeyboardButton(text=f"❌ رفض الكل ({len(deposits)})", callback_data="admin_dep_bulk_reject")
+        )
+    builder.row(InlineKeyboardButton(text="🔄 تحديث", callback_data="admin_deposits"))
+    builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_main"))
+
+    if callback.message.photo:
+        await callback.message.delete()
+        await callback.message.answer(text, reply_markup=builder.as_markup(), parse_mode="Markdown")
+    else:
+        await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="Markdown")
+
+
+@router.callback_query(F.data.startswith("admin_dep_view_"))
+async def view_deposit(callback: types.CallbackQuery, is_operator: bool):
+    """عرض إيصال طلب شحن مع أزرار المعالجة"""
+    if not is_operator: return
+    deposit_id = int(callback.data.split("_")[3])
+    dep = await db_manager.get_deposit_request(deposit_id)
+    if not dep:
+        return await callback.answer("❌ الطلب غير موجود", show_alert=True)
+
+    caption = (
+        f"🧾 *طلب شحن #{dep['id']}*\n\n"
+        f"👤 المستخدم: @{dep['username'] or 'N/A'} (`{dep['user_id']}`)\n"
+        f"💵 المبلغ: {dep['amount_usd']}$\n"
+        f"🪙 ما يعادل: {dep['amount_local'] or 0:,.0f} ل.س\n"
+        f"💳 الطريقة: {dep['method_name'] or 'N/A'}\n"
+        f"📅 التاريخ: {dep['created_at']}\n"
+        f"📌 الحالة: `{dep['status']}`"
+    )
+    markup = get_deposit_actions(deposit_id) if dep['status'] == 'PENDING' else None
+    if dep['receipt_file_id']:
+        await callback.message.answer_photo(dep['receipt_file_id'], caption=caption, reply_markup=markup, parse_mode="Markdown")
+    else:
+        await callback.message.answer(caption, reply_markup=markup, parse_mode="Markdown")
+    await callback.answer()
+
+
+# ===== المعالجة الفردية =====
+@router.callback_query(F.data.startswith("admin_dep_approve_"))
+async def approve_deposit(callback: types.CallbackQuery, bot: Bot, is_operator: bool, is_super_admin: bool = False):
+    if not is_operator: return
+    deposit_id = int(callback.data.split("_")[3])
+
+    allowed, won, claim = await notification_router.claim(bot, "DEPOSIT", deposit_id, callback.from_user.id, callback.from_user.first_name)
+    if not allowed and not is_super_admin:
+        return await callback.answer(f"🔒 هذا الطلب مستلم من قبل {claim['claimed_by_name'] or claim['claimed_by']}", show_alert=True)
+
+    try:
+        approved = await db_manager.approve_deposit_requests([deposit_id], callback.from_user.id)
+    except Exception as e:
+        logger.error(f"Error approving deposit #{deposit_id}: {e}", exc_info=True)
+        await _release_claim(callback, deposit_id, won)
+        return await callback.answer("❌ حدث خطأ تقني أثناء معالجة الطلب", show_alert=True)
+    if not approved:
+        return await _answer_processed(callback, deposit_id)
+
+    dep = approved[0]
+    await _append_status(callback, f"\n\n✅ *تم القبول بواسطة:* {callback.from_user.first_name}\n💰 *الرصيد الجديد:* `{dep['balance_after']:.2f}$`")
+    await _finish_deposits(bot, approved, callback.from_user.id, approved=True)
+    await callback.answer("✅ تم شحن الرصيد بنجاح")
+
+
+@router.callback_query(F.data.startswith("admin_dep_reject_"))
+async def reject_deposit(callback: types.CallbackQuery, bot: Bot, is_operator: bool, is_super_admin: bool = False):
+    if not is_operator: return
+    deposit_id = int(callback.data.split("_")[3])
+
+    allowed, won, claim = await notification_router.claim(bot, "DEPOSIT", deposit_id, callback.from_user.id, callback.from_user.first_name)
+    if not allowed and not is_super_admin:
+        return await callback.answer(f"🔒 هذا الطلب مستلم من قبل {claim['claimed_by_name'] or claim['claimed_by']}", show_alert=True)
+
+    try:
+        rejected = await db_manager.reject_deposit_requests([deposit_id], callback.from_user.id)
+    except Exception as e:
+        logger.error(f"Error rejecting deposit #{deposit_id}: {e}", exc_info=True)
+        await _release_claim(callback, deposit_id, won)
+        return await callback.answer("❌ حدث خطأ تقني أثناء معالجة الطلب", show_alert=True)
+    if not rejected:
+        return await _answer_processed(callback, deposit_id)
+
+    await _append_status(callback, f"\n\n❌ *تم الرفض بواسطة:* {callback.from_user.first_name}")
+    await _finish_deposits(bot, rejected, callback.from_user.id, approved=False)
+    await callback.answer("❌ تم رفض الطلب")
+
+
+# ===== المعالجة الجماعية =====
+@router.callback_query(F.data.in_(["admin_dep_bulk_approve", "admin_dep_bulk_reject"]))
+async def bulk_confirm(callback: types.CallbackQuery, state: FSMContext, is_operator: bool):
+    """تأكيد قبل معالجة الدفعة المعروضة"""
+    if not is_operator: return
+    batch = (await state.get_data()).get('deposit_batch') or []
+    if not batch:
+        return await callback.answer("⚠️ لا توجد دفعة محددة، حدّث القائمة", show_alert=True)
+
+    approve = callback.data.endswith("approve")
+    action_text = "قبول" if approve else "رفض"
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text=f"⚠️ نعم، {action_text} {len(batch)} طلب", callback_data=f"admin_dep_bulkdo_{'approve' if approve else 'reject'}"),
+        InlineKeyboardButton(text="🔙 إلغاء", callback_data="admin_deposits")
+    )
+    await callback.message.edit_text(
+        f"❓ هل أنت متأكد من *{action_text}* طلبات الشحن التالية؟\n\n" + ", ".join(f"`#{i}`" for i in batch),
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+
+
+@router.callback_query(F.data.startswith("admin_dep_bulkdo_"))
+async def bulk_execute(callback: types.CallbackQuery, state: FSMContext, bot: Bot, is_operator: bool, is_super_admin: bool = False):
+    if not is_operator: return
+    batch = (await state.get_data()).get('deposit_batch') or []
+    await state.update_data(deposit_batch=[])
+    if not batch:
+        return await callback.answer("⚠️ تمت معالجة هذه الدفعة بالفعل", show_alert=True)
+
+    # استلام كل طلب قبل معالجته: ما استلمه موظف آخر يُستثنى (إلا لمدير النظام)
+    # رسائل الطاقم تتحدث مرة واحدة بعد المعالجة عبر resolve
+    staff_id = callback.from_user.id
+    owned, won_ids = [], []
+    for deposit_id in batch:
+        won, claim = await db_manager.claim_staff_item("DEPOSIT", str(deposit_id), staff_id, callback.from_user.first_name)
+        if won or is_super_admin or (claim is not None and claim['claimed_by'] == staff_id):
+            owned.append(deposit_id)
+            if won:
+                won_ids.append(deposit_id)
+    claimed_by_others = len(batch) - len(owned)
+
+    approve = callback.data.endswith("approve")
+    try:
+        if not owned:
+            processed = []
+        elif approve:
+            processed = await db_manager.approve_deposit_requests(owned, staff_id)
+        else:
+            processed = await db_manager.reject_deposit_requests(owned, staff_id)
+    except Exception as e:
+        logger.error(f"Error in bulk deposit processing: {e}", exc_info=True)
+        for deposit_id in won_ids:
+            await db_manager.release_staff_claim("DEPOSIT", str(deposit_id), staff_id)
+        return await callback.answer("❌ حدث خطأ، لم يتم تنفيذ أي عملية", show_alert=True)
+
+    await _finish_deposits(bot, processed, staff_id, approved=approve)
+
+    skipped = len(owned) - len(processed)
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="💰 الدفعة التالية", callback_data="admin_deposits"))
+    builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_main"))
+    await callback.message.edit_text(
+        f"{'✅ تم قبول' if approve else '❌ تم رفض'} `{len(processed)}` طلب"
+        + (f"\nℹ️ تم تخطي `{skipped}` طلب معالج مسبقاً" if skipped else "")
+        + (f"\n🔒 تم تخطي `{claimed_by_others}` طلب مستلم من موظف آخر" if claimed_by_others else ""),
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
@@ -2,10 +2,63 @@ from aiogram import Router, F, types, Bot
 from database.manager import db_manager
 from utils.keyboards import get_admin_order_actions
 from utils.translations import get_text, get_user_language
+from utils.money import Money, CURRENCY_SYP
 from config.settings import OrderStatus, UserRole
+from services.notification_router import notification_router
+from services.order_service import order_service
+from services.idempotency import idempotency_service, IdempotencyInProgress
 
 router = Router()
 
+async def _claim(callback: types.CallbackQuery, item_type: str, item_key, is_super_admin: bool) -> tuple[bool, bool]:
+    """
+    استلام العنصر للموظف الحالي، مع السماح لمدير النظام بالتجاوز
+    
+    Returns:
+        (allowed, won) - won إذا استلمه بهذا الضغط، ليُلغى الاستلام عند فشل المعالجة
+    """
+    allowed, won, claim = await notification_router.claim(
+        callback.bot, item_type, item_key, callback.from_user.id, callback.from_user.first_name
+    )
+    if allowed or is_super_admin:
+        return True, won
+    await callback.answer(
+        f"🔒 هذا العنصر مستلم من قبل {claim['claimed_by_name'] or claim['claimed_by']}",
+        show_alert=True
+    )
+    return False, False
+
+async def _release(callback: types.CallbackQuery, item_type: str, item_key, won: bool, reply_markup=None):
+    """فشلت المعالجة: إلغاء الاستلام الذي تم بهذا الضغط وإعادة الأزرار لبقية الطاقم"""
+    if won:
+        await notification_router.release(callback.bot, item_type, item_key, callback.from_user.id, reply_markup)
+
+async def _release_order(callback: types.CallbackQuery, order_id: int, won: bool):
+    if not won:
+        return
+    order = await db_manager.get_order(order_id)
+    active = order and order['status'] in (OrderStatus.PAID, OrderStatus.IN_PROGRESS, OrderStatus.PENDING_REVIEW)
+    await _release(callback, "ORDER", order_id, won, get_admin_order_actions(order_id, order['status']) if active else None)
+
+def _deposit_key(callback: types.CallbackQuery, user_id: int, receipt_key: str = None) -> str:
+    """مفتاح قرار الشحن: القبول والرفض يتشاركانه فلا يُنفذ إلا قرار واحد"""
+    if receipt_key:
+        return f"DEPOSIT:{user_id}_{receipt_key}"
+    # الأزرار القديمة لا تحمل مفتاح الإيصال، فنعتمد على رسالة الإدارة نفسها
+    return f"DEPOSIT_MSG:{callback.message.chat.id}_{callback.message.message_id}"
+
+async def _answer_deposit_replay(callback: types.CallbackQuery, outcome: dict):
+    if outcome['action'] == 'REJECTED':
+        await callback.answer("ℹ️ تم رفض هذا الطلب مسبقاً", show_alert=True)
+    elif outcome['success']:
+        await callback.answer(f"ℹ️ تم قبول هذا الطلب مسبقاً. الرصيد بعد الشحن: {outcome['result']:.2f}$", show_alert=True)
+    else:
+        await callback.answer(f"❌ فشل الشحن سابقاً: {outcome['result']}", show_alert=True)
+
+@router.callback_query(F.data == "staff_claimed")
+async def staff_item_claimed(callback: types.CallbackQuery):
+    await callback.answer("🔒 تم استلام هذا العنصر من قبل موظف آخر", show_alert=True)
+
 @router.callback_query(F.data == "admin_orders")
 async def list_active_orders(callback: types.CallbackQuery, is_support: bool):
     if not is_support: return
@@ -45,7 +98,7 @@ async def view_order_details(callback: types.CallbackQuery, is_support: bool):
         f"👤 المستخدم: @{order['username']} (`{order['telegram_id']}`)\n"
         f"📦 المنتج: {order['product_name']}\n"
         f"🆔 معرف اللاعب: `{order['player_id']}`\n"
-        f"💰 السعر: {order['price_local']:,.0f} ل.س ({order['price_usd']}$)\n"
+        f"💰 السعر: {Money(order['price_local_minor'], CURRENCY_SYP)} ({Money(order['price_usd_minor'])})\n"
         f"📍 الحالة: `{order['status']}`\n"
         f"📅 التاريخ: {order['created_at']}"
     )
@@ -53,12 +106,17 @@ async def view_order_details(callback: types.CallbackQuery, is_support: bool):
     await callback.message.edit_text(text, reply_markup=get_admin_order_actions(order_id, order['status']), parse_mode="Markdown")
 
 @router.callback_query(F.data.startswith("aord_approve_pay_"))
-async def approve_payment(callback: types.CallbackQuery, is_operator: bool, bot: Bot):
+async def approve_payment(callback: types.CallbackQuery, is_operator: bool, bot: Bot, is_super_admin: bool = False):
     if not is_operator: return
     order_id = int(callback.data.split("_")[3])
+    allowed, won = await _claim(callback, "ORDER", order_id, is_super_admin)
+    if not allowed: return
     order = await db_manager.get_order(order_id)
     
-    await db_manager.update_order_status(order_id, OrderStatus.IN_PROGRESS, operator_id=callback.from_user.id)
+    success, message = await order_service.change_status(order_id, OrderStatus.IN_PROGRESS, admin_id=callback.from_user.id)
+    if not success:
+        await _release_order(callback, order_id, won)
+        return await callback.answer(f"⚠️ {message}", show_alert=True)
     await callback.answer("✅ تم تأكيد الإيصال. الطلب الآن قيد التنفيذ.")
     
     user_data = await db_manager.get_user(order['telegram_id'])
@@ -68,12 +126,17 @@ async def approve_payment(callback: types.CallbackQuery, is_operator: bool, bot:
     await list_active_orders(callback, is_operator)
 
 @router.callback_query(F.data.startswith("aord_reject_pay_"))
-async def reject_payment(callback: types.CallbackQuery, is_operator: bool, bot: Bot):
+async def reject_payment(callback: types.CallbackQuery, is_operator: bool, bot: Bot, is_super_admin: bool = False):
     if not is_operator: return
     order_id = int(callback.data.split("_")[3])
+    allowed, won = await _claim(callback, "ORDER", order_id, is_super_admin)
+    if not allowed: return
     order = await db_manager.get_order(order_id)
     
-    await db_manager.update_order_status(order_id, OrderStatus.FAILED, admin_notes="تم رفض الإيصال")
+    success, message = await order_service.change_status(order_id, OrderStatus.FAILED, admin_id=callback.from_user.id, admin_notes="تم رفض الإيصال")
+    if not success:
+        await _release_order(callback, order_id, won)
+        return await callback.answer(f"⚠️ {message}", show_alert=True)
     await callback.answer("❌ تم رفض الإيصال.")
     
     user_data = await db_manager.get_user(order['telegram_id'])
@@ -83,12 +146,17 @@ async def reject_payment(callback: types.CallbackQuery, is_operator: bool, bot:
     await list_active_orders(callback, is_operator)
 
 @router.callback_query(F.data.startswith("aord_complete_"))
-async def complete_order(callback: types.CallbackQuery, is_operator: bool, bot: Bot):
+async def complete_order(callback: types.CallbackQuery, is_operator: bool, bot: Bot, is_super_admin: bool = False):
     if not is_operator: return
     order_id = int(callback.data.split("_")[2])
+    allowed, won = await _claim(callback, "ORDER", order_id, is_super_admin)
+    if not allowed: return
     order = await db_manager.get_order(order_id)
     
-    await db_manager.update_order_status(order_id, OrderStatus.COMPLETED, execution_type="MANUAL", operator_id=callback.from_user.id)
+    success, message = await order_service.change_status(order_id, OrderStatus.COMPLETED, admin_id=callback.from_user.id, execution_type="MANUAL")
+    if not success:
+        await _release_order(callback, order_id, won)
+        return await callback.answer(f"⚠️ {message}", show_alert=True)
     await callback.answer("✅ تم إكمال الطلب بنجاح.")
     
     user_data = await db_manager.get_user(order['telegram_id'])
@@ -98,12 +166,17 @@ async def complete_order(callback: types.CallbackQuery, is_operator: bool, bot:
     await list_active_orders(callback, is_operator)
 
 @router.callback_query(F.data.startswith("aord_cancel_"))
-async def cancel_order(callback: types.CallbackQuery, is_operator: bool, bot: Bot):
+async def cancel_order(callback: types.CallbackQuery, is_operator: bool, bot: Bot, is_super_admin: bool = False):
     if not is_operator: return
     order_id = int(callback.data.split("_")[2])
+    allowed, won = await _claim(callback, "ORDER", order_id, is_super_admin)
+    if not allowed: return
     order = await db_manager.get_order(order_id)
     
-    await db_manager.update_order_status(order_id, OrderStatus.CANCELED, operator_id=callback.from_user.id)
+    success, message = await order_service.change_status(order_id, OrderStatus.CANCELED, admin_id=callback.from_user.id)
+    if not success:
+        await _release_order(callback, order_id, won)
+        return await callback.answer(f"⚠️ {message}", show_alert=True)
     await callback.answer("❌ تم إلغاء الطلب.")
     
     user_data = await db_manager.get_user(order['telegram_id'])
@@ -113,8 +186,9 @@ async def cancel_order(callback: types.CallbackQuery, is_operator: bool, bot: Bo
     await list_active_orders(callback, is_operator)
 
 @router.callback_query(F.data.startswith("admin_pay_approve_"))
-async def admin_pay_approve(callback: types.CallbackQuery, bot: Bot):
+async def admin_pay_approve(callback: types.CallbackQuery, bot: Bot, is_super_admin: bool = False):
     """قبول طلب شحن الرصيد - إصلاح شامل"""
+    claim_key, won = None, False
     try:
         data = callback.data.split("_")
         # التحقق من صحة البيانات المرسلة في callback_data
@@ -124,13 +198,32 @@ async def admin_pay_approve(callback: types.CallbackQuery, bot: Bot):
         user_id = int(data[3])
         amount = float(data[4])
         
-        # تنفيذ عملية الشحن في قاعدة البيانات
-        success, result = await db_manager.update_user_balance(
-            user_id=user_id,
-            amount=amount,
-            log_type="DEPOSIT",
-            reason=f"شحن رصيد (موافقة الإدارة: {callback.from_user.id})"
-        )
+        # الأزرار القديمة لا تحمل مفتاح الإيصال
+        if len(data) > 5:
+            claim_key = f"{user_id}_{data[5]}"
+            allowed, won = await _claim(callback, "DEPOSIT", claim_key, is_super_admin)
+            if not allowed:
+                return
+        
+        # تنفيذ عملية الشحن في قاعدة البيانات (مرة واحدة فقط لكل إيصال)
+        async def credit():
+            success, result = await db_manager.update_user_balance(
+                user_id=user_id,
+                amount=amount,
+                log_type="DEPOSIT",
+                reason=f"شحن رصيد (موافقة الإدارة: {callback.from_user.id})"
+            )
+            return {'action': 'APPROVED', 'success': success, 'result': result}
+        
+        try:
+            replayed, outcome = await idempotency_service.run(
+                _deposit_key(callback, user_id, data[5] if len(data) > 5 else None), credit
+            )
+        except IdempotencyInProgress:
+            return await callback.answer("⏳ جاري معالجة هذا الطلب...")
+        if replayed:
+            return await _answer_deposit_replay(callback, outcome)
+        success, result = outcome['success'], outcome['result']
         
         if success:
             # تحديث الرسالة في قناة/مجموعة الإدارة
@@ -153,20 +246,42 @@ async def admin_pay_approve(callback: types.CallbackQuery, bot: Bot):
                 
             await callback.answer("✅ تم شحن الرصيد بنجاح")
         else:
+            # أزرار رسالة الموظف نفسه لم تتغير، فهي الأزرار الأصلية لبقية الطاقم
+            await _release(callback, "DEPOSIT", claim_key, won, callback.message.reply_markup)
             await callback.answer(f"❌ فشل الشحن: {result}", show_alert=True)
             
     except Exception as e:
         import logging
         logging.getLogger(__name__).error(f"Error in admin_pay_approve: {e}", exc_info=True)
+        await _release(callback, "DEPOSIT", claim_key, won, callback.message.reply_markup)
         await callback.answer("❌ حدث خطأ تقني أثناء معالجة الطلب", show_alert=True)
 
 @router.callback_query(F.data.startswith("admin_pay_reject_"))
-async def admin_pay_reject(callback: types.CallbackQuery, bot: Bot):
+async def admin_pay_reject(callback: types.CallbackQuery, bot: Bot, is_super_admin: bool = False):
     """رفض طلب شحن الرصيد"""
+    claim_key, won = None, False
     try:
         data = callback.data.split("_")
         user_id = int(data[3])
         
+        if len(data) > 4:
+            claim_key = f"{user_id}_{data[4]}"
+            allowed, won = await _claim(callback, "DEPOSIT", claim_key, is_super_admin)
+            if not allowed:
+                return
+        
+        async def reject():
+            return {'action': 'REJECTED', 'success': True, 'result': None}
+        
+        try:
+            replayed, outcome = await idempotency_service.run(
+                _deposit_key(callback, user_id, data[4] if len(data) > 4 else None), reject
+            )
+        except IdempotencyInProgress:
+            return await callback.answer("⏳ جاري معالجة هذا الطلب...")
+        if replayed:
+            return await _answer_deposit_replay(callback, outcome)
+        
         new_caption = callback.message.caption + f"\n\n❌ *تم الرفض بواسطة:* {callback.from_user.first_name}"
         if callback.message.photo:
             await callback.message.edit_caption(caption=new_caption, reply_markup=None, parse_mode="Markdown")
@@ -178,4 +293,5 @@ async def admin_pay_reject(callback: types.CallbackQuery, bot: Bot):
     except Exception as e:
         import logging
         logging.getLogger(__name__).error(f"Error in admin_pay_reject: {e}", exc_info=True)
+        await _release(callback, "DEPOSIT", claim_key, won, callback.message.reply_markup)
         await callback.answer("❌ حدث خطأ أثناء رفض الطلب", show_alert=True)
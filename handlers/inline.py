@@ -0,0 +1,67 @@
+"""
+الوضع المضمن (Inline Mode)
+@bot <بحث> يعرض بطاقات المنتجات بعملة المستخدم من نسخة الكتالوج في الذاكرة،
+وتيليجرام يحتفظ بالنتائج (cache_time) فتُخدم الاستعلامات المكررة دون الوصول للبوت
+"""
+
+from aiogram import Router, Bot, types
+from aiogram.types import (
+    InlineQueryResultArticle, InputTextMessageContent, InlineKeyboardMarkup, InlineKeyboardButton
+)
+from database.manager import db_manager
+from config.settings import INLINE_CACHE_TIME
+from utils.money import Money, CURRENCY_SYP
+import html
+import logging
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# أقصى عدد نتائج يقبله تيليجرام في الإجابة الواحدة
+INLINE_PAGE_SIZE = 50
+
+
+def _product_price(product: dict, currency: str, dollar_rate: int) -> Money:
+    price = Money(product['price_minor'])
+    return price.convert(dollar_rate) if currency == CURRENCY_SYP else price
+
+
+def _product_card(product: dict, price: Money, bot_username: str) -> InlineQueryResultArticle:
+    description = product.get('description') or ""
+    return InlineQueryResultArticle(
+        id=str(product['id']),
+        title=product['name'],
+        description=f"💰 {price}" + (f" — {description[:80]}" if description else ""),
+        # نص الرسالة يُفسر بوضع HTML الافتراضي؛ العنوان والوصف أعلاه نص عادي
+        input_message_content=InputTextMessageContent(
+            message_text=f"📦 {html.escape(product['name'])}\n💰 {price}"
+                         + (f"\n\n📄 {html.escape(description)}" if description else "")
+        ),
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="🛒 شراء", url=f"https://t.me/{bot_username}?start=prod_{product['id']}")
+        ]])
+    )
+
+
+@router.inline_query()
+async def inline_catalog(inline_query: types.InlineQuery, bot: Bot):
+    """بطاقات المنتجات المطابقة (النتائج شخصية لأن السعر بعملة المستخدم)"""
+    user = await db_manager.get_user(inline_query.from_user.id)
+    if user and user.get('is_blocked'):
+        return await inline_query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True)
+    currency = (user or {}).get('currency') or "USD"
+
+    catalog = await db_manager.get_catalog()
+    matches = catalog.search(inline_query.query)
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    page = matches[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(matches) else ""
+
+    me = await bot.me()
+    results = [
+        _product_card(product, _product_price(product, currency, catalog.dollar_rate), me.username)
+        for product in page
+    ]
+    await inline_query.answer(
+        results, cache_time=INLINE_CACHE_TIME, is_personal=True, next_offset=next_offset
+    )
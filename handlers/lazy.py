@@ -0,0 +1,71 @@
+"""
+Lazy Routers - تأجيل استيراد وحدات الإدارة نادرة الاستخدام
+- الموجه البديل يأخذ مكان الوحدة في ترتيب الموجهات دون استيرادها عند التشغيل
+- أول تحديث يخص الوحدة (بادئة callback_data أو حالة FSM من مجموعاتها) يستوردها
+  ويضم موجهها الحقيقي، ثم يتصرف كموجه عادي
+- أي تحديث آخر يمر عبره دون استيراد أو فحص فلاتر
+"""
+
+import importlib
+import logging
+import time
+from typing import Any, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRouter(Router):
+    """
+    موجه يستورد handlers.<module> عند أول حاجة إليه
+
+    Args:
+        module: اسم الوحدة (مثل "handlers.admin_coupons") التي تعرف router
+        callback_prefixes: كل بادئات callback_data التي تعالجها الوحدة
+        state_groups: أسماء StatesGroup في الوحدة (رسائل الحالات تبدأ بـ "<اسم>:")
+    """
+
+    def __init__(self, module: str, callback_prefixes: Tuple[str, ...] = (), state_groups: Tuple[str, ...] = ()):
+        super().__init__(name=f"lazy:{module}")
+        self.module = module
+        self.callback_prefixes = tuple(callback_prefixes)
+        self.state_prefixes = tuple(f"{group}:" for group in state_groups)
+        self.loaded = False
+
+    def _wanted(self, update_type: str, event: TelegramObject, raw_state: Any) -> bool:
+        if raw_state and raw_state.startswith(self.state_prefixes):
+            return True
+        if update_type == "callback_query":
+            return bool(event.data) and event.data.startswith(self.callback_prefixes)
+        return False
+
+    def load(self):
+        if self.loaded:
+            return
+        started = time.perf_counter()
+        self.include_router(importlib.import_module(self.module).router)
+        self.loaded = True
+        logger.info(f"Lazy router {self.module} loaded in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs: Any) -> Any:
+        if not self.loaded:
+            if not self._wanted(update_type, event, kwargs.get("raw_state")):
+                return UNHANDLED
+            self.load()
+        return await super().propagate_event(update_type=update_type, event=event, **kwargs)
+
+
+# وحدات الإدارة نادرة الاستخدام (الإحصائيات، الكوبونات، البث، سجل العمليات)
+LAZY_ADMIN_ROUTERS = (
+    ("handlers.admin_stats", ("admin_stats",), ()),
+    ("handlers.admin_broadcast", ("admin_broadcast", "broadcast_"), ("BroadcastStates",)),
+    ("handlers.admin_coupons", ("admin_coupon", "coupon_"), ("CouponStates",)),
+    ("handlers.admin_audit", ("admin_audit_",), ()),
+)
+
+
+def lazy_admin_routers() -> Tuple[LazyRouter, ...]:
+    return tuple(LazyRouter(module, prefixes, groups) for module, prefixes, groups in LAZY_ADMIN_ROUTERS)
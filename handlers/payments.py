@@ -6,7 +6,7 @@
 - تسجيل جميع العمليات في Audit Log
 """
 
-from aiogram import Router, F, types, Bot
+from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database.manager import db_manager
@@ -82,12 +82,7 @@ async def admin_add_pay_finish(message: types.Message, state: FSMContext, is_ope
     data = await state.get_data()
     description = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute(
-        "INSERT INTO payment_methods (name, description, is_active) VALUES (?, ?, 1)", 
-        (data['name'], description)
-    )
-    await db.commit()
+    await db_manager.add_payment_method(data['name'], description)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -170,9 +165,7 @@ async def admin_edit_pay_name_finish(message: types.Message, state: FSMContext,
     method_id = data['method_id']
     new_name = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE payment_methods SET name = ? WHERE id = ?", (new_name, method_id))
-    await db.commit()
+    await db_manager.update_payment_method(method_id, name=new_name)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -216,9 +209,7 @@ async def admin_edit_pay_desc_finish(message: types.Message, state: FSMContext,
     method_id = data['method_id']
     new_desc = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE payment_methods SET description = ? WHERE id = ?", (new_desc, method_id))
-    await db.commit()
+    await db_manager.update_payment_method(method_id, description=new_desc)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -250,9 +241,7 @@ async def admin_toggle_pay(callback: types.CallbackQuery, is_operator: bool):
     
     new_status = 0 if method['is_active'] else 1
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE payment_methods SET is_active = ? WHERE id = ?", (new_status, method_id))
-    await db.commit()
+    await db_manager.update_payment_method(method_id, is_active=bool(new_status))
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -307,21 +296,11 @@ async def admin_delete_pay_execute(callback: types.CallbackQuery, is_operator: b
     
     method_id = int(callback.data.split("_")[4])
     
-    db = await db_manager.connect()
     try:
-        # التحقق من وجود طلبات
-        cursor = await db.execute("SELECT COUNT(*) as count FROM orders WHERE payment_method_id = ?", (method_id,))
-        count = (await cursor.fetchone())['count']
-        
-        if count == 0:
-            # حذف نهائي إذا لم توجد طلبات
-            await db.execute("DELETE FROM payment_methods WHERE id = ?", (method_id,))
-            await db.commit()
+        # حذف نهائي إذا لم توجد طلبات مرتبطة، وإلا Soft Delete
+        if await db_manager.delete_payment_method(method_id):
             details = "حذف نهائي (لا توجد طلبات مرتبطة)"
         else:
-            # Soft Delete إذا وجدت طلبات
-            await db.execute("UPDATE payment_methods SET deleted_at = CURRENT_TIMESTAMP, is_active = 0 WHERE id = ?", (method_id,))
-            await db.commit()
             details = "حذف آمن (Soft Delete - توجد طلبات مرتبطة سابقة)"
             
         await callback.answer("✅ تم حذف طريقة الدفع")
@@ -337,82 +316,3 @@ async def admin_delete_pay_execute(callback: types.CallbackQuery, is_operator: b
     except Exception as e:
         logger.error(f"Error deleting payment method: {e}")
         await callback.answer("❌ حدث خطأ أثناء الحذف", show_alert=True)
-
-
-# ===== معالجة عمليات الشحن (Deposit Approval) =====
-@router.callback_query(F.data.startswith("admin_pay_approve_"))
-async def admin_approve_payment(callback: types.CallbackQuery, bot: Bot, is_operator: bool):
-    """قبول طلب شحن رصيد"""
-    if not is_operator:
-        await callback.answer("⛔️ غير مصرح لك", show_alert=True)
-        return
-    
-    parts = callback.data.split("_")
-    # التأكد من طول الأجزاء لتجنب IndexError
-    if len(parts) < 5:
-        await callback.answer("⚠️ بيانات غير مكتملة في الزر", show_alert=True)
-        return
-        
-    user_id, amount = int(parts[3]), float(parts[4])
-    
-    success, new_bal = await db_manager.update_user_balance(
-        user_id=user_id,
-        amount=amount,
-        log_type="DEPOSIT",
-        admin_id=callback.from_user.id,
-        reason="شحن يدوي - موافقة الأدمن"
-    )
-    
-    if success:
-        # تسجيل العملية
-        await db_manager.log_admin_action(
-            admin_id=callback.from_user.id,
-            action="APPROVE_DEPOSIT",
-            target_type="USER",
-            target_id=user_id,
-            details=f"قبول شحن رصيد بمبلغ {amount}$ للمستخدم {user_id}"
-        )
-        
-        await callback.message.edit_caption(
-            caption=callback.message.caption + "\n\n✅ *تم القبول بنجاح*", 
-            parse_mode="Markdown"
-        )
-        
-        try:
-            await bot.send_message(
-                user_id, 
-                f"✅ تم شحن رصيدك بمبلغ {amount}$.\nرصيدك الحالي: {new_bal:.2f}$"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send message to user {user_id}: {e}")
-    else:
-        await callback.answer(f"❌ فشل: {new_bal}", show_alert=True)
-
-
-@router.callback_query(F.data.startswith("admin_pay_reject_"))
-async def admin_reject_payment(callback: types.CallbackQuery, bot: Bot, is_operator: bool):
-    """رفض طلب شحن رصيد"""
-    if not is_operator:
-        await callback.answer("⛔️ غير مصرح لك", show_alert=True)
-        return
-    
-    user_id = int(callback.data.split("_")[3])
-    
-    # تسجيل العملية
-    await db_manager.log_admin_action(
-        admin_id=callback.from_user.id,
-        action="REJECT_DEPOSIT",
-        target_type="USER",
-        target_id=user_id,
-        details=f"رفض طلب شحن رصيد للمستخدم {user_id}"
-    )
-    
-    await callback.message.edit_caption(
-        caption=callback.message.caption + "\n\n❌ *تم الرفض*", 
-        parse_mode="Markdown"
-    )
-    
-    try:
-        await bot.send_message(user_id, "❌ تم رفض طلب شحن الرصيد.")
-    except Exception as e:
-        logger.error(f"Failed to send message to user {user_id}: {e}")
@@ -12,6 +12,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database.manager import db_manager
 from utils.keyboards import get_categories_keyboard, get_products_keyboard
+from utils.money import Money
 from config.settings import UserRole
 import logging
 
@@ -53,10 +54,10 @@ async def admin_products_main(callback: types.CallbackQuery, is_operator: bool):
         await callback.answer("⛔️ غير مصرح لك", show_alert=True)
         return
     
-    categories = await db_manager.get_categories(only_active=False)
+    catalog = await db_manager.get_catalog()
     await callback.message.edit_text(
         "🛒 *إدارة الأقسام والمنتجات*\n\nاختر قسماً لعرض منتجاته أو إدارتها:", 
-        reply_markup=get_categories_keyboard(categories, is_admin=True), 
+        reply_markup=get_categories_keyboard(catalog.all_categories, is_admin=True), 
         parse_mode="Markdown"
     )
     
@@ -68,6 +69,20 @@ async def admin_products_main(callback: types.CallbackQuery, is_operator: bool):
     )
 
 
+@router.callback_query(F.data.startswith("admin_catspg_"))
+async def admin_categories_page(callback: types.CallbackQuery, is_operator: bool):
+    """التنقل بين صفحات الأقسام"""
+    if not is_operator:
+        await callback.answer("⛔️ غير مصرح لك", show_alert=True)
+        return
+    
+    page = int(callback.data.split("_")[2])
+    catalog = await db_manager.get_catalog()
+    await callback.message.edit_reply_markup(
+        reply_markup=get_categories_keyboard(catalog.all_categories, is_admin=True, page=page)
+    )
+
+
 @router.callback_query(F.data == "admin_cat_add")
 async def admin_cat_add_start(callback: types.CallbackQuery, state: FSMContext, is_operator: bool):
     """بدء إضافة قسم جديد"""
@@ -104,10 +119,10 @@ async def admin_cat_add_finish(message: types.Message, state: FSMContext, is_ope
     
     await message.answer(f"✅ تم إضافة القسم: {category_name}")
     
-    categories = await db_manager.get_categories(only_active=False)
+    catalog = await db_manager.get_catalog()
     await message.answer(
         "🛒 إدارة الأقسام", 
-        reply_markup=get_categories_keyboard(categories, is_admin=True)
+        reply_markup=get_categories_keyboard(catalog.all_categories, is_admin=True)
     )
 
 
@@ -118,13 +133,17 @@ async def admin_cat_view(callback: types.CallbackQuery, is_operator: bool):
         await callback.answer("⛔️ غير مصرح لك", show_alert=True)
         return
     
-    cat_id = int(callback.data.split("_")[3])
-    products = await db_manager.get_products(category_id=cat_id, only_active=False)
-    rate = int(await db_manager.get_setting("dollar_rate", "12500"))
+    # admin_cat_view_<cat_id>[_<page>]
+    parts = callback.data.split("_")
+    cat_id = int(parts[3])
+    page = int(parts[4]) if len(parts) > 4 else 0
+    catalog = await db_manager.get_catalog()
     
     await callback.message.edit_text(
         f"📦 *منتجات القسم:*", 
-        reply_markup=get_products_keyboard(products, cat_id, rate, is_admin=True), 
+        reply_markup=get_products_keyboard(
+            catalog.products(cat_id, include_inactive=True), cat_id, catalog.dollar_rate, is_admin=True, page=page
+        ), 
         parse_mode="Markdown"
     )
 
@@ -252,10 +271,10 @@ async def finish_product_creation(message_or_callback, state: FSMContext):
     else:
         await message_or_callback.message.answer(msg_text)
     
-    products = await db_manager.get_products(category_id=data['cat_id'], only_active=False)
-    rate = int(await db_manager.get_setting("dollar_rate", "12500"))
-    
-    reply_markup = get_products_keyboard(products, data['cat_id'], rate, is_admin=True)
+    catalog = await db_manager.get_catalog()
+    reply_markup = get_products_keyboard(
+        catalog.products(data['cat_id'], include_inactive=True), data['cat_id'], catalog.dollar_rate, is_admin=True
+    )
     if isinstance(message_or_callback, types.Message):
         await message_or_callback.answer("📦 قائمة المنتجات", reply_markup=reply_markup)
     else:
@@ -284,7 +303,7 @@ async def admin_prod_view(callback: types.CallbackQuery, is_operator: bool):
         f"📦 *تفاصيل المنتج*\n\n"
         f"الاسم: `{product['name']}`\n"
         f"الوصف: `{product['description']}`\n"
-        f"السعر: `{product['price_usd']}$`\n"
+        f"السعر: `{Money(product['price_minor'])}`\n"
         f"النوع: `{type_text}`\n"
         f"الحالة: {status}\n"
     )
@@ -371,9 +390,7 @@ async def admin_prod_edit_name_finish(message: types.Message, state: FSMContext,
     product_id = data['product_id']
     new_name = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET name = ? WHERE id = ?", (new_name, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, name=new_name)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -426,9 +443,7 @@ async def admin_prod_edit_desc_finish(message: types.Message, state: FSMContext,
     product_id = data['product_id']
     new_desc = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET description = ? WHERE id = ?", (new_desc, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, description=new_desc)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -477,9 +492,7 @@ async def admin_prod_edit_price_finish(message: types.Message, state: FSMContext
         data = await state.get_data()
         product_id = data['product_id']
         
-        db = await db_manager.connect()
-        await db.execute("UPDATE products SET price_usd = ? WHERE id = ?", (new_price, product_id))
-        await db.commit()
+        await db_manager.update_product_price(product_id, Money.of(new_price))
         
         # تسجيل العملية
         await db_manager.log_admin_action(
@@ -529,9 +542,7 @@ async def admin_prod_set_type(callback: types.CallbackQuery, is_operator: bool):
     new_type = parts[3]
     product_id = int(parts[4])
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET type = ? WHERE id = ?", (new_type, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, type=new_type)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -565,9 +576,7 @@ async def admin_prod_toggle(callback: types.CallbackQuery, is_operator: bool):
     
     new_status = 0 if product['is_active'] else 1
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET is_active = ? WHERE id = ?", (new_status, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, is_active=new_status)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -630,9 +639,7 @@ async def admin_prod_delete_execute(callback: types.CallbackQuery, is_operator:
     product_name = product['name']
     
     # حذف المنتج
-    db = await db_manager.connect()
-    await db.execute("DELETE FROM products WHERE id = ?", (product_id,))
-    await db.commit()
+    await db_manager.delete_product(product_id)
     
     # تسجيل العملية
     await db_manager.log_admin_action(
@@ -646,12 +653,13 @@ async def admin_prod_delete_execute(callback: types.CallbackQuery, is_operator:
     await callback.answer(f"✅ تم حذف المنتج: {product_name}", show_alert=True)
     
     # العودة لقائمة المنتجات
-    products = await db_manager.get_products(category_id=category_id, only_active=False)
-    rate = int(await db_manager.get_setting("dollar_rate", "12500"))
+    catalog = await db_manager.get_catalog()
     
     await callback.message.edit_text(
         f"📦 *منتجات القسم:*", 
-        reply_markup=get_products_keyboard(products, category_id, rate, is_admin=True), 
+        reply_markup=get_products_keyboard(
+            catalog.products(category_id, include_inactive=True), category_id, catalog.dollar_rate, is_admin=True
+        ), 
         parse_mode="Markdown"
     )
 
@@ -681,9 +689,7 @@ async def admin_prod_set_provider(callback: types.CallbackQuery, state: FSMConte
     data = await state.get_data()
     product_id = data['product_id']
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET provider_id = ? WHERE id = ?", (provider_id, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, provider_id=provider_id)
     
     await callback.answer("✅ تم تحديث المزود")
     await state.clear()
@@ -714,9 +720,7 @@ async def admin_prod_edit_var_finish(message: types.Message, state: FSMContext,
     product_id = data['product_id']
     new_var = message.text.strip()
     
-    db = await db_manager.connect()
-    await db.execute("UPDATE products SET variation_id = ? WHERE id = ?", (new_var, product_id))
-    await db.commit()
+    await db_manager.update_product(product_id, variation_id=new_var)
     
     await state.clear()
     await message.answer(f"✅ تم تحديث معرف المزود إلى: {new_var}")
@@ -0,0 +1,172 @@
+"""
+Callback Routing - توجيه callback_query بشجرة بادئات
+- بادئات callback_data تُستخرج من فلاتر المعالجات نفسها:
+  F.data.startswith(...) و F.data == ... و F.data.in_(...)
+- كل callback يمر فقط على الموجهات التي تملك بادئة تطابقه (بنفس ترتيبها الأصلي)
+  بدل تجربة فلاتر كل الموجهات بالتسلسل؛ الكلفة تتبع طول callback_data لا عدد المعالجات
+- معالج بدون فلتر data قابل للتحليل يجعل موجهه "عاماً" يُجرب مع كل callback كما كان
+- باقي أنواع التحديثات (الرسائل، الاستعلامات المضمنة) تمر بالتسلسل المعتاد
+"""
+
+import operator
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import TelegramObject
+from magic_filter.operations import CallOperation, ComparatorOperation, FunctionOperation, GetAttributeOperation
+from magic_filter.util import in_op
+
+from handlers.lazy import LazyRouter
+
+
+def handler_prefixes(handler: HandlerObject) -> Optional[FrozenSet[str]]:
+    """
+    بادئات callback_data التي لا يطابق المعالج بدونها، أو None إذا تعذر التحليل
+    (القيمة المطابقة تماماً بـ == أو in_ تُعامل كبادئة أيضاً)
+    """
+    for filter_object in handler.filters or ():
+        magic = getattr(filter_object, "magic", None)
+        operations = getattr(magic, "_operations", ())
+        if len(operations) < 2 or not isinstance(operations[0], GetAttributeOperation) or operations[0].name != "data":
+            continue
+        if (len(operations) == 3 and isinstance(operations[1], GetAttributeOperation)
+                and operations[1].name == "startswith" and isinstance(operations[2], CallOperation)
+                and len(operations[2].args) == 1):
+            prefixes = operations[2].args[0]
+            prefixes = (prefixes,) if isinstance(prefixes, str) else prefixes
+        elif (len(operations) == 2 and isinstance(operations[1], ComparatorOperation)
+                and operations[1].comparator is operator.eq):
+            prefixes = (operations[1].right,)
+        elif (len(operations) == 2 and isinstance(operations[1], FunctionOperation)
+                and operations[1].function is in_op and len(operations[1].args) == 1):
+            prefixes = operations[1].args[0]
+        else:
+            continue
+        if all(isinstance(prefix, str) for prefix in prefixes):
+            return frozenset(prefixes)
+    return None
+
+
+def router_prefixes(router: Router) -> Optional[FrozenSet[str]]:
+    """كل بادئات موجه ومتفرعاته، أو None إذا كان فيه معالج callback غير قابل للتحليل"""
+    if isinstance(router, LazyRouter) and not router.loaded:
+        return frozenset(router.callback_prefixes)
+    prefixes = set()
+    for nested in router.chain_tail:
+        for handler in nested.callback_query.handlers:
+            handler_set = handler_prefixes(handler)
+            if handler_set is None:
+                return None
+            prefixes |= handler_set
+    return frozenset(prefixes)
+
+
+class PrefixTrie:
+    """شجرة أحرف؛ كل عقدة تحمل قناع بتات للمالكين الذين تنتهي بادئتهم عندها"""
+
+    __slots__ = ("_root",)
+
+    def __init__(self):
+        # العقدة: [الأبناء، القناع]
+        self._root: list = [{}, 0]
+
+    def add(self, prefix: str, mask: int):
+        node = self._root
+        for char in prefix:
+            node = node[0].setdefault(char, [{}, 0])
+        node[1] |= mask
+
+    def match(self, text: str) -> int:
+        """اتحاد أقنعة كل البادئات التي يبدأ بها النص"""
+        node = self._root
+        mask = node[1]
+        for char in text:
+            node = node[0].get(char)
+            if node is None:
+                break
+            mask |= node[1]
+        return mask
+
+
+class CallbackPrefixRouter(Router):
+    """
+    حاوية للموجهات بالترتيب؛ callback_query يُوجه بشجرة البادئات
+
+    الاستخدام:
+        dp.include_router(CallbackPrefixRouter(admin.router, products.router, ...))
+    """
+
+    def __init__(self, *routers: Router, name: str = "callback-prefix"):
+        super().__init__(name=name)
+        self._trie: Optional[PrefixTrie] = None
+        self._wildcard_mask = 0
+        # القناع -> الموجهات المرشحة بترتيبها (عدد الأقنعة المختلفة صغير)
+        self._routes: Dict[int, Tuple[Router, ...]] = {}
+        if routers:
+            self.include_routers(*routers)
+
+    def include_router(self, router: Router) -> Router:
+        self._trie = None
+        return super().include_router(router)
+
+    def _build(self):
+        trie = PrefixTrie()
+        wildcard = 0
+        for position, router in enumerate(self.sub_routers):
+            prefixes = router_prefixes(router)
+            if prefixes is None:
+                wildcard |= 1 << position
+                continue
+            for prefix in prefixes:
+                trie.add(prefix, 1 << position)
+        self._wildcard_mask = wildcard
+        self._routes = {}
+        self._trie = trie
+
+    def routes(self, data: Optional[str]) -> Tuple[Router, ...]:
+        """الموجهات التي قد تعالج callback_data بالترتيب الأصلي"""
+        if self._trie is None:
+            self._build()
+        mask = self._wildcard_mask | (self._trie.match(data) if data else 0)
+        routes = self._routes.get(mask)
+        if routes is None:
+            routes = tuple(router for position, router in enumerate(self.sub_routers) if mask >> position & 1)
+            self._routes[mask] = routes
+        return routes
+
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs: Any) -> Any:
+        if update_type != "callback_query":
+            return await super().propagate_event(update_type=update_type, event=event, **kwargs)
+        # الحاوية بلا معالجات أو ميدلوير خاص؛ مباشرة إلى الموجهات المرشحة
+        kwargs.update(event_router=self)
+        for router in self.routes(event.data):
+            response = await router.propagate_event(update_type=update_type, event=event, **kwargs)
+            if response is not UNHANDLED:
+                return response
+        return UNHANDLED
+
+
+def filter_evaluations(container: CallbackPrefixRouter, samples: Iterable[str]) -> Tuple[float, float]:
+    """
+    متوسط عدد المعالجات التي تُفحص فلاترها لكل callback: (بالتسلسل، بشجرة البادئات)
+    المعالج يُعد مطابقاً إذا بدأت البيانات بإحدى بادئاته؛ غير القابل للتحليل يُفحص ولا يُعد مطابقاً
+    """
+    def count(routers: Iterable[Router], data: str) -> int:
+        checked = 0
+        for router in routers:
+            for nested in router.chain_tail:
+                for handler in nested.callback_query.handlers:
+                    checked += 1
+                    prefixes = handler_prefixes(handler)
+                    if prefixes is not None and data.startswith(tuple(prefixes)):
+                        return checked
+        return checked
+
+    samples: List[str] = list(samples)
+    if not samples:
+        return 0.0, 0.0
+    chain = sum(count(container.sub_routers, data) for data in samples) / len(samples)
+    routed = sum(count(container.routes(data), data) for data in samples) / len(samples)
+    return chain, routed
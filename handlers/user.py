@@ -7,16 +7,24 @@
 """
 
 from aiogram import Router, F, types, Bot
-from aiogram.filters import CommandStart, StateFilter
+from aiogram.filters import Command, CommandObject, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database.manager import db_manager
 from services.order_service import order_service
-from utils.keyboards import get_main_menu, get_categories_keyboard, get_products_keyboard, get_order_confirm_keyboard
+from services.notification_router import notification_router
+from services.idempotency import idempotency_service, IdempotencyInProgress
+from utils.keyboards import (
+    get_main_menu, get_store_categories_keyboard, get_store_products_keyboard,
+    get_order_confirm_keyboard, get_search_results_keyboard
+)
 from utils.translations import get_text, get_user_language, TRANSLATIONS
+from utils.filters import MenuButton
+from utils.money import Money, CURRENCY_SYP
 from config.settings import OrderStatus, UserRole
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+import html
 import logging
 
 router = Router()
@@ -34,8 +42,31 @@ class RechargeProcess(StatesGroup):
     waiting_for_amount = State()
     waiting_for_receipt = State()
 
+class SearchProcess(StatesGroup):
+    waiting_for_query = State()
+
+# أقصى عدد نتائج في رسالة البحث
+SEARCH_RESULTS_LIMIT = 10
+
 
 # ===== الأوامر الأساسية =====
+@router.message(CommandStart(deep_link=True, magic=F.args.regexp(r"^prod_\d+$")))
+async def cmd_start_product(message: types.Message, command: CommandObject, user_role: str, user: dict):
+    """رابط منتج من الوضع المضمن (/start prod_<id>): عرض المنتج مع زر الشراء"""
+    if not get_user_language(user):
+        return await cmd_start(message, user_role, user)
+    catalog = await db_manager.get_catalog()
+    product = catalog.product(int(command.args.split("_")[1]))
+    if not product:
+        return await message.answer("❌ المنتج غير موجود")
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="🛒 شراء", callback_data=f"prod_{product['id']}"))
+    await message.answer(
+        f"📦 {html.escape(product['name'])}\n💰 {Money(product['price_minor'])}",
+        reply_markup=builder.as_markup()
+    )
+
+
 @router.message(CommandStart())
 async def cmd_start(message: types.Message, user_role: str, user: dict):
     """رسالة الترحيب مع اختيار اللغة للمستخدمين الجدد"""
@@ -59,7 +90,7 @@ async def cmd_start(message: types.Message, user_role: str, user: dict):
         reply_markup=get_main_menu(user_role, lang or "ar")
     )
 
-@router.message(F.text == "🌐 Language / اللغة")
+@router.message(MenuButton("btn_language"))
 async def change_language_cmd(message: types.Message):
     """تغيير اللغة من القائمة الرئيسية"""
     builder = InlineKeyboardBuilder()
@@ -75,7 +106,7 @@ async def change_language_cmd(message: types.Message):
 
 
 # ===== المتجر والمنتجات =====
-@router.message(F.text.in_(["🛒 المتجر", "🛒 Store"]))
+@router.message(MenuButton("btn_store"))
 async def show_categories(message: types.Message, user: dict):
     """عرض أقسام المتجر"""
     lang = get_user_language(user) or "ar"
@@ -86,47 +117,101 @@ async def show_categories(message: types.Message, user: dict):
             else "⚠️ لديك طلب مفتوح بالفعل، يرجى انتظاره."
         )
     
-    categories = await db_manager.get_categories()
+    catalog = await db_manager.get_catalog()
     await message.answer(
         get_text("choose_category", lang) if "choose_category" in TRANSLATIONS 
         else "📁 اختر القسم:", 
-        reply_markup=get_categories_keyboard(categories)
+        reply_markup=get_store_categories_keyboard(catalog)
+    )
+
+
+# ===== البحث عن المنتجات =====
+async def _answer_product_search(message: types.Message, query: str, lang: str):
+    products = await db_manager.search_products(query, limit=SEARCH_RESULTS_LIMIT)
+    # الرد يُرسل بوضع HTML الافتراضي: "<" أو "&" في نص المستخدم يكسر التنسيق
+    safe_query = html.escape(query)
+    if not products:
+        return await message.answer(get_text("product_search_empty", lang, query=safe_query))
+    catalog = await db_manager.get_catalog()
+    await message.answer(
+        get_text("product_search_results", lang, query=safe_query),
+        reply_markup=get_search_results_keyboard(products, catalog.dollar_rate)
     )
 
 
+@router.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext, user: dict):
+    """بحث عن منتج: /search <كلمات> أو /search ثم إرسال الكلمات"""
+    lang = get_user_language(user) or "ar"
+    if command.args:
+        return await _answer_product_search(message, command.args.strip(), lang)
+    await state.set_state(SearchProcess.waiting_for_query)
+    await message.answer(get_text("product_search_prompt", lang))
+
+
+@router.message(F.text, SearchProcess.waiting_for_query)
+async def process_search_query(message: types.Message, state: FSMContext, user: dict):
+    await state.clear()
+    await _answer_product_search(message, message.text.strip(), get_user_language(user) or "ar")
+
+
 @router.callback_query(F.data == "back_to_categories")
 async def back_to_categories(callback: types.CallbackQuery):
     """العودة لأقسام المتجر"""
-    categories = await db_manager.get_categories()
-    await callback.message.edit_text("📁 اختر القسم:", reply_markup=get_categories_keyboard(categories))
+    catalog = await db_manager.get_catalog()
+    await callback.message.edit_text("📁 اختر القسم:", reply_markup=get_store_categories_keyboard(catalog))
+
+
+@router.callback_query(F.data.startswith("catspg_"))
+async def categories_page(callback: types.CallbackQuery):
+    """التنقل بين صفحات الأقسام (الصفحة تُقتطع من نسخة الكتالوج)"""
+    page = int(callback.data.split("_")[1])
+    catalog = await db_manager.get_catalog()
+    await callback.message.edit_reply_markup(reply_markup=get_store_categories_keyboard(catalog, page))
+
+
+@router.callback_query(F.data.startswith("catpg_"))
+async def products_page(callback: types.CallbackQuery):
+    """التنقل بين صفحات منتجات القسم"""
+    _, cat_id, page = callback.data.split("_")
+    catalog = await db_manager.get_catalog()
+    await callback.message.edit_reply_markup(reply_markup=get_store_products_keyboard(catalog, int(cat_id), int(page)))
+
+
+@router.callback_query(F.data == "noop")
+async def noop_button(callback: types.CallbackQuery):
+    """أزرار العرض فقط (مثل رقم الصفحة)"""
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("cat_"))
 async def show_products(callback: types.CallbackQuery):
     """عرض منتجات قسم معين"""
     cat_id = int(callback.data.split("_")[1])
-    products = await db_manager.get_products(category_id=cat_id)
-    rate = int(await db_manager.get_setting("dollar_rate", "12500"))
-    await callback.message.edit_text("📦 اختر المنتج:", reply_markup=get_products_keyboard(products, cat_id, rate))
+    catalog = await db_manager.get_catalog()
+    await callback.message.edit_text(
+        "📦 اختر المنتج:", reply_markup=get_store_products_keyboard(catalog, cat_id)
+    )
 
 
 @router.callback_query(F.data.startswith("prod_"))
 async def product_details(callback: types.CallbackQuery, state: FSMContext):
     """عرض تفاصيل منتج وطلب معرف اللاعب"""
     prod_id = int(callback.data.split("_")[1])
-    product = await db_manager.get_product(prod_id)
+    catalog = await db_manager.get_catalog()
+    product = catalog.product(prod_id)
     
     if not product:
         await callback.answer("❌ المنتج غير موجود", show_alert=True)
         return
     
-    rate = int(await db_manager.get_setting("dollar_rate", "12500"))
-    local_price = product['price_usd'] * rate
+    rate = catalog.dollar_rate
+    price = Money(product['price_minor'])
+    local_price = price.convert(rate)
     
     await state.update_data(
         selected_prod_id=prod_id, 
-        price_usd=product['price_usd'], 
-        price_local=local_price, 
+        price_minor=price.minor, 
         rate=rate
     )
     await state.set_state(OrderProcess.waiting_for_player_id)
@@ -134,8 +219,8 @@ async def product_details(callback: types.CallbackQuery, state: FSMContext):
     text = (
         f"📝 *{product['name']}*\n\n"
         f"📄 {product['description']}\n\n"
-        f"💰 السعر: {product['price_usd']}$\n"
-        f"💵 السعر بالليرة: {local_price:,.0f} ل.س\n"
+        f"💰 السعر: {price}\n"
+        f"💵 السعر بالليرة: {local_price}\n"
         f"📊 سعر الصرف: {rate} ل.س\n\n"
         f"🆔 أدخل معرف اللاعب (Player ID):"
     )
@@ -162,7 +247,7 @@ async def process_player_id(message: types.Message, state: FSMContext, user: dic
         f"⚠️ *تأكيد الطلب*\n\n"
         f"📦 المنتج: {product['name']}\n"
         f"🆔 المعرف: `{player_id}`\n"
-        f"💰 السعر: {data['price_local']:,.0f} ل.س ({data['price_usd']}$)\n\n"
+        f"💰 السعر: {Money(data['price_minor']).convert(data['rate'])} ({Money(data['price_minor'])})\n\n"
         f"سيتم الخصم من رصيدك الداخلي عند التأكيد.\n"
         f"💰 رصيدك الحالي: {user['balance']:.2f}$"
     )
@@ -188,21 +273,24 @@ async def process_coupon(message: types.Message, state: FSMContext, user: dict):
     coupon_code = message.text.strip().upper()
     data = await state.get_data()
     
+    # الخصم يُحسب دائماً من السعر الأصلي (إعادة إدخال كوبون لا تضاعف الخصم)
+    original_price = Money(data.get('original_price_minor', data['price_minor']))
+    
     # التحقق من الكوبون
-    is_valid, msg, discount = await db_manager.validate_coupon(coupon_code, user['telegram_id'], data['price_usd'])
+    is_valid, msg, discount = await db_manager.validate_coupon(coupon_code, user['telegram_id'], original_price)
     
     if not is_valid:
         return await message.answer(f"❌ {msg}")
     
     # حساب السعر الجديد
-    new_price_usd = max(0, data['price_usd'] - discount)
-    new_price_local = new_price_usd * data['rate']
+    new_price_usd = max(Money(0), original_price - discount)
+    new_price_local = new_price_usd.convert(data['rate'])
     
     await state.update_data(
-        price_usd=new_price_usd, 
-        price_local=new_price_local, 
+        original_price_minor=original_price.minor,
+        price_minor=new_price_usd.minor, 
         coupon_code=coupon_code, 
-        discount_amount=discount
+        discount_minor=discount.minor
     )
     await state.set_state(OrderProcess.confirming)
     
@@ -212,9 +300,9 @@ async def process_coupon(message: types.Message, state: FSMContext, user: dict):
         f"⚠️ *تأكيد الطلب (بعد الخصم)*\n\n"
         f"📦 المنتج: {product['name']}\n"
         f"🆔 المعرف: `{data['player_id']}`\n"
-        f"💰 السعر الأصلي: {data.get('original_price_usd', data['price_usd'] + discount):.2f}$\n"
-        f"🎟️ الخصم: -{discount:.2f}$\n"
-        f"💵 السعر النهائي: {new_price_local:,.0f} ل.س ({new_price_usd:.2f}$)\n\n"
+        f"💰 السعر الأصلي: {original_price}\n"
+        f"🎟️ الخصم: -{discount}\n"
+        f"💵 السعر النهائي: {new_price_local} ({new_price_usd})\n\n"
         f"سيتم الخصم من رصيدك الداخلي عند التأكيد.\n"
         f"💰 رصيدك الحالي: {user['balance']:.2f}$"
     )
@@ -226,18 +314,33 @@ async def process_coupon(message: types.Message, state: FSMContext, user: dict):
 async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext, user: dict, bot: Bot):
     """تأكيد الشراء باستخدام OrderService"""
     data = await state.get_data()
+    
+    async def place_order():
+        success, message, order_id = await order_service.create_order(
+            user_id=user['telegram_id'],
+            product_id=data['selected_prod_id'],
+            player_id=data['player_id'],
+            payment_method_id=None,  # الدفع من الرصيد
+            coupon_code=data.get('coupon_code')
+        )
+        return {'success': success, 'message': message, 'order_id': order_id}
+    
+    # رسالة التأكيد فريدة لكل محاولة شراء، فالضغط المكرر عليها لا ينشئ طلباً ثانياً
+    try:
+        replayed, result = await idempotency_service.run(
+            f"BUY:{user['telegram_id']}:{callback.message.message_id}", place_order
+        )
+    except IdempotencyInProgress:
+        return await callback.answer("⏳ جاري معالجة طلبك...")
+    
+    if replayed:
+        if result['success']:
+            return await callback.answer(f"ℹ️ تم إنشاء هذا الطلب مسبقاً: #{result['order_id']}", show_alert=True)
+        return await callback.answer(f"❌ {result['message']}", show_alert=True)
+    
+    success, message, order_id = result['success'], result['message'], result['order_id']
     product_id = data['selected_prod_id']
     player_id = data['player_id']
-    coupon_code = data.get('coupon_code')
-    
-    # إنشاء الطلب باستخدام OrderService
-    success, message, order_id = await order_service.create_order(
-        user_id=user['telegram_id'],
-        product_id=product_id,
-        player_id=player_id,
-        payment_method_id=None,  # الدفع من الرصيد
-        coupon_code=coupon_code
-    )
     
     if success:
         product = await db_manager.get_product(product_id)
@@ -249,23 +352,18 @@ async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext, use
             parse_mode="Markdown"
         )
         
-        # إشعار الأدمن
-        from config.settings import ADMIN_ID
+        # إشعار جميع الطاقم المناوب (أول من يضغط يستلم الطلب)
         from utils.keyboards import get_admin_order_actions
-        try:
-            await bot.send_message(
-                ADMIN_ID,
-                f"🆕 *طلب جديد (مدفوع من الرصيد)*\n\n"
-                f"🆔 رقم الطلب: `#{order_id}`\n"
-                f"👤 المستخدم: @{user.get('username', 'N/A')} (`{user['telegram_id']}`)\n"
-                f"📦 المنتج: {product['name']}\n"
-                f"🆔 معرف اللاعب: `{player_id}`\n"
-                f"💰 المبلغ: {data.get('price_usd', 0):.2f}$",
-                reply_markup=get_admin_order_actions(order_id, OrderStatus.PAID),
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify admin: {e}")
+        await notification_router.dispatch(
+            bot, "ORDER", order_id,
+            f"🆕 *طلب جديد (مدفوع من الرصيد)*\n\n"
+            f"🆔 رقم الطلب: `#{order_id}`\n"
+            f"👤 المستخدم: @{user.get('username', 'N/A')} (`{user['telegram_id']}`)\n"
+            f"📦 المنتج: {product['name']}\n"
+            f"🆔 معرف اللاعب: `{player_id}`\n"
+            f"💰 المبلغ: {Money(data.get('price_minor', 0))}",
+            reply_markup=get_admin_order_actions(order_id, OrderStatus.PAID)
+        )
     else:
         await callback.answer(f"❌ {message}", show_alert=True)
     
@@ -273,7 +371,7 @@ async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext, use
 
 
 # ===== شحن الرصيد =====
-@router.message(F.text.in_(["💰 شحن رصيد", "💰 Add Balance"]))
+@router.message(MenuButton("btn_balance"))
 @router.callback_query(F.data == "user_recharge_start")
 async def start_recharge(event, state: FSMContext):
     """بدء عملية شحن الرصيد"""
@@ -327,7 +425,7 @@ async def recharge_method(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     local_amount = data['amount'] * rate
     
-    await state.update_data(method_id=method_id, local_amount=local_amount)
+    await state.update_data(method_id=method_id, local_amount=local_amount, exchange_rate=rate)
     await callback.message.edit_text(
         f"💳 *{method['name']}*\n\n"
         f"{method['description']}\n\n"
@@ -341,26 +439,27 @@ async def recharge_method(callback: types.CallbackQuery, state: FSMContext):
 async def recharge_receipt(message: types.Message, state: FSMContext, bot: Bot):
     """استقبال إيصال الشحن"""
     data = await state.get_data()
-    from config.settings import ADMIN_ID
-    
-    builder = types.InlineKeyboardMarkup(inline_keyboard=[
-        [
-            types.InlineKeyboardButton(text="✅ قبول", callback_data=f"admin_pay_approve_{message.from_user.id}_{data['amount']}"),
-            types.InlineKeyboardButton(text="❌ رفض", callback_data=f"admin_pay_reject_{message.from_user.id}")
-        ]
-    ])
-    
-    await bot.send_photo(
-        ADMIN_ID,
-        message.photo[-1].file_id,
-        caption=(
-            f"💰 *طلب شحن رصيد جديد*\n\n"
-            f"👤 المستخدم: @{message.from_user.username or 'N/A'} (`{message.from_user.id}`)\n"
-            f"💵 المبلغ: {data['amount']}$\n"
-            f"🪙 ما يعادل: {data['local_amount']:,.0f} ل.س"
-        ),
-        reply_markup=builder,
-        parse_mode="Markdown"
+    file_id = message.photo[-1].file_id
+    
+    # حفظ الطلب في قاعدة البيانات؛ الأزرار تحمل رقم الطلب فقط
+    deposit_id = await db_manager.create_deposit_request(
+        user_id=message.from_user.id,
+        amount_usd=data['amount'],
+        amount_local=data.get('local_amount'),
+        exchange_rate=data.get('exchange_rate'),
+        payment_method_id=data.get('method_id'),
+        receipt_file_id=file_id
+    )
+    
+    from handlers.admin_deposits import get_deposit_actions
+    await notification_router.dispatch(
+        bot, "DEPOSIT", deposit_id,
+        f"💰 *طلب شحن رصيد جديد #{deposit_id}*\n\n"
+        f"👤 المستخدم: @{message.from_user.username or 'N/A'} (`{message.from_user.id}`)\n"
+        f"💵 المبلغ: {data['amount']}$\n"
+        f"🪙 ما يعادل: {data['local_amount']:,.0f} ل.س",
+        reply_markup=get_deposit_actions(deposit_id),
+        photo=file_id
     )
     
     await message.answer("⏳ تم إرسال طلب الشحن للإدارة. سيتم إخطارك فور تأكيد الطلب.")
@@ -368,14 +467,14 @@ async def recharge_receipt(message: types.Message, state: FSMContext, bot: Bot):
 
 
 # ===== الدعم والحساب =====
-@router.message(F.text.in_(["❓ الدعم", "❓ Support"]))
+@router.message(MenuButton("btn_support"))
 async def show_support(message: types.Message):
     """عرض معلومات الدعم"""
     support_msg = await db_manager.get_setting("support_message", "تواصل مع الدعم الفني.")
     await message.answer(f"❓ *الدعم الفني*\n\n{support_msg}", parse_mode="Markdown")
 
 
-@router.message(F.text.in_(["👤 حسابي", "👤 My Account"]))
+@router.message(MenuButton("btn_account"))
 async def show_account(message: types.Message, user: dict):
     """عرض معلومات الحساب مع العملة المفضلة"""
     lang = get_user_language(user)
@@ -441,34 +540,22 @@ async def use_coupon_execute(message: types.Message, state: FSMContext):
     if not coupon or not coupon['is_active']:
         return await message.answer("❌ الكوبون غير صحيح أو منتهي الصلاحية.")
         
-    if coupon['used_count'] >= coupon['max_uses']:
-        return await message.answer("❌ تم استهلاك جميع استخدامات هذا الكوبون.")
-        
     # هنا يمكن تحديد إذا كان الكوبون يعطي رصيداً مباشراً
     if coupon['type'] == 'FIXED':
-        amount = coupon['value']
-        success, new_bal = await db_manager.update_user_balance(
-            user_id=user_id,
-            amount=amount,
-            log_type="COUPON",
-            reason=f"استخدام كوبون: {code}"
-        )
-        if success:
-            # تحديث عدد مرات استخدام الكوبون
-            db = await db_manager.connect()
-            await db.execute("UPDATE coupons SET used_count = used_count + 1 WHERE id = ?", (coupon['id'],))
-            await db.commit()
-            
-            await message.answer(f"✅ تم استخدام الكوبون بنجاح! تم إضافة {amount}$ إلى رصيدك.")
-            await state.clear()
-        else:
-            await message.answer(f"❌ حدث خطأ: {new_bal}")
+        success, result = await db_manager.redeem_balance_coupon(code, user_id)
+        if not success:
+            if result == "Coupon unavailable":
+                return await message.answer("❌ الكوبون منتهي الصلاحية أو تم استهلاك استخداماته المتاحة لك.")
+            return await message.answer(f"❌ حدث خطأ: {result}")
+        
+        await message.answer(f"✅ تم استخدام الكوبون بنجاح! تم إضافة {Money.of(coupon['value'])} إلى رصيدك.")
+        await state.clear()
     else:
         await message.answer("ℹ️ هذا الكوبون مخصص للخصم عند الشراء فقط، وليس للشحن المباشر.")
         await state.clear()
 
 
-@router.message(F.text.in_(["📦 طلباتي", "📦 My Orders"]))
+@router.message(MenuButton("btn_orders"))
 async def show_my_orders(message: types.Message, user: dict):
     """عرض طلبات المستخدم"""
     orders = await db_manager.get_user_orders(user['telegram_id'], limit=10)
@@ -491,13 +578,13 @@ async def show_my_orders(message: types.Message, user: dict):
         text += (
             f"🔹 #{ord['id']} | {ord['product_name']}\n"
             f"{status_icon} الحالة: `{ord['status']}`\n"
-            f"💰 السعر: {ord['price_local']:,.0f} ل.س\n\n"
+            f"💰 السعر: {Money(ord['price_local_minor'], CURRENCY_SYP)}\n\n"
         )
     
     await message.answer(text, parse_mode="Markdown")
 
 
-@router.message(F.text == "🌐 Language / اللغة")
+@router.message(MenuButton("btn_language"))
 async def change_language_start(message: types.Message):
     """تغيير اللغة"""
     builder = InlineKeyboardBuilder()
@@ -9,6 +9,9 @@ Telegram Bot - Professional Store v2.2 Ultimate
 - Logging احترافي
 """
 
+import time
+_process_started = time.perf_counter()
+
 import asyncio
 import logging
 import sys
@@ -29,27 +32,29 @@ from database.manager import db_manager
 from middlewares.auth import AdminMiddleware, AuthMiddleware
 from middlewares.throttling import ThrottlingMiddleware
 from middlewares.error_handler import ErrorHandlerMiddleware
+from utils.logging_config import setup_logging, stop_logging
+from utils.notifications import NotificationManager
+from services.ledger_service import LedgerService
 from handlers import (
-    user, admin, products, admin_modes, admin_orders, 
-    admin_stats, admin_broadcast, admin_coupons, 
-    admin_audit, language, payments
+    user, admin, products, admin_modes, admin_orders,
+    admin_deposits, language, payments, inline
 )
+# الإحصائيات والبث والكوبونات وسجل العمليات تُستورد عند أول استخدام
+from handlers.lazy import LazyRouter, lazy_admin_routers
+from handlers.routing import CallbackPrefixRouter, filter_evaluations, router_prefixes
 
-# إعداد Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("bot.log")
-    ]
-)
+_imports_done = time.perf_counter()
+
+# إعداد Logging (طابور غير حاجب + تدوير الملف)
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
 # متغيرات عامة
 bot: Bot = None
 dp: Dispatcher = None
 health_server_task = None
+outbox_task = None
+ledger_task = None
 
 
 # ===== Health Server (Async) =====
@@ -129,13 +134,21 @@ async def shutdown(signal_type=None):
     else:
         logger.info("Shutting down...")
     
-    # إيقاف Health Server
-    if health_server_task:
-        health_server_task.cancel()
+    # إيقاف Health Server ومعالج صندوق الإشعارات وفاحص السجل المحاسبي
+    for task in (health_server_task, outbox_task, ledger_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    # إرسال ملخصات الإشعارات المعلقة قبل الإغلاق
+    if bot:
         try:
-            await health_server_task
-        except asyncio.CancelledError:
-            pass
+            await NotificationManager.flush_digests(bot)
+        except Exception as e:
+            logger.error(f"Failed to flush notification digests: {e}")
     
     # إغلاق اتصال البوت
     if bot:
@@ -144,25 +157,11 @@ async def shutdown(signal_type=None):
     logger.info("Bot stopped successfully!")
 
 
-# ===== Main Function =====
-async def main():
+# ===== Dispatcher =====
+def build_dispatcher() -> Dispatcher:
     """
-    الدالة الرئيسية لتشغيل البوت
+    إنشاء Dispatcher مع الميدلوير والموجهات
     """
-    global bot, dp, health_server_task
-    
-    logger.info("Starting Professional Telegram Store v2.2 Ultimate...")
-    
-    # تهيئة قاعدة البيانات
-    try:
-        await db_manager.init_db()
-        logger.info("Database initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize database: {e}")
-        return
-    
-    # إنشاء Bot و Dispatcher
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
     dp = Dispatcher(storage=MemoryStorage())
     
     # تسجيل Error Handler
@@ -182,22 +181,86 @@ async def main():
     dp.callback_query.middleware(AuthMiddleware())
     
     # تسجيل الموجهات (Routers) بالترتيب الصحيح
-    # الأدمن أولاً لضمان عدم تداخل الأوامر
-    dp.include_router(admin.router)
-    dp.include_router(products.router)
-    dp.include_router(admin_modes.router)
-    dp.include_router(admin_orders.router)
-    dp.include_router(admin_stats.router)
-    dp.include_router(admin_broadcast.router)
-    dp.include_router(admin_coupons.router)
-    dp.include_router(admin_audit.router)
-    dp.include_router(language.router)
-    dp.include_router(payments.router)
-    dp.include_router(user.router)
+    # الأدمن أولاً لضمان عدم تداخل الأوامر؛ callback_query يُوجه بالبادئة مباشرة
+    # إلى الموجهات التي تعالجها (بنفس هذا الترتيب)
+    dp.include_router(CallbackPrefixRouter(
+        admin.router,
+        products.router,
+        admin_modes.router,
+        admin_orders.router,
+        admin_deposits.router,
+        *lazy_admin_routers(),
+        language.router,
+        payments.router,
+        user.router,
+        inline.router,
+    ))
+    
+    return dp
+
+
+# ===== Startup Profile =====
+async def profile_startup():
+    """
+    قياس مراحل البدء بدون الاتصال بتيليجرام (python main.py --profile-startup)
+    """
+    from utils.startup_profile import import_report, cold_start_benchmark, format_report
+    
+    started = time.perf_counter()
+    await db_manager.init_db()
+    database_done = time.perf_counter()
+    routing = build_dispatcher().sub_routers[0]
+    dispatcher_done = time.perf_counter()
+    await (await db_manager.connect()).close()
+    
+    # عدد المعالجات المفحوصة لكل callback مسجل (بعد تحميل الموجهات المؤجلة)
+    for router in routing.sub_routers:
+        if isinstance(router, LazyRouter):
+            router.load()
+    samples = sorted({prefix for router in routing.sub_routers for prefix in router_prefixes(router) or ()})
+    
+    phases = {
+        "imports": _imports_done - _process_started,
+        "database": database_done - started,
+        "dispatcher": dispatcher_done - database_done,
+    }
+    print(format_report(phases, import_report(), cold_start_benchmark(), filter_evaluations(routing, samples)))
+
+
+# ===== Main Function =====
+async def main():
+    """
+    الدالة الرئيسية لتشغيل البوت
+    """
+    global bot, dp, health_server_task, outbox_task, ledger_task
+    
+    logger.info("Starting Professional Telegram Store v2.2 Ultimate...")
+    
+    # تهيئة قاعدة البيانات
+    try:
+        await db_manager.init_db()
+        logger.info("Database initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}")
+        return
+    
+    # إنشاء Bot و Dispatcher
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+    dp = build_dispatcher()
+    logger.info(
+        f"Startup: imports {(_imports_done - _process_started) * 1000:.0f} ms, "
+        f"ready {(time.perf_counter() - _process_started) * 1000:.0f} ms"
+    )
     
     # تشغيل Health Server في الخلفية
     health_server_task = asyncio.create_task(health_server())
     
+    # إعادة محاولة الإشعارات الفاشلة (صندوق الإرسال) في الخلفية
+    outbox_task = asyncio.create_task(NotificationManager.run_outbox_worker(bot))
+    
+    # مطابقة الأرصدة مع السجل المحاسبي دورياً
+    ledger_task = asyncio.create_task(LedgerService.run_verifier(bot))
+    
     # تسجيل Signal Handlers للـ Graceful Shutdown
     loop = asyncio.get_running_loop()
     for sig in (signal.SIGTERM, signal.SIGINT):
@@ -223,8 +286,10 @@ async def main():
 # ===== Entry Point =====
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(profile_startup() if "--profile-startup" in sys.argv else main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user (KeyboardInterrupt)")
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
+    finally:
+        stop_logging(log_listener)
@@ -11,6 +11,8 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
 from config.settings import ADMIN_ID, StoreMode, UserRole
 from database.manager import db_manager
+from services.notification_router import notification_router
+from utils.notifications import notification_manager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -124,7 +126,7 @@ class AuthMiddleware(BaseMiddleware):
             last_name = event.from_user.last_name if hasattr(event.from_user, 'last_name') else None
             
             # إنشاء المستخدم بدون لغة افتراضية لإجباره على الاختيار
-            await db_manager.create_user(
+            created = await db_manager.create_user(
                 user_id,
                 event.from_user.username or "Unknown",
                 first_name=first_name,
@@ -132,6 +134,14 @@ class AuthMiddleware(BaseMiddleware):
                 role=role,
                 language=None  # لإجبار اختيار اللغة
             )
+            if created and role == UserRole.USER:
+                # تنبيه المدراء؛ التسجيلات المتتالية تُجمع في ملخص واحد
+                await notification_manager.notify_new_user(
+                    data["bot"],
+                    await notification_router.get_staff_ids((UserRole.SUPER_ADMIN,)),
+                    user_id,
+                    event.from_user.username or "Unknown"
+                )
             user = await db_manager.get_user(user_id)
         
         # التحقق من اختيار اللغة (للمستخدمين الجدد)
@@ -10,6 +10,7 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from database.manager import db_manager
 from config.settings import OrderStatus
+from utils.money import Money
 import logging
 
 logger = logging.getLogger(__name__)
@@ -69,36 +70,27 @@ class AnalyticsService:
             stats['auto_orders'] = (await cursor.fetchone())['count']
             
             # === الإحصائيات المالية ===
-            cursor = await db.execute("SELECT COALESCE(SUM(balance), 0) as total FROM users")
-            stats['total_balance'] = (await cursor.fetchone())['total']
-            
+            # من الأرصدة المادية للسجل المحاسبي (نطاق على المفتاح الأساسي بدل مسح المستخدمين)
             cursor = await db.execute("""
-                SELECT COALESCE(SUM(price_usd), 0) as revenue 
-                FROM orders 
-                WHERE status = ?
-            """, (OrderStatus.COMPLETED,))
-            stats['total_revenue'] = (await cursor.fetchone())['revenue']
-            
-            cursor = await db.execute("""
-                SELECT COALESCE(SUM(price_usd), 0) as revenue 
-                FROM orders 
-                WHERE status = ? AND date(created_at) = date('now')
-            """, (OrderStatus.COMPLETED,))
-            stats['revenue_today'] = (await cursor.fetchone())['revenue']
-            
-            cursor = await db.execute("""
-                SELECT COALESCE(SUM(price_usd), 0) as revenue 
-                FROM orders 
-                WHERE status = ? AND date(created_at) >= date('now', '-7 days')
-            """, (OrderStatus.COMPLETED,))
-            stats['revenue_week'] = (await cursor.fetchone())['revenue']
+                SELECT COALESCE(SUM(balance_minor), 0) as total FROM account_balances
+                WHERE account >= 'user:' AND account < 'user;'
+            """)
+            stats['total_balance'] = Money((await cursor.fetchone())['total'])
             
+            # الإيرادات بالسنت في مسح واحد (جمع أعداد صحيحة بدون أخطاء تقريب)
             cursor = await db.execute("""
-                SELECT COALESCE(SUM(price_usd), 0) as revenue 
+                SELECT COALESCE(SUM(price_usd_minor), 0) as total,
+                       COALESCE(SUM(CASE WHEN date(created_at) = date('now') THEN price_usd_minor END), 0) as today,
+                       COALESCE(SUM(CASE WHEN date(created_at) >= date('now', '-7 days') THEN price_usd_minor END), 0) as week,
+                       COALESCE(SUM(CASE WHEN date(created_at) >= date('now', '-30 days') THEN price_usd_minor END), 0) as month
                 FROM orders 
-                WHERE status = ? AND date(created_at) >= date('now', '-30 days')
+                WHERE status = ?
             """, (OrderStatus.COMPLETED,))
-            stats['revenue_month'] = (await cursor.fetchone())['revenue']
+            row = await cursor.fetchone()
+            stats['total_revenue'] = Money(row['total'])
+            stats['revenue_today'] = Money(row['today'])
+            stats['revenue_week'] = Money(row['week'])
+            stats['revenue_month'] = Money(row['month'])
             
             # === إحصائيات الشحن ===
             cursor = await db.execute("""
@@ -106,17 +98,16 @@ class AnalyticsService:
             """)
             stats['total_deposits'] = (await cursor.fetchone())['count']
             
+            # من الحساب المقابل للشحن في السجل المحاسبي (سالب مجموع إيداعات المستخدمين)
             cursor = await db.execute("""
-                SELECT COALESCE(SUM(amount), 0) as total FROM financial_logs 
-                WHERE type = 'DEPOSIT'
-            """)
-            stats['total_deposit_amount'] = (await cursor.fetchone())['total']
-            
-            cursor = await db.execute("""
-                SELECT COALESCE(SUM(amount), 0) as total FROM financial_logs 
-                WHERE type = 'DEPOSIT' AND date(created_at) = date('now')
+                SELECT COALESCE(-SUM(amount_minor), 0) as total,
+                       COALESCE(-SUM(CASE WHEN date(created_at) = date('now') THEN amount_minor END), 0) as today
+                FROM ledger_entries 
+                WHERE account = 'system:deposits'
             """)
-            stats['deposits_today'] = (await cursor.fetchone())['total']
+            row = await cursor.fetchone()
+            stats['total_deposit_amount'] = Money(row['total'])
+            stats['deposits_today'] = Money(row['today'])
             
             # === معدلات النجاح ===
             if stats['total_orders'] > 0:
@@ -126,9 +117,9 @@ class AnalyticsService:
             
             # === متوسط قيمة الطلب ===
             if stats['completed_orders'] > 0:
-                stats['avg_order_value'] = stats['total_revenue'] / stats['completed_orders']
+                stats['avg_order_value'] = Money(round(stats['total_revenue'].minor / stats['completed_orders']))
             else:
-                stats['avg_order_value'] = 0
+                stats['avg_order_value'] = Money(0)
             
             return stats
             
@@ -162,7 +153,7 @@ class AnalyticsService:
         try:
             db = await db_manager.connect()
             cursor = await db.execute("""
-                SELECT p.name, COUNT(o.id) as order_count, SUM(o.price_usd) as total_revenue
+                SELECT p.name, COUNT(o.id) as order_count, SUM(o.price_usd_minor) as total_revenue
                 FROM orders o
                 JOIN products p ON o.product_id = p.id
                 WHERE o.status = ?
@@ -171,7 +162,10 @@ class AnalyticsService:
                 LIMIT ?
             """, (OrderStatus.COMPLETED, limit))
             
-            return [dict(row) for row in await cursor.fetchall()]
+            return [
+                {**dict(row), 'total_revenue': Money(row['total_revenue'])}
+                for row in await cursor.fetchall()
+            ]
             
         except Exception as e:
             logger.error(f"Error getting top products: {e}", exc_info=True)
@@ -179,12 +173,12 @@ class AnalyticsService:
     
     
     @staticmethod
-    async def get_revenue_chart(days: int = 7) -> Dict[str, float]:
+    async def get_revenue_chart(days: int = 7) -> Dict[str, Money]:
         """رسم بياني للإيرادات اليومية"""
         try:
             db = await db_manager.connect()
             cursor = await db.execute("""
-                SELECT date(created_at) as date, COALESCE(SUM(price_usd), 0) as revenue
+                SELECT date(created_at) as date, COALESCE(SUM(price_usd_minor), 0) as revenue
                 FROM orders
                 WHERE status = ? AND date(created_at) >= date('now', ?)
                 GROUP BY date(created_at)
@@ -192,7 +186,7 @@ class AnalyticsService:
             """, (OrderStatus.COMPLETED, f'-{days} days'))
             
             results = await cursor.fetchall()
-            return {row['date']: row['revenue'] for row in results}
+            return {row['date']: Money(row['revenue']) for row in results}
             
         except Exception as e:
             logger.error(f"Error getting revenue chart: {e}", exc_info=True)
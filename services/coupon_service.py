@@ -0,0 +1,117 @@
+"""
+Coupon Service - توليد الكوبونات بالجملة
+التحسينات:
+- توليد أكواد عشوائية آمنة بدون تكرار (داخل الدفعة ومع الموجود في قاعدة البيانات)
+- إدخال الدفعة كاملة عبر executemany في معاملة واحدة
+- تصدير/استيراد الدفعات بصيغة CSV
+"""
+
+import csv
+import io
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from database.manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+# حروف بدون الرموز المتشابهة (0/O و 1/I/L)
+CODE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+
+class CouponService:
+    """خدمة الكوبونات بالجملة"""
+
+    MAX_BATCH_SIZE = 100000
+    CODE_LENGTH = 10
+
+    @staticmethod
+    def generate_codes(prefix: str, count: int, length: int = CODE_LENGTH) -> List[str]:
+        """توليد count كوداً فريداً بصيغة PREFIX-XXXXXXXXXX"""
+        prefix = prefix.strip().upper()
+        codes = set()
+        while len(codes) < count:
+            suffix = "".join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+            codes.add(f"{prefix}-{suffix}" if prefix else suffix)
+        return list(codes)
+
+    @staticmethod
+    def parse_codes_csv(content: bytes) -> List[str]:
+        """قراءة الأكواد من العمود الأول لملف CSV (مع تجاهل العنوان والأسطر الفارغة)"""
+        text = content.decode("utf-8-sig", errors="ignore")
+        codes = []
+        for row in csv.reader(io.StringIO(text)):
+            if not row or not row[0].strip():
+                continue
+            code = row[0].strip().upper()
+            if code == "CODE":
+                continue
+            codes.append(code)
+        return list(dict.fromkeys(codes))
+
+    @staticmethod
+    async def create_batch(
+        prefix: str,
+        count: int,
+        coupon_type: str,
+        value: float,
+        expires_days: int = 0,
+        created_by: Optional[int] = None,
+        codes: Optional[List[str]] = None
+    ) -> Tuple[str, int]:
+        """
+        إنشاء دفعة كوبونات أحادية الاستخدام
+
+        Args:
+            codes: أكواد جاهزة (استيراد)؛ إذا لم تُحدد يتم توليد count كوداً
+
+        Returns:
+            (batch_id, عدد الكوبونات المنشأة)
+        """
+        expires_at = (datetime.now() + timedelta(days=expires_days)).isoformat() if expires_days else None
+        # لاحقة عشوائية: دفعتان بنفس البادئة في نفس الثانية (كل الاستيرادات IMP) لا تتشاركان المعرف
+        nonce = "".join(secrets.choice(CODE_ALPHABET) for _ in range(4))
+        batch_id = f"{(prefix or 'IMP').strip().upper()}-{datetime.now().strftime('%y%m%d%H%M%S')}-{nonce}"
+
+        if codes is not None:
+            # الاستيراد: الأكواد المكررة مع الموجود تُتجاهل
+            created = await db_manager.create_coupons_bulk(
+                codes, coupon_type, value, expires_at=expires_at, created_by=created_by, batch_id=batch_id
+            )
+            return batch_id, created
+
+        created = 0
+        remaining = count
+        # عند تصادم نادر مع كود موجود يتم توليد بدائل للنقص فقط
+        while remaining > 0:
+            batch_codes = CouponService.generate_codes(prefix, remaining)
+            inserted = await db_manager.create_coupons_bulk(
+                batch_codes, coupon_type, value, expires_at=expires_at, created_by=created_by, batch_id=batch_id
+            )
+            created += inserted
+            remaining -= inserted
+            if inserted == 0:
+                logger.error(f"Coupon batch {batch_id}: no codes inserted, stopping at {created}/{count}")
+                break
+
+        logger.info(f"Coupon batch {batch_id} created: {created} codes")
+        return batch_id, created
+
+    @staticmethod
+    async def export_batch_csv(batch_id: str) -> bytes:
+        """تصدير الدفعة كملف CSV"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["code", "type", "value", "expires_at", "used_count", "max_uses", "is_active"])
+        async for coupon in db_manager.iter_coupon_batch(batch_id):
+            writer.writerow([
+                coupon['code'], coupon['type'], coupon['value'], coupon['expires_at'] or "",
+                coupon['used_count'], coupon['max_uses'], coupon['is_active']
+            ])
+        return output.getvalue().encode("utf-8-sig")
+
+
+# إنشاء instance واحد
+coupon_service = CouponService()
@@ -0,0 +1,99 @@
+"""
+Idempotency Service - منع تكرار تنفيذ العمليات الحساسة
+التحسينات:
+- مفتاح لكل عملية (تأكيد شراء، قبول شحن) مع قيد UNIQUE في قاعدة البيانات
+- مسار سريع في الذاكرة للنتائج الحديثة والعمليات الجارية
+- الضغط المكرر يعيد النتيجة الأصلية دون إعادة التنفيذ
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from database.manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyInProgress(Exception):
+    """العملية بنفس المفتاح ما زالت قيد التنفيذ (أو انقطعت قبل حفظ نتيجتها)"""
+    pass
+
+
+class IdempotencyService:
+    """تنفيذ العملية مرة واحدة لكل مفتاح"""
+
+    # عدد النتائج المحفوظة في الذاكرة
+    MEMORY_CACHE_SIZE = 5000
+
+    def __init__(self):
+        self._results: "OrderedDict[str, Any]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _remember(self, key: str, result: Any):
+        self._results[key] = result
+        self._results.move_to_end(key)
+        if len(self._results) > self.MEMORY_CACHE_SIZE:
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, operation: Callable[[], Awaitable[Any]]) -> Tuple[bool, Any]:
+        """
+        تنفيذ العملية مرة واحدة فقط لهذا المفتاح
+
+        Args:
+            key: مفتاح العملية (مثل BUY:<user>:<message>)
+            operation: دالة async تعيد نتيجة قابلة للتحويل إلى JSON
+
+        Returns:
+            (replayed: bool, result) - replayed=True إذا كانت النتيجة من تنفيذ سابق
+
+        Raises:
+            IdempotencyInProgress: إذا كانت العملية قيد التنفيذ في مكان آخر
+        """
+        # 1. المسار السريع: نتيجة محفوظة أو عملية جارية في نفس العملية
+        if key in self._results:
+            return True, self._results[key]
+        if key in self._inflight:
+            return True, await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            # 2. حجز المفتاح في قاعدة البيانات (يحمي بعد إعادة التشغيل)
+            acquired, existing = await db_manager.begin_idempotent(key)
+            if not acquired:
+                if existing and existing['status'] == 'DONE':
+                    result = json.loads(existing['result']) if existing['result'] else None
+                    self._remember(key, result)
+                    future.set_result(result)
+                    return True, result
+                raise IdempotencyInProgress(key)
+
+            # 3. التنفيذ الفعلي
+            try:
+                result = await operation()
+            except BaseException:
+                await db_manager.release_idempotent(key)
+                raise
+
+            await db_manager.complete_idempotent(key, json.dumps(result, ensure_ascii=False))
+            self._remember(key, result)
+            future.set_result(result)
+            return False, result
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                    raise
+                future.set_exception(e)
+                # منع تحذير "exception was never retrieved" عند عدم وجود منتظرين
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+# إنشاء instance واحد
+idempotency_service = IdempotencyService()
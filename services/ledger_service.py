@@ -0,0 +1,97 @@
+"""
+Ledger Service - التحقق من السجل المحاسبي
+التحسينات:
+- كل حركة رصيد تُسجل كقيدين متعاكسين (مجموع السجل دائماً صفر)
+- الرصيد المادي (account_balances) يُقرأ مباشرة دون جمع القيود
+- فحص دوري على دفعات يكشف أي انحراف بين الرصيد المادي ومجموع القيود
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot
+
+from config.settings import ADMIN_ID, LEDGER_VERIFY_INTERVAL
+from database.manager import db_manager
+from utils.notifications import NotificationManager
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerService:
+    """خدمة السجل المحاسبي"""
+
+    VERIFY_CHUNK_SIZE = 1000
+    MAX_REPORTED_DRIFTS = 20
+
+    @staticmethod
+    async def verify(chunk_size: int = VERIFY_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        مطابقة الأرصدة المادية مع مجموع القيود على دفعات (keyset على اسم الحساب)
+
+        Returns:
+            dict: ok, accounts_checked, drifts [(account, balance_minor, ledger_minor)],
+                  ledger_total, orphan_accounts, mirror_mismatches
+        """
+        drifts = []
+        checked = 0
+        after = ""
+        while True:
+            chunk = await db_manager.get_ledger_verification_chunk(after, chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                if row['balance_minor'] != row['ledger_minor']:
+                    drifts.append((row['account'], row['balance_minor'], row['ledger_minor']))
+            checked += len(chunk)
+            after = chunk[-1]['account']
+            # إفساح المجال لبقية المهام بين الدفعات
+            await asyncio.sleep(0)
+
+        report = await db_manager.get_ledger_integrity()
+        report.update({'accounts_checked': checked, 'drifts': drifts})
+        report['ok'] = (
+            not drifts and report['ledger_total'] == 0
+            and not report['orphan_accounts'] and report['mirror_mismatches'] == 0
+        )
+        return report
+
+    @staticmethod
+    def format_report(report: Dict[str, Any]) -> str:
+        lines = [f"الحسابات المفحوصة: {report['accounts_checked']}"]
+        if report['ledger_total'] != 0:
+            lines.append(f"مجموع القيود غير صفري: {report['ledger_total']}")
+        for account, balance, ledger in report['drifts'][:LedgerService.MAX_REPORTED_DRIFTS]:
+            lines.append(f"{account}: الرصيد {balance} ≠ القيود {ledger}")
+        if len(report['drifts']) > LedgerService.MAX_REPORTED_DRIFTS:
+            lines.append(f"و {len(report['drifts']) - LedgerService.MAX_REPORTED_DRIFTS} أخرى")
+        if report['orphan_accounts']:
+            lines.append(f"حسابات بلا رصيد: {', '.join(report['orphan_accounts'][:LedgerService.MAX_REPORTED_DRIFTS])}")
+        if report['mirror_mismatches']:
+            lines.append(f"مستخدمون رصيدهم المعروض غير مطابق: {report['mirror_mismatches']}")
+        return "\n".join(lines)
+
+    @staticmethod
+    async def run_verifier(bot: Bot, interval: int = LEDGER_VERIFY_INTERVAL):
+        """مهمة خلفية تفحص السجل دورياً وتنبه الأدمن عند أي انحراف"""
+        if interval <= 0:
+            return
+        while True:
+            try:
+                report = await LedgerService.verify()
+                if report['ok']:
+                    logger.info(f"Ledger verified: {report['accounts_checked']} accounts")
+                else:
+                    details = LedgerService.format_report(report)
+                    logger.error(f"Ledger drift detected:\n{details}")
+                    await NotificationManager.notify_error(bot, ADMIN_ID, "LEDGER_DRIFT", details)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ledger verifier error: {e}")
+            await asyncio.sleep(interval)
+
+
+# إنشاء instance واحد
+ledger_service = LedgerService()
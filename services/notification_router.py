@@ -0,0 +1,131 @@
+"""
+Notification Router - توزيع إشعارات الطاقم
+التحسينات:
+- إرسال الطلبات وإيصالات الشحن لجميع الطاقم المناوب بدلاً من ADMIN_ID فقط
+- تخزين مؤقت لقائمة الطاقم (يُلغى عند تغيير الرتب)
+- إرسال متزامن لجميع الطاقم
+- استلام ذري للعنصر: أول موظف يضغط يستلمه وتتحدث أزرار البقية
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional, List, Tuple
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+
+from database.manager import db_manager
+from config.settings import ADMIN_ID, UserRole
+from utils.keyboards import get_staff_closed_keyboard
+from utils.notifications import notification_manager
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationRouter:
+    """موزع الإشعارات على الطاقم"""
+    
+    # الرتب القادرة على تنفيذ الطلبات والموافقة على الشحن
+    ACTION_ROLES = (UserRole.SUPER_ADMIN, UserRole.OPERATOR)
+    
+    # مدة صلاحية قائمة الطاقم المخزنة (بالثواني)
+    STAFF_CACHE_TTL = 60
+    
+    def __init__(self):
+        self._staff_cache: dict = {}
+    
+    async def get_staff_ids(self, roles: Tuple[str, ...] = ACTION_ROLES) -> List[int]:
+        """قائمة الطاقم المناوب (مخزنة مؤقتاً)"""
+        cached = self._staff_cache.get(roles)
+        if cached and time.monotonic() - cached[0] < self.STAFF_CACHE_TTL:
+            return cached[1]
+        
+        staff_ids = await db_manager.get_staff_ids(list(roles))
+        if ADMIN_ID and ADMIN_ID not in staff_ids:
+            staff_ids.append(ADMIN_ID)
+        self._staff_cache[roles] = (time.monotonic(), staff_ids)
+        return staff_ids
+    
+    def invalidate(self):
+        """إلغاء التخزين المؤقت (عند تغيير رتبة أو حظر مستخدم)"""
+        self._staff_cache.clear()
+    
+    async def dispatch(
+        self,
+        bot: Bot,
+        item_type: str,
+        item_key: str,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        photo: Optional[str] = None,
+        roles: Tuple[str, ...] = ACTION_ROLES
+    ) -> int:
+        """
+        إرسال عنصر لجميع الطاقم بشكل متزامن وحفظ الرسائل لتحديثها عند الاستلام
+        (النسخ المؤجلة لصندوق الإرسال تُحفظ عند وصولها)
+        
+        Returns:
+            عدد الموظفين الذين وصلتهم الرسالة
+        """
+        staff_ids = await self.get_staff_ids(roles)
+        results = await notification_manager.fan_out(
+            bot, staff_ids, text, reply_markup=reply_markup, photo=photo, track=(item_type, str(item_key))
+        )
+        
+        sent = [(msg.chat.id, msg.message_id) for msg in results if msg]
+        await db_manager.save_staff_messages(item_type, str(item_key), sent)
+        return len(sent)
+    
+    async def claim(self, bot: Bot, item_type: str, item_key: str, staff_id: int, staff_name: str = None) -> Tuple[bool, bool, Optional[dict]]:
+        """
+        استلام عنصر من قبل موظف
+        
+        Returns:
+            (allowed: bool, won: bool, claim: dict)
+            allowed = True إذا استلمه هذا الموظف الآن أو كان قد استلمه سابقاً
+            won = True إذا استلمه بهذا الاستدعاء (فيُلغى الاستلام إذا فشلت المعالجة)
+        """
+        won, claim = await db_manager.claim_staff_item(item_type, str(item_key), staff_id, staff_name)
+        if won:
+            await self._mark_claimed(bot, item_type, str(item_key), staff_id, staff_name)
+        allowed = won or (claim is not None and claim['claimed_by'] == staff_id)
+        return allowed, won, claim
+    
+    async def release(self, bot: Bot, item_type: str, item_key: str, staff_id: int,
+                      reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+        """
+        إلغاء استلام عنصر فشلت معالجته، وإعادة أزرار الإجراءات لبقية الطاقم
+        (بدون reply_markup يُلغى الاستلام فقط وتبقى الرسائل كما هي)
+        """
+        released = await db_manager.release_staff_claim(item_type, str(item_key), staff_id)
+        if released and reply_markup is not None:
+            await self._replace_all(bot, item_type, str(item_key), reply_markup, exclude_chat=staff_id)
+        return released
+    
+    async def _mark_claimed(self, bot: Bot, item_type: str, item_key: str, staff_id: int, staff_name: str = None):
+        """تحديث أزرار رسائل بقية الطاقم لتظهر من استلم العنصر"""
+        markup = get_staff_closed_keyboard(f"🔒 استلمه {staff_name or staff_id}")
+        await self._replace_all(bot, item_type, item_key, markup, exclude_chat=staff_id)
+    
+    async def resolve(self, bot: Bot, item_type: str, item_key: str, label: str):
+        """إغلاق العنصر في رسائل جميع الطاقم بعد معالجته (مثلاً من الطابور أو دفعة جماعية)"""
+        await self._replace_all(bot, item_type, str(item_key), get_staff_closed_keyboard(label))
+    
+    async def _replace_all(self, bot: Bot, item_type: str, item_key: str, markup: InlineKeyboardMarkup, exclude_chat: int = None):
+        messages = await db_manager.get_staff_messages(item_type, item_key)
+        await asyncio.gather(*(
+            self._replace_markup(bot, msg['chat_id'], msg['message_id'], markup)
+            for msg in messages if msg['chat_id'] != exclude_chat
+        ))
+    
+    @staticmethod
+    async def _replace_markup(bot: Bot, chat_id: int, message_id: int, markup: InlineKeyboardMarkup):
+        try:
+            await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=markup)
+        except Exception as e:
+            logger.debug(f"Could not update staff message {chat_id}/{message_id}: {e}")
+
+
+# إنشاء instance واحد
+notification_router = NotificationRouter()
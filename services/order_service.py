@@ -5,8 +5,9 @@ Order Service Layer - طبقة خدمات الطلبات
 - التحقق من السعر
 - التحقق من طريقة الدفع
 - التحقق من حالة المنتج
-- إنشاء طلب آمن مع Transaction
+- إنشاء طلب آمن في معاملة واحدة (Unit of Work)
 - دعم الوضع اليدوي والتلقائي
+- آلة حالات للطلب مع انتقالات ذرية (compare-and-set)
 """
 
 import logging
@@ -14,7 +15,8 @@ from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
 
 from database.manager import db_manager
-from config.settings import OrderStatus, ProductType, StoreMode
+from config.settings import OrderStatus, ProductType, StoreMode, ORDER_TRANSITIONS
+from utils.money import Money
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +43,11 @@ class OrderService:
             (success: bool, message: str, order_data: dict)
         """
         try:
+            # قراءة واحدة لكل البيانات + إعدادات من الكاش
+            context = await db_manager.get_order_context(user_id, product_id, payment_method_id)
+            
             # 1. التحقق من المستخدم
-            user = await db_manager.get_user(user_id)
+            user = context['user']
             if not user:
                 return False, "المستخدم غير موجود", None
             
@@ -50,7 +55,7 @@ class OrderService:
                 return False, "حسابك محظور. يرجى التواصل مع الدعم.", None
             
             # 2. التحقق من المنتج
-            product = await db_manager.get_product(product_id)
+            product = context['product']
             if not product:
                 return False, "المنتج غير موجود", None
             
@@ -71,13 +76,12 @@ class OrderService:
                 return False, "🛠 عذراً، المتجر في وضع الصيانة حالياً للتحديث. سنعود للعمل قريباً!", None
             
             # 4. التحقق من وجود طلب مفتوح
-            has_open = await db_manager.has_open_order(user_id)
-            if has_open:
+            if context['has_open_order']:
                 return False, "لديك طلب قيد المعالجة. يرجى انتظار إتمامه أولاً.", None
             
             # 5. التحقق من طريقة الدفع (إذا كانت محددة)
             if payment_method_id:
-                payment_method = await db_manager.get_payment_method(payment_method_id)
+                payment_method = context['payment_method']
                 if not payment_method:
                     return False, "طريقة الدفع غير موجودة", None
                 
@@ -86,13 +90,14 @@ class OrderService:
             
             # 6. حساب السعر
             dollar_rate = float(await db_manager.get_setting('dollar_rate', '12500'))
-            price_usd = product['price_usd']
-            price_local = price_usd * dollar_rate
+            price_usd = Money(product['price_minor'])
+            price_local = price_usd.convert(dollar_rate)
             
             # 7. التحقق من الرصيد (إذا كان الدفع من الرصيد)
             if payment_method_id is None:  # الدفع من الرصيد
-                if user['balance'] < price_usd:
-                    return False, f"رصيدك غير كافٍ. تحتاج إلى {price_usd}$ ورصيدك الحالي {user['balance']:.2f}$", None
+                balance = Money.of(user['balance'])
+                if balance < price_usd:
+                    return False, f"رصيدك غير كافٍ. تحتاج إلى {price_usd} ورصيدك الحالي {balance}", None
             
             # 8. التحقق من معرف اللاعب
             if not player_id or len(player_id.strip()) == 0:
@@ -133,57 +138,59 @@ class OrderService:
             (success: bool, message: str, order_id: int)
         """
         try:
-            # 1. التحقق من صلاحية الطلب
-            is_valid, message, order_data = await OrderService.validate_order(
-                user_id, product_id, player_id, payment_method_id
-            )
-            
-            if not is_valid:
-                return False, message, None
-            
-            # 2. تطبيق الكوبون (إذا وجد)
-            discount_amount = 0
-            final_price_usd = order_data['price_usd']
-            
-            if coupon_code:
-                is_valid_coupon, coupon_msg, discount = await db_manager.validate_coupon(
-                    coupon_code, user_id, final_price_usd
+            # وحدة عمل واحدة: التحقق والإنشاء والخصم والسجلات تُثبت معاً أو لا شيء
+            # (التحقق داخل المعاملة يمنع طلبين متزامنين من تجاوز الرصيد أو الطلب المفتوح)
+            async with db_manager.transaction() as tx:
+                # 1. التحقق من صلاحية الطلب
+                is_valid, message, order_data = await OrderService.validate_order(
+                    user_id, product_id, player_id, payment_method_id
                 )
                 
-                if is_valid_coupon:
-                    discount_amount = discount
-                    final_price_usd = max(0, final_price_usd - discount)
-                    logger.info(f"Coupon {coupon_code} applied: discount={discount}, final_price={final_price_usd}")
+                if not is_valid:
+                    raise OrderValidationError(message)
+                
+                # 2. تطبيق الكوبون (إذا وجد)
+                discount_amount = Money(0)
+                final_price_usd = order_data['price_usd']
+                
+                if coupon_code:
+                    is_valid_coupon, coupon_msg, discount = await db_manager.validate_coupon(
+                        coupon_code, user_id, final_price_usd
+                    )
+                    
+                    if is_valid_coupon:
+                        discount_amount = discount
+                        final_price_usd = max(Money(0), final_price_usd - discount)
+                        logger.info(f"Coupon {coupon_code} applied: discount={discount}, final_price={final_price_usd}")
+                    else:
+                        logger.warning(f"Invalid coupon {coupon_code}: {coupon_msg}")
+                
+                # 3. تحديد حالة الطلب الأولية
+                if payment_method_id is None:
+                    # الدفع من الرصيد
+                    initial_status = OrderStatus.PAID
                 else:
-                    logger.warning(f"Invalid coupon {coupon_code}: {coupon_msg}")
-            
-            # 3. تحديد حالة الطلب الأولية
-            if payment_method_id is None:
-                # الدفع من الرصيد
-                initial_status = OrderStatus.PAID
-            else:
-                # الدفع عبر طريقة دفع خارجية
-                initial_status = OrderStatus.PENDING_PAYMENT
-            
-            # 4. إنشاء الطلب في قاعدة البيانات
-            db = await db_manager.connect()
-            await db.execute("BEGIN")
-            
-            try:
-                # إنشاء الطلب
-                cursor = await db.execute("""
+                    # الدفع عبر طريقة دفع خارجية
+                    initial_status = OrderStatus.PENDING_PAYMENT
+                
+                # 4. إنشاء الطلب
+                final_price_local = final_price_usd.convert(order_data['exchange_rate'])
+                cursor = await tx.execute("""
                     INSERT INTO orders (
                         user_id, product_id, player_id, 
                         price_usd, price_local, exchange_rate,
+                        price_usd_minor, price_local_minor,
                         status, payment_method_id, execution_type
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     user_id,
                     product_id,
                     order_data['player_id'],
-                    final_price_usd,
-                    final_price_usd * order_data['exchange_rate'],
+                    final_price_usd.amount,
+                    final_price_local.amount,
                     order_data['exchange_rate'],
+                    final_price_usd.minor,
+                    final_price_local.minor,
                     initial_status,
                     payment_method_id,
                     order_data['execution_type']
@@ -191,9 +198,10 @@ class OrderService:
                 
                 order_id = cursor.lastrowid
                 
-                # إذا كان الدفع من الرصيد، خصم المبلغ
+                # 5. إذا كان الدفع من الرصيد، خصم المبلغ
                 if payment_method_id is None:
-                    success, result = await db_manager.update_user_balance(
+                    success, result = await db_manager._apply_balance_change(
+                        tx,
                         user_id=user_id,
                         amount=-final_price_usd,
                         log_type="PURCHASE",
@@ -202,15 +210,15 @@ class OrderService:
                     )
                     
                     if not success:
-                        await db.rollback()
-                        return False, f"فشل خصم الرصيد: {result}", None
+                        raise OrderValidationError(f"فشل خصم الرصيد: {result}")
                 
-                # تسجيل استخدام الكوبون
-                if coupon_code and discount_amount > 0:
-                    await db_manager.use_coupon(coupon_code, user_id, order_id, discount_amount)
+                # 6. تسجيل استخدام الكوبون
+                if coupon_code and discount_amount:
+                    if not await db_manager._redeem_coupon(tx, coupon_code, user_id, order_id, discount_amount):
+                        raise OrderValidationError("الكوبون لم يعد متاحاً (انتهت صلاحيته أو استخداماته)")
                 
-                # تسجيل في trust_logs
-                await db.execute("""
+                # 7. تسجيل في trust_logs
+                await tx.execute("""
                     INSERT INTO trust_logs (order_id, user_id, action_text, execution_type)
                     VALUES (?, ?, ?, ?)
                 """, (
@@ -219,84 +227,110 @@ class OrderService:
                     f"إنشاء طلب جديد #{order_id}",
                     order_data['execution_type']
                 ))
-                
-                await db.commit()
-                
-                logger.info(f"Order created successfully: order_id={order_id}, user_id={user_id}, product_id={product_id}")
-                
-                return True, "تم إنشاء الطلب بنجاح", order_id
-                
-            except Exception as e:
-                await db.rollback()
-                logger.error(f"Error creating order in database: {e}", exc_info=True)
-                return False, f"خطأ في إنشاء الطلب: {str(e)}", None
-                
+            
+            logger.info(f"Order created successfully: order_id={order_id}, user_id={user_id}, product_id={product_id}")
+            
+            return True, "تم إنشاء الطلب بنجاح", order_id
+            
+        except OrderValidationError as e:
+            return False, str(e), None
         except Exception as e:
             logger.error(f"Error in create_order: {e}", exc_info=True)
-            return False, f"خطأ غير متوقع: {str(e)}", None
+            return False, f"خطأ في إنشاء الطلب: {str(e)}", None
     
     
     @staticmethod
-    async def finalize_order(
+    def can_transition(from_status: str, to_status: str) -> bool:
+        """هل الانتقال مسموح في جدول حالات الطلب"""
+        return to_status in ORDER_TRANSITIONS.get(from_status, ())
+    
+    
+    @staticmethod
+    async def change_status(
         order_id: int,
         status: str,
         admin_id: Optional[int] = None,
-        admin_notes: Optional[str] = None
+        admin_notes: Optional[str] = None,
+        execution_type: Optional[str] = None
     ) -> Tuple[bool, str]:
         """
-        إنهاء الطلب (إكمال أو فشل أو إلغاء)
+        نقل الطلب لحالة جديدة وفق جدول الانتقالات
+        
+        الانتقال يتم بشرط الحالة الحالية (compare-and-set): إذا سبق موظف آخر
+        لا يُنفذ شيء. عند الفشل أو الإلغاء يُرجع الرصيد في نفس المعاملة.
         
         Returns:
             (success: bool, message: str)
         """
         try:
-            # التحقق من الطلب
             order = await db_manager.get_order(order_id)
             if not order:
                 return False, "الطلب غير موجود"
             
-            # التحقق من الحالة
-            if status not in [OrderStatus.COMPLETED, OrderStatus.FAILED, OrderStatus.CANCELED]:
-                return False, "حالة غير صالحة"
-            
-            # تحديث حالة الطلب
-            await db_manager.update_order_status(
-                order_id=order_id,
-                status=status,
-                admin_notes=admin_notes,
-                execution_type=order.get('execution_type', 'MANUAL'),
-                operator_id=admin_id
-            )
+            current = order['status']
+            if not OrderService.can_transition(current, status):
+                return False, f"لا يمكن نقل الطلب من {current} إلى {status}"
             
-            # إذا فشل الطلب أو تم إلغاؤه، إرجاع الرصيد (إذا كان الدفع من الرصيد)
-            if status in [OrderStatus.FAILED, OrderStatus.CANCELED]:
-                if order.get('payment_method_id') is None:  # الدفع كان من الرصيد
-                    await db_manager.update_user_balance(
+            async with db_manager.transaction() as tx:
+                won = await db_manager._transition_order(
+                    tx, order_id, current, status,
+                    admin_notes=admin_notes, execution_type=execution_type, operator_id=admin_id
+                )
+                if not won:
+                    raise OrderValidationError("تم تحديث الطلب من قبل موظف آخر، يرجى التحديث والمحاولة مجدداً")
+                
+                # إذا فشل الطلب أو تم إلغاؤه، إرجاع الرصيد (إذا كان الدفع من الرصيد)
+                if status in [OrderStatus.FAILED, OrderStatus.CANCELED] and order.get('payment_method_id') is None:
+                    success, result = await db_manager._apply_balance_change(
+                        tx,
                         user_id=order['user_id'],
-                        amount=order['price_usd'],
+                        amount=Money(order['price_usd_minor']),
                         log_type="REFUND",
                         admin_id=admin_id,
                         reason=f"إرجاع رصيد الطلب #{order_id} - {status}",
                         order_id=order_id
                     )
+                    if not success:
+                        raise OrderValidationError(f"فشل إرجاع الرصيد: {result}")
             
             # تسجيل العملية
             if admin_id:
                 await db_manager.log_admin_action(
                     admin_id=admin_id,
-                    action=f"FINALIZE_ORDER_{status}",
+                    action=f"ORDER_{status}",
                     target_type="ORDER",
                     target_id=order_id,
-                    details=f"إنهاء الطلب #{order_id} بحالة {status}"
+                    details=f"نقل الطلب #{order_id} من {current} إلى {status}"
                 )
             
-            logger.info(f"Order finalized: order_id={order_id}, status={status}")
+            logger.info(f"Order status changed: order_id={order_id}, {current} -> {status}")
             
-            return True, f"تم إنهاء الطلب بحالة: {status}"
+            return True, f"تم نقل الطلب إلى: {status}"
             
+        except OrderValidationError as e:
+            return False, str(e)
         except Exception as e:
-            logger.error(f"Error finalizing order: {e}", exc_info=True)
-            return False, f"خطأ في إنهاء الطلب: {str(e)}"
+            logger.error(f"Error changing order status: {e}", exc_info=True)
+            return False, f"خطأ في تحديث الطلب: {str(e)}"
+    
+    
+    @staticmethod
+    async def finalize_order(
+        order_id: int,
+        status: str,
+        admin_id: Optional[int] = None,
+        admin_notes: Optional[str] = None
+    ) -> Tuple[bool, str]:
+        """
+        إنهاء الطلب (إكمال أو فشل أو إلغاء)
+        
+        Returns:
+            (success: bool, message: str)
+        """
+        if status not in [OrderStatus.COMPLETED, OrderStatus.FAILED, OrderStatus.CANCELED]:
+            return False, "حالة غير صالحة"
+        
+        return await OrderService.change_status(order_id, status, admin_id=admin_id, admin_notes=admin_notes)
     
     
     @staticmethod
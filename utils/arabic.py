@@ -0,0 +1,44 @@
+"""
+Arabic Text Normalization - توحيد النص العربي للبحث
+- إزالة التشكيل والتطويل
+- توحيد أشكال الألف والياء والتاء المربوطة
+- إزالة "ال" التعريف من بداية الكلمات
+(يُطبق نفس التوحيد على النص المفهرس وعلى نص البحث فتتطابق الصيغ المختلفة)
+"""
+
+import re
+
+# التشكيل (الفتحتان حتى السكون + الألف الخنجرية) والتطويل
+_DIACRITICS = re.compile(r"[ً-ْٰـ]")
+
+_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+})
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_arabic(text: str) -> str:
+    """نص موحد بكلمات مفصولة بمسافات (أحرف لاتينية صغيرة)"""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text).translate(_FOLD).lower()
+    words = []
+    for word in _WORD.findall(text):
+        if word.startswith("ال") and len(word) > 3:
+            word = word[2:]
+        words.append(word)
+    return " ".join(words)
+
+
+def fts_prefix_query(text: str) -> str:
+    """
+    استعلام FTS5 آمن من نص المستخدم: كل كلمة بين علامتي تنصيص مع بحث بالبادئة
+
+    Returns:
+        نص الاستعلام أو "" إذا لم يبق شيء بعد التوحيد
+    """
+    return " ".join(f'"{word}"*' for word in normalize_arabic(text).split())
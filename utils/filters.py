@@ -0,0 +1,27 @@
+"""
+فلاتر الرسائل المشتركة
+- MenuButton: مطابقة أزرار القائمة بمفتاح الترجمة بدل قوائم النصوص بكل اللغات
+  (بحث واحد في الفهرس العكسي؛ إضافة لغة لا تتطلب تعديل أي معالج)
+"""
+
+from aiogram.filters import Filter
+from aiogram.types import Message
+
+from utils.translations import button_action
+
+
+class MenuButton(Filter):
+    """
+    يطابق الرسالة إذا كان نصها زراً من المفاتيح المحددة بأي لغة
+
+    الاستخدام:
+        @router.message(MenuButton("btn_store"))
+    """
+
+    __slots__ = ("keys",)
+
+    def __init__(self, *keys: str):
+        self.keys = frozenset(keys)
+
+    async def __call__(self, message: Message) -> bool:
+        return button_action(message.text) in self.keys
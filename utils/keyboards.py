@@ -1,9 +1,77 @@
-from aiogram.types import KeyboardButton, InlineKeyboardButton
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+
+from aiogram.types import KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from config.settings import UserRole
+from config.settings import UserRole, CATALOG_PAGE_SIZE
+
+from utils.translations import get_text, TRANSLATIONS
+from utils.money import Money
+
+# ===== ذاكرة اللوحات الجاهزة =====
+# اللوحات الثابتة تُحفظ حسب (الرتبة، اللغة) عبر lru_cache، ولوحات الكتالوج حسب
+# (نسخة الكتالوج، سعر الصرف، ...)؛ أي تعديل على الكتالوج أو السعر ينشئ نسخة جديدة فتُفرغ
+# (اللوحات المعادة مشتركة بين المستخدمين: لا تُعدل بعد الإرجاع)
+_catalog_keyboards: Dict[Tuple, InlineKeyboardMarkup] = {}
+_catalog_keyboards_version = 0
+
+
+def _catalog_keyboard(catalog, key: Tuple, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    global _catalog_keyboards_version
+    if catalog.version < _catalog_keyboards_version:
+        # معالج ما زال يحمل نسخة أقدم: تُبنى دون تخزين
+        return build()
+    if catalog.version > _catalog_keyboards_version:
+        _catalog_keyboards.clear()
+        _catalog_keyboards_version = catalog.version
+    full_key = (catalog.version, catalog.dollar_rate) + key
+    markup = _catalog_keyboards.get(full_key)
+    if markup is None:
+        markup = _catalog_keyboards[full_key] = build()
+    return markup
+
+
+def get_store_categories_keyboard(catalog, page: int = 0):
+    """لوحة أقسام المتجر من نسخة الكتالوج (مخزنة حتى تغيّر النسخة)"""
+    return _catalog_keyboard(
+        catalog, ("categories", page), lambda: get_categories_keyboard(catalog.categories, page=page)
+    )
+
+
+def get_store_products_keyboard(catalog, category_id: int, page: int = 0):
+    """لوحة منتجات القسم بالأسعار المحلية من نسخة الكتالوج"""
+    return _catalog_keyboard(
+        catalog, ("products", category_id, page),
+        lambda: get_products_keyboard(catalog.products(category_id), category_id, catalog.dollar_rate, page=page)
+    )
 
-from utils.translations import get_text
 
+def _page_slice(items, page: int, page_size: int = CATALOG_PAGE_SIZE):
+    """
+    شريحة صفحة واحدة من قائمة ثابتة (الصفحات خارج النطاق تُحصر في الحدود)
+
+    Returns:
+        (عناصر الصفحة، رقم الصفحة الفعلي، عدد الصفحات)
+    """
+    pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), pages - 1)
+    return items[page * page_size:(page + 1) * page_size], page, pages
+
+
+def _add_page_row(builder: InlineKeyboardBuilder, page: int, pages: int, callback_prefix: str):
+    """صف التنقل بين الصفحات (يُضاف فقط عند وجود أكثر من صفحة)"""
+    if pages <= 1:
+        return
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"{callback_prefix}{page - 1}"))
+    buttons.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"{callback_prefix}{page + 1}"))
+    builder.row(*buttons)
+
+
+@lru_cache(maxsize=64)
 def get_main_menu(user_role: str = UserRole.USER, lang: str = "ar"):
     builder = ReplyKeyboardBuilder()
     builder.row(
@@ -16,7 +84,7 @@ def get_main_menu(user_role: str = UserRole.USER, lang: str = "ar"):
     )
     builder.row(
         KeyboardButton(text=get_text("btn_support", lang)),
-        KeyboardButton(text="🌐 Language / اللغة")
+        KeyboardButton(text=get_text("btn_language", lang))
     )
     
     # التحقق من الرتبة لظهور لوحة التحكم
@@ -26,6 +94,7 @@ def get_main_menu(user_role: str = UserRole.USER, lang: str = "ar"):
         
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=64)
 def get_admin_main_menu(user_role: str, lang: str = "ar"):
     builder = InlineKeyboardBuilder()
     
@@ -35,6 +104,7 @@ def get_admin_main_menu(user_role: str, lang: str = "ar"):
     # إدارة المنتجات والدفع (Operator + Super Admin)
     if user_role in [UserRole.SUPER_ADMIN, UserRole.OPERATOR]:
         builder.row(InlineKeyboardButton(text=get_text("admin_products", lang), callback_data="admin_products"))
+        builder.row(InlineKeyboardButton(text="💰 طلبات الشحن", callback_data="admin_deposits"))
         builder.row(InlineKeyboardButton(text="💳 طرق الدفع", callback_data="admin_payment_methods"))
     
     # الإعدادات المتقدمة (Super Admin فقط)
@@ -50,22 +120,26 @@ def get_admin_main_menu(user_role: str, lang: str = "ar"):
         
     return builder.as_markup()
 
-def get_categories_keyboard(categories, is_admin=False):
+def get_categories_keyboard(categories, is_admin=False, page: int = 0):
     builder = InlineKeyboardBuilder()
     prefix = "admin_cat_view_" if is_admin else "cat_"
-    for cat in categories:
+    items, page, pages = _page_slice(categories, page)
+    for cat in items:
         builder.row(InlineKeyboardButton(text=cat['name'], callback_data=f"{prefix}{cat['id']}"))
+    _add_page_row(builder, page, pages, "admin_catspg_" if is_admin else "catspg_")
     if is_admin:
         builder.row(InlineKeyboardButton(text="➕ إضافة قسم", callback_data="admin_cat_add"))
         builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_main"))
     return builder.as_markup()
 
-def get_products_keyboard(products, category_id, dollar_rate, is_admin=False):
+def get_products_keyboard(products, category_id, dollar_rate, is_admin=False, page: int = 0):
     builder = InlineKeyboardBuilder()
     prefix = "admin_prod_view_" if is_admin else "prod_"
-    for prod in products:
-        local_price = prod['price_usd'] * dollar_rate
-        builder.row(InlineKeyboardButton(text=f"{prod['name']} - {local_price:,.0f} ل.س", callback_data=f"{prefix}{prod['id']}"))
+    items, page, pages = _page_slice(products, page)
+    for prod in items:
+        local_price = Money(prod['price_minor']).convert(dollar_rate)
+        builder.row(InlineKeyboardButton(text=f"{prod['name']} - {local_price}", callback_data=f"{prefix}{prod['id']}"))
+    _add_page_row(builder, page, pages, f"admin_cat_view_{category_id}_" if is_admin else f"catpg_{category_id}_")
     
     if is_admin:
         builder.row(InlineKeyboardButton(text="➕ إضافة منتج", callback_data=f"admin_prod_add_{category_id}"))
@@ -74,6 +148,14 @@ def get_products_keyboard(products, category_id, dollar_rate, is_admin=False):
         builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="back_to_categories"))
     return builder.as_markup()
 
+def get_search_results_keyboard(products, dollar_rate):
+    """نتائج البحث: زر لكل منتج يفتح تفاصيله مباشرة"""
+    builder = InlineKeyboardBuilder()
+    for prod in products:
+        local_price = Money(prod['price_minor']).convert(dollar_rate)
+        builder.row(InlineKeyboardButton(text=f"{prod['name']} - {local_price}", callback_data=f"prod_{prod['id']}"))
+    return builder.as_markup()
+
 def get_payment_methods_keyboard(methods, is_admin=False):
     builder = InlineKeyboardBuilder()
     prefix = "admin_view_pay_" if is_admin else "pay_method_"
@@ -100,6 +182,13 @@ def get_admin_order_actions(order_id: int, status: str):
     builder.row(InlineKeyboardButton(text="🔙 عودة", callback_data="admin_orders"))
     return builder.as_markup()
 
+def get_staff_closed_keyboard(label: str):
+    """زر وحيد غير فعال يحل محل أزرار رسالة طاقم لعنصر استُلم أو عولج"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=label, callback_data="staff_claimed")
+    ]])
+
+@lru_cache(maxsize=1024)
 def get_order_confirm_keyboard(product_id, lang: str = "ar"):
     builder = InlineKeyboardBuilder()
     builder.row(
@@ -0,0 +1,105 @@
+"""
+إعداد نظام التسجيل (Logging) غير الحاجب
+- QueueHandler على حلقة الأحداث: كل logger.info يضع السجل في طابور فقط
+- QueueListener في خيط منفصل يتولى الكتابة الفعلية للملف والطرفية
+- تدوير الملف حسب الحجم أو الوقت
+- خيار إخراج JSON منظم
+- أخذ عينات من رسائل DEBUG كثيفة التكرار
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config.settings import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT, LOG_ROTATE_WHEN, LOG_DEBUG_SAMPLE_RATE
+)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """تنسيق السجلات كسطر JSON واحد لكل رسالة"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    تمرير رسالة DEBUG واحدة من كل `rate` رسالة لكل logger
+    الرسائل بمستوى INFO وما فوق تمر دائماً
+    """
+    
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counters: Dict[str, int] = {}
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        return count % self.rate == 0
+
+
+def _build_file_handler() -> logging.Handler:
+    """ملف السجل مع التدوير (زمني إذا تم تحديد LOG_ROTATE_WHEN وإلا حسب الحجم)"""
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    تهيئة الـ root logger بخط أنابيب قائم على الطابور
+    
+    Returns:
+        QueueListener يجب إيقافه عند الإغلاق (listener.stop) لتفريغ الطابور
+    """
+    formatter: logging.Formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    
+    stream_handler = logging.StreamHandler(sys.stdout)
+    file_handler = _build_file_handler()
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(formatter)
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # الفلترة قبل الطابور حتى لا تكلف الرسائل المُسقطة شيئاً
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: Optional[logging.handlers.QueueListener]):
+    """إيقاف المستمع وتفريغ ما تبقى في الطابور"""
+    if listener:
+        listener.stop()
@@ -0,0 +1,123 @@
+"""
+Money - تمثيل المبالغ بعدد صحيح من السنتات
+التحسينات:
+- لا أخطاء تقريب float عند الجمع والخصم والتحويل
+- الجمع في SQL يتم على أعمدة INTEGER (*_minor)
+- التقريب نصف للأعلى عند التحويل من float أو بسعر الصرف
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Union
+
+# عدد الوحدات الصغرى في الوحدة (سنت / قرش)
+MINOR_UNITS = 100
+
+CURRENCY_USD = "USD"
+CURRENCY_SYP = "SYP"
+
+
+def _round_half_up(value: Decimal) -> int:
+    return int(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class Money:
+    """مبلغ ثابت الفاصلة: minor سنتات صحيحة + العملة (غير قابل للتعديل)"""
+
+    __slots__ = ("minor", "currency")
+
+    def __init__(self, minor: int = 0, currency: str = CURRENCY_USD):
+        object.__setattr__(self, "minor", int(minor))
+        object.__setattr__(self, "currency", currency)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable")
+
+    @classmethod
+    def of(cls, amount: Union[int, float, str, Decimal, None], currency: str = CURRENCY_USD) -> "Money":
+        """من مبلغ عشري (مثل 12.34) إلى سنتات"""
+        if amount is None:
+            return cls(0, currency)
+        return cls(_round_half_up(Decimal(str(amount)) * MINOR_UNITS), currency)
+
+    @property
+    def amount(self) -> float:
+        """القيمة العشرية للعرض والأعمدة القديمة REAL"""
+        return self.minor / MINOR_UNITS
+
+    def convert(self, rate: Union[int, float, str, Decimal], currency: str = CURRENCY_SYP) -> "Money":
+        """تحويل بسعر صرف (مثلاً دولار -> ليرة)"""
+        return Money(_round_half_up(self.minor * Decimal(str(rate))), currency)
+
+    def percent(self, pct: Union[int, float, str, Decimal]) -> "Money":
+        """نسبة مئوية من المبلغ (خصم الكوبونات)"""
+        return Money(_round_half_up(self.minor * Decimal(str(pct)) / 100), self.currency)
+
+    def _check(self, other: "Money"):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Currency mismatch: {self.currency} != {other.currency}")
+        return other
+
+    def _coerce(self, other) -> "Money":
+        """المقارنة مع رقم عادي (مثل discount == 5.0) تتم بنفس العملة"""
+        if isinstance(other, (int, float, Decimal)) and not isinstance(other, bool):
+            return Money.of(other, self.currency)
+        return self._check(other)
+
+    def __add__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.currency)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.minor == other.minor and self.currency == other.currency
+        other = self._coerce(other)
+        return NotImplemented if other is NotImplemented else self.minor == other.minor
+
+    def __hash__(self):
+        # متوافق مع المساواة مع الأرقام: Money.of(5) == 5.0
+        return hash(self.amount)
+
+    def __lt__(self, other):
+        other = self._coerce(other)
+        return NotImplemented if other is NotImplemented else self.minor < other.minor
+
+    def __le__(self, other):
+        other = self._coerce(other)
+        return NotImplemented if other is NotImplemented else self.minor <= other.minor
+
+    def __gt__(self, other):
+        other = self._coerce(other)
+        return NotImplemented if other is NotImplemented else self.minor > other.minor
+
+    def __ge__(self, other):
+        other = self._coerce(other)
+        return NotImplemented if other is NotImplemented else self.minor >= other.minor
+
+    def __bool__(self):
+        return self.minor != 0
+
+    def __format__(self, spec: str) -> str:
+        # يسمح بـ f"{money:.2f}" في رسائل العرض الحالية
+        return self.format() if not spec else format(self.amount, spec)
+
+    def format(self) -> str:
+        if self.currency == CURRENCY_SYP:
+            return f"{self.amount:,.0f} ل.س"
+        return f"{self.amount:.2f}$"
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return f"Money({self.minor}, {self.currency!r})"
@@ -1,12 +1,65 @@
 # نظام الإشعارات الموحد
+import asyncio
 import logging
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from config.settings import ADMIN_ID
+from aiogram.exceptions import (
+    TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter,
+    TelegramNetworkError, TelegramServerError
+)
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
+from config.settings import (
+    ADMIN_ID, NOTIFY_CONCURRENCY, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    NOTIFY_DIGEST_WINDOW, NOTIFY_DIGEST_MAX_LINES
+)
+from database.manager import db_manager
+from utils.keyboards import get_staff_closed_keyboard
 
 logger = logging.getLogger(__name__)
 
+# حد أقصى للإرسال المتزامن حتى لا نتجاوز قيود تيليجرام عند التوزيع على عدة مستلمين
+_send_semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+# الأخطاء المؤقتة التي تستحق إعادة المحاولة من صندوق الإرسال
+TRANSIENT_ERRORS = (TelegramRetryAfter, TelegramNetworkError, TelegramServerError)
+
+
+# أنواع التنبيهات العاجلة التي لا تنتظر نافذة التجميع
+URGENT_ALERTS = {"ERROR", "SUSPICIOUS"}
+
+# عنوان ملخص كل نوع والزر الذي يفتح الشاشة المناسبة في لوحة الإدارة
+# (الطلبات وإيصالات الشحن لا تُجمع: كل منها رسالة مستقلة بأزرار استلام عبر NotificationRouter)
+DIGEST_TYPES = {
+    "NEW_USER": ("🆕 *مستخدمون جدد*", "👥 إدارة المستخدمين", "admin_users_manage"),
+}
+
+# التنبيهات المعلقة لكل (نوع، مستلمين) حتى انتهاء النافذة
+_digest_buffers: Dict[Tuple[str, Tuple[int, ...]], dict] = {}
+
+
+def _retry_delay(error: Exception, attempts: int) -> int:
+    """مدة الانتظار قبل إعادة المحاولة: قيمة RetryAfter من تيليجرام أو تراجع أسي"""
+    if isinstance(error, TelegramRetryAfter):
+        return error.retry_after
+    return min(30 * (2 ** attempts), 3600)
+
+async def _queue_for_retry(chat_id: int, text: str, parse_mode: str, reply_markup, error: Exception,
+                           photo: str = None, track: Tuple[str, str] = None):
+    """حفظ رسالة فشلت بخطأ مؤقت في صندوق الإرسال بدلاً من فقدانها"""
+    logger.warning(f"Transient error sending to {chat_id}, queued for retry: {error}")
+    try:
+        await db_manager.enqueue_notification(
+            chat_id, text, parse_mode,
+            reply_markup.model_dump_json(exclude_none=True) if isinstance(reply_markup, InlineKeyboardMarkup) else None,
+            delay_seconds=_retry_delay(error, 0),
+            error=str(error)[:500],
+            photo=photo,
+            item_type=track[0] if track else None,
+            item_key=track[1] if track else None
+        )
+    except Exception as db_error:
+        logger.error(f"Failed to queue notification for {chat_id}: {db_error}")
+
 class NotificationManager:
     """مدير الإشعارات المركزي"""
     
@@ -26,14 +79,18 @@ class NotificationManager:
             True إذا تم الإرسال بنجاح، False إذا فشل
         """
         try:
-            await bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode=parse_mode,
-                reply_markup=reply_markup
-            )
+            async with _send_semaphore:
+                await bot.send_message(
+                    chat_id=user_id,
+                    text=message,
+                    parse_mode=parse_mode,
+                    reply_markup=reply_markup
+                )
             logger.info(f"Notification sent to user {user_id}")
             return True
+        except TRANSIENT_ERRORS as e:
+            await _queue_for_retry(user_id, message, parse_mode, reply_markup, e)
+            return False
         except TelegramForbiddenError:
             logger.warning(f"User {user_id} blocked the bot")
             return False
@@ -45,7 +102,46 @@ class NotificationManager:
             return False
     
     @staticmethod
-    async def notify_admins(bot: Bot, admin_ids: List[int], message: str, parse_mode: str = "Markdown") -> int:
+    async def send_tracked(bot: Bot, chat_id: int, text: str, parse_mode: str = "Markdown", reply_markup=None,
+                           photo: str = None, track: Tuple[str, str] = None) -> Optional[Message]:
+        """
+        إرسال رسالة (أو صورة مع تعليق) وإرجاع الرسالة المرسلة لتتبعها وتعديلها لاحقاً
+        
+        Args:
+            track: (item_type, item_key) لرسائل الطاقم؛ إذا تأخر الإرسال لصندوق الإرسال
+                   تُسجل النسخة للعنصر عند وصولها
+        
+        Returns:
+            Message إذا تم الإرسال، None إذا فشل أو أُجّل
+        """
+        try:
+            async with _send_semaphore:
+                if photo:
+                    return await bot.send_photo(chat_id, photo, caption=text, parse_mode=parse_mode, reply_markup=reply_markup)
+                return await bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+        except TRANSIENT_ERRORS as e:
+            await _queue_for_retry(chat_id, text, parse_mode, reply_markup, e, photo=photo, track=track)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to send message to {chat_id}: {e}")
+            return None
+    
+    @staticmethod
+    async def fan_out(bot: Bot, chat_ids: List[int], text: str, parse_mode: str = "Markdown", reply_markup=None,
+                      photo: str = None, track: Tuple[str, str] = None) -> List[Optional[Message]]:
+        """
+        إرسال نفس الرسالة لعدة مستلمين بشكل متزامن (محدود بالـ semaphore داخل send_tracked)
+        
+        Returns:
+            الرسائل المرسلة بترتيب المستلمين (None لمن فشل الإرسال إليه)
+        """
+        return list(await asyncio.gather(*(
+            NotificationManager.send_tracked(bot, chat_id, text, parse_mode, reply_markup, photo, track)
+            for chat_id in chat_ids
+        )))
+    
+    @staticmethod
+    async def notify_admins(bot: Bot, admin_ids: List[int], message: str, parse_mode: str = "Markdown", reply_markup=None) -> int:
         """
         إرسال إشعار لجميع الأدمن
         
@@ -54,26 +150,144 @@ class NotificationManager:
             admin_ids: قائمة معرفات الأدمن
             message: نص الرسالة
             parse_mode: نمط التنسيق
+            reply_markup: لوحة المفاتيح
         
         Returns:
             عدد الأدمن الذين تم إرسال الإشعار لهم بنجاح
         """
-        success_count = 0
-        for admin_id in admin_ids:
-            if await NotificationManager.notify_user(bot, admin_id, message, parse_mode):
-                success_count += 1
-        return success_count
+        results = await NotificationManager.fan_out(bot, admin_ids, message, parse_mode, reply_markup)
+        return sum(1 for msg in results if msg)
     
     @staticmethod
-    async def notify_order_created(bot: Bot, admin_ids: List[int], order_id: int, user_id: int, username: str, product_name: str):
-        """إشعار بإنشاء طلب جديد"""
-        message = (
-            f"🆕 *طلب جديد #{order_id}*\n\n"
-            f"👤 المستخدم: @{username} (`{user_id}`)\n"
-            f"📦 المنتج: {product_name}\n"
-            f"⏰ الوقت: الآن"
-        )
-        await NotificationManager.notify_admins(bot, admin_ids, message)
+    async def notify_admins_coalesced(bot: Bot, admin_ids: List[int], alert_type: str, message: str, summary: str, window: int = NOTIFY_DIGEST_WINDOW) -> None:
+        """
+        إرسال تنبيه للأدمن مع تجميع التنبيهات المتشابهة في رسالة ملخص واحدة
+        
+        أول تنبيه من نوعه يفتح نافذة زمنية، وما يصل خلالها يُضاف للملخص.
+        التنبيهات العاجلة أو عند تعطيل التجميع تُرسل فوراً.
+        
+        Args:
+            alert_type: نوع التنبيه (مفتاح في DIGEST_TYPES أو URGENT_ALERTS)
+            message: النص الكامل، يُرسل كما هو إذا بقي وحيداً في النافذة
+            summary: سطر مختصر يظهر في رسالة الملخص
+        """
+        if window <= 0 or alert_type in URGENT_ALERTS or alert_type not in DIGEST_TYPES:
+            await NotificationManager.notify_admins(bot, admin_ids, message)
+            return
+        
+        key = (alert_type, tuple(sorted(set(admin_ids))))
+        buffer = _digest_buffers.get(key)
+        if buffer is None:
+            buffer = _digest_buffers[key] = {"items": []}
+            buffer["task"] = asyncio.create_task(NotificationManager._flush_digest_later(bot, key, window))
+        buffer["items"].append((message, summary))
+    
+    @staticmethod
+    async def _flush_digest_later(bot: Bot, key: Tuple[str, Tuple[int, ...]], window: int):
+        await asyncio.sleep(window)
+        await NotificationManager._flush_digest(bot, key)
+    
+    @staticmethod
+    async def _flush_digest(bot: Bot, key: Tuple[str, Tuple[int, ...]]) -> int:
+        """إرسال محتوى نافذة التجميع وإفراغها"""
+        buffer = _digest_buffers.pop(key, None)
+        if not buffer or not buffer["items"]:
+            return 0
+        alert_type, admin_ids = key
+        items = buffer["items"]
+        
+        if len(items) == 1:
+            return await NotificationManager.notify_admins(bot, list(admin_ids), items[0][0])
+        
+        title, button_text, callback_data = DIGEST_TYPES[alert_type]
+        lines = [summary for _, summary in items[:NOTIFY_DIGEST_MAX_LINES]]
+        message = f"{title} ({len(items)})\n\n" + "\n".join(lines)
+        if len(items) > NOTIFY_DIGEST_MAX_LINES:
+            message += f"\n\n➕ و {len(items) - NOTIFY_DIGEST_MAX_LINES} أخرى"
+        reply_markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=button_text, callback_data=callback_data)]
+        ])
+        return await NotificationManager.notify_admins(bot, list(admin_ids), message, reply_markup=reply_markup)
+    
+    @staticmethod
+    async def flush_digests(bot: Bot) -> None:
+        """إرسال جميع الملخصات المعلقة فوراً (تُستدعى عند الإيقاف)"""
+        for key in list(_digest_buffers):
+            task = _digest_buffers[key].get("task")
+            if task and task is not asyncio.current_task():
+                task.cancel()
+            await NotificationManager._flush_digest(bot, key)
+    
+    @staticmethod
+    async def process_outbox(bot: Bot, limit: int = 50) -> int:
+        """
+        إعادة محاولة إرسال الإشعارات المستحقة من صندوق الإرسال
+        
+        Returns:
+            عدد الإشعارات التي تم إرسالها بنجاح
+        """
+        sent_count = 0
+        for item in await db_manager.get_due_notifications(limit):
+            reply_markup = InlineKeyboardMarkup.model_validate_json(item['reply_markup']) if item['reply_markup'] else None
+            try:
+                async with _send_semaphore:
+                    if item['photo']:
+                        sent = await bot.send_photo(
+                            item['chat_id'], item['photo'],
+                            caption=item['message'], parse_mode=item['parse_mode'], reply_markup=reply_markup
+                        )
+                    else:
+                        sent = await bot.send_message(
+                            chat_id=item['chat_id'],
+                            text=item['message'],
+                            parse_mode=item['parse_mode'],
+                            reply_markup=reply_markup
+                        )
+                await db_manager.mark_notification_sent(item['id'])
+                sent_count += 1
+                if item['item_type']:
+                    await NotificationManager._track_delivered(bot, item['item_type'], item['item_key'], sent)
+            except TRANSIENT_ERRORS as e:
+                give_up = item['attempts'] + 1 >= OUTBOX_MAX_ATTEMPTS
+                await db_manager.reschedule_notification(
+                    item['id'], _retry_delay(e, item['attempts']), str(e)[:500], give_up=give_up
+                )
+                if isinstance(e, TelegramRetryAfter):
+                    # تيليجرام طلب التوقف: لا داعي لمتابعة بقية الدفعة الآن
+                    break
+            except Exception as e:
+                logger.error(f"Outbox notification {item['id']} failed permanently: {e}")
+                await db_manager.reschedule_notification(item['id'], 0, str(e)[:500], give_up=True)
+        return sent_count
+    
+    @staticmethod
+    async def _track_delivered(bot: Bot, item_type: str, item_key: str, message: Message):
+        """تسجيل نسخة الطاقم التي وصلت من صندوق الإرسال ليشملها تحديث الأزرار عند الاستلام"""
+        try:
+            await db_manager.save_staff_messages(item_type, item_key, [(message.chat.id, message.message_id)])
+            # إذا استُلم العنصر قبل وصول النسخة فلن يشملها تحديث الاستلام، فنحدثها الآن
+            claim = await db_manager.get_staff_claim(item_type, item_key)
+            if claim and claim['claimed_by'] != message.chat.id:
+                await bot.edit_message_reply_markup(
+                    chat_id=message.chat.id, message_id=message.message_id,
+                    reply_markup=get_staff_closed_keyboard(f"🔒 استلمه {claim['claimed_by_name'] or claim['claimed_by']}")
+                )
+        except Exception as e:
+            logger.warning(f"Could not track delivered staff message for {item_type} {item_key}: {e}")
+    
+    @staticmethod
+    async def run_outbox_worker(bot: Bot, interval: int = OUTBOX_POLL_INTERVAL):
+        """مهمة خلفية تعيد محاولة الإشعارات الفاشلة بشكل دوري"""
+        while True:
+            try:
+                sent = await NotificationManager.process_outbox(bot)
+                if sent:
+                    logger.info(f"Outbox: {sent} queued notifications delivered")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}", exc_info=True)
+            await asyncio.sleep(interval)
     
     @staticmethod
     async def notify_order_status_change(bot: Bot, user_id: int, order_id: int, status: str, details: str = None):
@@ -118,13 +332,16 @@ class NotificationManager:
     @staticmethod
     async def notify_new_user(bot: Bot, admin_ids: List[int], user_id: int, username: str):
         """إشعار بمستخدم جديد"""
+        # "_" في المعرف يكسر تنسيق Markdown ويُسقط الملخص كاملاً
+        username = username.replace("_", "\\_")
         message = (
             f"🆕 *مستخدم جديد*\n\n"
             f"👤 @{username}\n"
             f"🆔 ID: `{user_id}`\n"
             f"⏰ الآن"
         )
-        await NotificationManager.notify_admins(bot, admin_ids, message)
+        summary = f"• @{username} (`{user_id}`)"
+        await NotificationManager.notify_admins_coalesced(bot, admin_ids, "NEW_USER", message, summary)
     
     @staticmethod
     async def notify_suspicious_activity(bot: Bot, admin_ids: List[int], user_id: int, activity: str):
@@ -135,7 +352,7 @@ class NotificationManager:
             f"النشاط: {activity}\n"
             f"⏰ الآن"
         )
-        await NotificationManager.notify_admins(bot, admin_ids, message)
+        await NotificationManager.notify_admins_coalesced(bot, admin_ids, "SUSPICIOUS", message, activity)
 
 # إنشاء instance عام
 notification_manager = NotificationManager()
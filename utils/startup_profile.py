@@ -0,0 +1,69 @@
+"""
+Startup Profile - قياس زمن بدء تشغيل البوت
+- تقرير زمن الاستيراد لكل وحدة يستوردها main.py (عبر python -X importtime)
+- قياس البدء البارد: متوسط ووسيط عدة تشغيلات لاستيراد main في عملية جديدة
+- عدد المعالجات التي تُفحص لكل callback بالتسلسل وبشجرة البادئات
+الاستخدام: python main.py --profile-startup
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_import(extra_args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *extra_args, "-c", "import main"],
+        cwd=_ROOT, capture_output=True, text=True, env=os.environ.copy()
+    )
+
+
+def import_report(top: int = 15) -> List[Tuple[str, int]]:
+    """
+    الزمن التراكمي (ميكروثانية) لكل استيراد مباشر في main.py، الأبطأ أولاً
+
+    Returns:
+        [(اسم الوحدة، الزمن التراكمي)]
+    """
+    result = _run_import(["-X", "importtime"])
+    timings: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # "import time:   self |  cumulative |   name" (مسافتان لكل مستوى تداخل)
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 1:
+            timings[name.strip()] = int(cumulative)
+    return sorted(timings.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def cold_start_benchmark(runs: int = 5) -> Dict[str, float]:
+    """زمن استيراد main في عملية جديدة (ثوانٍ): الأدنى والوسيط والأعلى"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _run_import([])
+        samples.append(time.perf_counter() - started)
+    return {"min": min(samples), "median": statistics.median(samples), "max": max(samples)}
+
+
+def format_report(phases: Dict[str, float], imports: List[Tuple[str, int]], benchmark: Dict[str, float],
+                  routing: Tuple[float, float] = None) -> str:
+    lines = ["⏱ Startup profile", "", "Phases (this process):"]
+    lines += [f"  {name:<12} {seconds * 1000:9.1f} ms" for name, seconds in phases.items()]
+    lines += ["", "Slowest imports in main.py (cumulative):"]
+    lines += [f"  {name:<40} {micros / 1000:9.1f} ms" for name, micros in imports]
+    lines += ["", "Cold start, import main (min / median / max):",
+              "  " + " / ".join(f"{benchmark[key]:.3f}s" for key in ("min", "median", "max"))]
+    if routing:
+        lines += ["", "Callback routing, handlers checked per callback (chain -> prefix trie):",
+                  f"  {routing[0]:.1f} -> {routing[1]:.1f}"]
+    return "\n".join(lines)
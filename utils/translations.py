@@ -1,6 +1,9 @@
 # نظام الترجمة المتعدد اللغات
 # يدعم العربية والإنجليزية
 
+from string import Formatter
+from typing import Dict, FrozenSet, Optional, Tuple
+
 TRANSLATIONS = {
     # رسائل عامة
     "welcome": {
@@ -41,6 +44,10 @@ TRANSLATIONS = {
         "ar": "⚙️ لوحة التحكم",
         "en": "⚙️ Admin Panel"
     },
+    "btn_language": {
+        "ar": "🌐 Language / اللغة",
+        "en": "🌐 Language / اللغة"
+    },
     
     # لوحة الأدمن
     "admin_panel_title": {
@@ -299,26 +306,76 @@ TRANSLATIONS = {
         "ar": "⏮ السابق",
         "en": "⏮ Previous"
     },
+    
+    # البحث عن المنتجات
+    "product_search_prompt": {
+        "ar": "🔍 أرسل اسم المنتج أو جزءاً منه للبحث:",
+        "en": "🔍 Send a product name (or part of it) to search:"
+    },
+    "product_search_results": {
+        "ar": "🔍 نتائج البحث عن «{query}»:",
+        "en": "🔍 Results for “{query}”:"
+    },
+    "product_search_empty": {
+        "ar": "❌ لا توجد منتجات تطابق «{query}».",
+        "en": "❌ No products match “{query}”."
+    },
+}
+
+# ===== الفهرس المترجم (يُبنى مرة واحدة عند الاستيراد) =====
+# كل مفتاح له رقم ثابت، ولكل لغة صف مسطح بنفس الترتيب: get_text = فهرسة مباشرة.
+# القوالب تُحلل مسبقاً لمعرفة متغيراتها، فلا يُستدعى format إلا عند توفرها كلها
+# (نفس نتيجة format مع تجاهل KeyError سابقاً، بدون استثناء لكل استدعاء).
+
+DEFAULT_LANGUAGE = "ar"
+
+LANGUAGES: Tuple[str, ...] = tuple(dict.fromkeys(lang for texts in TRANSLATIONS.values() for lang in texts))
+
+TEXT_KEYS: Dict[str, int] = {key: index for index, key in enumerate(TRANSLATIONS)}
+
+_NO_FIELDS: FrozenSet[str] = frozenset()
+
+
+def _compile(text: str) -> Tuple[str, FrozenSet[str]]:
+    fields = frozenset(field for _, field, _, _ in Formatter().parse(text) if field)
+    return text, fields
+
+
+_CATALOG: Dict[str, Tuple[Tuple[str, FrozenSet[str]], ...]] = {
+    lang: tuple(
+        _compile(texts[lang]) if lang in texts else (key, _NO_FIELDS)
+        for key, texts in TRANSLATIONS.items()
+    )
+    for lang in LANGUAGES
+}
+
+# النص المعروض لأي زر (بأي لغة) -> مفتاحه؛ أساس فلتر MenuButton
+BUTTON_ACTIONS: Dict[str, str] = {
+    texts[lang]: key
+    for key, texts in TRANSLATIONS.items() if key.startswith("btn_")
+    for lang in texts
 }
 
+
 def get_text(key: str, lang: str = None, **kwargs) -> str:
     """
     الحصول على النص المترجم
     """
-    if not lang:
-        lang = "ar"  # اللغة الافتراضية للرسائل العامة
-    
-    text = TRANSLATIONS.get(key, {}).get(lang, key)
-    
-    # تنسيق النص بالمتغيرات
-    if kwargs:
-        try:
-            text = text.format(**kwargs)
-        except KeyError:
-            pass
-    
+    try:
+        text, fields = _CATALOG[lang or DEFAULT_LANGUAGE][TEXT_KEYS[key]]
+    except KeyError:
+        # مفتاح أو لغة غير معروفة
+        return key
+    # تنسيق النص بالمتغيرات (يبقى كما هو إذا نقص أحدها)
+    if kwargs and fields and fields <= kwargs.keys():
+        return text.format_map(kwargs)
     return text
 
+
+def button_action(text: Optional[str]) -> Optional[str]:
+    """مفتاح الزر الذي يطابق النص المعروض (أي لغة) أو None"""
+    return BUTTON_ACTIONS.get(text) if text else None
+
 def get_user_language(user_data: dict) -> str:
     """
     الحصول على لغة المستخدم من بياناته